@@ -8,6 +8,9 @@
 #include <vtkCellArray.h>
 #include <vtkNew.h>
 
+#include <algorithm>
+#include <limits>
+
 #include <multisense_utils/multisense_utils.hpp>
 
 //-----------------------------------------------------------------------------
@@ -15,6 +18,10 @@ ddBotImageQueue::ddBotImageQueue(QObject* parent) : QObject(parent)
 {
   mBotParam = 0;
   mBotFrames = 0;
+  mTransformInterpolationInterval = 10000;
+  mTransformCache.setMaxCost(256);
+  mTransformCacheHits = 0;
+  mTransformCacheMisses = 0;
 }
 
 //-----------------------------------------------------------------------------
@@ -164,16 +171,7 @@ int ddBotImageQueue::getTransform(const QString& fromFrame, const QString& toFra
     return 0;
     }
 
-  vtkSmartPointer<vtkMatrix4x4> vtkmat = vtkSmartPointer<vtkMatrix4x4>::New();
-  for (int i = 0; i < 4; ++i)
-  {
-    for (int j = 0; j < 4; ++j)
-    {
-      vtkmat->SetElement(i, j, matx[i*4+j]);
-    }
-  }
-
-  transform->SetMatrix(vtkmat);
+  transform->SetMatrix(matx);
   return status;
 }
 
@@ -192,16 +190,7 @@ int ddBotImageQueue::getTransform(const QString& fromFrame, const QString& toFra
     return 0;
     }
 
-  vtkSmartPointer<vtkMatrix4x4> vtkmat = vtkSmartPointer<vtkMatrix4x4>::New();
-  for (int i = 0; i < 4; ++i)
-  {
-    for (int j = 0; j < 4; ++j)
-    {
-      vtkmat->SetElement(i, j, matx[i*4+j]);
-    }
-  }
-
-  transform->SetMatrix(vtkmat);
+  transform->SetMatrix(matx);
   return status;
 }
 
@@ -224,6 +213,174 @@ int ddBotImageQueue::getTransform(std::string from_frame, std::string to_frame,
   return status;
 }
 
+//-----------------------------------------------------------------------------
+void ddBotImageQueue::setTransformInterpolationInterval(qint64 interval)
+{
+  QMutexLocker locker(&mTransformCacheMutex);
+  mTransformInterpolationInterval = interval;
+}
+
+//-----------------------------------------------------------------------------
+qint64 ddBotImageQueue::transformInterpolationInterval() const
+{
+  QMutexLocker locker(&mTransformCacheMutex);
+  return mTransformInterpolationInterval;
+}
+
+//-----------------------------------------------------------------------------
+void ddBotImageQueue::setTransformCacheSize(int size)
+{
+  QMutexLocker locker(&mTransformCacheMutex);
+  mTransformCache.setMaxCost(size);
+}
+
+//-----------------------------------------------------------------------------
+void ddBotImageQueue::clearTransformCache()
+{
+  QMutexLocker locker(&mTransformCacheMutex);
+  mTransformCache.clear();
+  mTransformCacheHits = 0;
+  mTransformCacheMisses = 0;
+}
+
+//-----------------------------------------------------------------------------
+QList<double> ddBotImageQueue::getTransformCacheStatistics() const
+{
+  QMutexLocker locker(&mTransformCacheMutex);
+  QList<double> values;
+  values << mTransformCacheHits << mTransformCacheMisses << mTransformCache.size();
+  return values;
+}
+
+//-----------------------------------------------------------------------------
+bool ddBotImageQueue::getCachedTransform(const std::string& fromFrame, const std::string& toFrame, qint64 utime, double matx[16])
+{
+  const QString key = QString("%1:%2:%3").arg(fromFrame.c_str()).arg(toFrame.c_str()).arg(utime);
+
+  {
+    QMutexLocker locker(&mTransformCacheMutex);
+    CachedTransform* cached = mTransformCache.object(key);
+    if (cached)
+    {
+      std::copy(cached->Matrix, cached->Matrix + 16, matx);
+      ++mTransformCacheHits;
+      return true;
+    }
+    ++mTransformCacheMisses;
+  }
+
+  if (!mBotFrames || !bot_frames_get_trans_mat_4x4_with_utime(mBotFrames, fromFrame.c_str(), toFrame.c_str(), utime, matx))
+  {
+    return false;
+  }
+
+  // bot frames answers utimes past the most recent update with the latest
+  // transform, only cache results that later updates can no longer change
+  int64_t latestUtime = 0;
+  if (bot_frames_get_trans_latest_timestamp(mBotFrames, fromFrame.c_str(), toFrame.c_str(), &latestUtime)
+      && utime <= latestUtime)
+  {
+    CachedTransform* cached = new CachedTransform;
+    std::copy(matx, matx + 16, cached->Matrix);
+
+    QMutexLocker locker(&mTransformCacheMutex);
+    mTransformCache.insert(key, cached);
+  }
+
+  return true;
+}
+
+//-----------------------------------------------------------------------------
+bool ddBotImageQueue::getInterpolatedTransform(const std::string& fromFrame, const std::string& toFrame, qint64 utime, double matx[16])
+{
+  const qint64 interval = this->transformInterpolationInterval();
+  if (interval <= 0)
+  {
+    return this->getCachedTransform(fromFrame, toFrame, utime, matx);
+  }
+
+  qint64 startUtime = (utime / interval) * interval;
+  if (startUtime > utime)
+  {
+    startUtime -= interval;
+  }
+
+  if (startUtime == utime)
+  {
+    return this->getCachedTransform(fromFrame, toFrame, utime, matx);
+  }
+
+  double startMatx[16];
+  double endMatx[16];
+  if (!this->getCachedTransform(fromFrame, toFrame, startUtime, startMatx)
+      || !this->getCachedTransform(fromFrame, toFrame, startUtime + interval, endMatx))
+  {
+    return this->getCachedTransform(fromFrame, toFrame, utime, matx);
+  }
+
+  const double weight = static_cast<double>(utime - startUtime) / interval;
+
+  Eigen::Matrix4d startMat = Eigen::Map<Eigen::Matrix<double, 4, 4, Eigen::RowMajor> >(startMatx);
+  Eigen::Matrix4d endMat = Eigen::Map<Eigen::Matrix<double, 4, 4, Eigen::RowMajor> >(endMatx);
+
+  Eigen::Quaterniond startRotation(startMat.block<3,3>(0,0));
+  Eigen::Quaterniond endRotation(endMat.block<3,3>(0,0));
+
+  Eigen::Matrix<double, 4, 4, Eigen::RowMajor> result = Eigen::Matrix<double, 4, 4, Eigen::RowMajor>::Identity();
+  result.block<3,3>(0,0) = startRotation.slerp(weight, endRotation).toRotationMatrix();
+  result.block<3,1>(0,3) = (1.0 - weight)*startMat.block<3,1>(0,3) + weight*endMat.block<3,1>(0,3);
+
+  std::copy(result.data(), result.data() + 16, matx);
+  return true;
+}
+
+//-----------------------------------------------------------------------------
+QByteArray ddBotImageQueue::getTransforms(const QStringList& fromFrames, const QStringList& toFrames, const QByteArray& utimes, bool interpolate)
+{
+  const int count = utimes.size() / sizeof(qint64);
+
+  if (fromFrames.isEmpty() || toFrames.isEmpty()
+      || (fromFrames.size() != 1 && fromFrames.size() != count)
+      || (toFrames.size() != 1 && toFrames.size() != count))
+  {
+    printf("getTransforms: expected one frame name or %d frame names\n", count);
+    return QByteArray();
+  }
+
+  std::vector<std::string> fromNames;
+  std::vector<std::string> toNames;
+  foreach (const QString& name, fromFrames)
+  {
+    fromNames.push_back(name.toAscii().data());
+  }
+  foreach (const QString& name, toFrames)
+  {
+    toNames.push_back(name.toAscii().data());
+  }
+
+  QByteArray result(count*16*sizeof(double), 0);
+  double* matrices = reinterpret_cast<double*>(result.data());
+  const qint64* utimeValues = reinterpret_cast<const qint64*>(utimes.constData());
+
+  for (int i = 0; i < count; ++i)
+  {
+    const std::string& fromFrame = fromNames[fromNames.size() == 1 ? 0 : i];
+    const std::string& toFrame = toNames[toNames.size() == 1 ? 0 : i];
+    double* matx = matrices + i*16;
+
+    const bool status = interpolate
+      ? this->getInterpolatedTransform(fromFrame, toFrame, utimeValues[i], matx)
+      : this->getCachedTransform(fromFrame, toFrame, utimeValues[i], matx);
+
+    if (!status)
+    {
+      std::fill(matx, matx + 16, std::numeric_limits<double>::quiet_NaN());
+    }
+  }
+
+  return result;
+}
+
 //-----------------------------------------------------------------------------
 qint64 ddBotImageQueue::getImage(const QString& cameraName, vtkImageData* image)
 {
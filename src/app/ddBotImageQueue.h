@@ -2,6 +2,7 @@
 #define __ddBotImageQueue_h
 
 #include <QObject>
+#include <QCache>
 #include <ddMacros.h>
 
 #include "ddLCMThread.h"
@@ -121,6 +122,26 @@ public:
   int getTransform(const QString& fromFrame, const QString& toFrame, qint64 utime, vtkTransform* transform);
   int getTransform(const QString& fromFrame, const QString& toFrame, vtkTransform* transform);
 
+  // Evaluates many transforms in one call.  utimes is a packed array of
+  // int64 utimes.  fromFrames and toFrames hold either a single frame name
+  // or one frame name per utime.  Returns a packed array of float64 4x4
+  // row major matrices, one per utime, where a transform that is not
+  // available is filled with NaN.  With interpolate the chains are only
+  // evaluated on a grid of utimes spaced by the interpolation interval and
+  // each result is interpolated between the two bracketing grid samples,
+  // which is much cheaper for many nearby utimes such as the scan lines of
+  // one sweep.  Evaluated chains are kept in an LRU cache.
+  QByteArray getTransforms(const QStringList& fromFrames, const QStringList& toFrames, const QByteArray& utimes, bool interpolate);
+
+  void setTransformInterpolationInterval(qint64 interval);
+  qint64 transformInterpolationInterval() const;
+
+  void setTransformCacheSize(int size);
+  void clearTransformCache();
+
+  // Returns hits, misses and the number of cached transforms.
+  QList<double> getTransformCacheStatistics() const;
+
   QStringList getBotFrameNames() const;
 
 protected slots:
@@ -144,6 +165,14 @@ protected:
   int getTransform(std::string from_frame, std::string to_frame,
                      Eigen::Isometry3d& mat, qint64 utime);
 
+  struct CachedTransform
+  {
+    double Matrix[16];
+  };
+
+  bool getCachedTransform(const std::string& fromFrame, const std::string& toFrame, qint64 utime, double matx[16]);
+  bool getInterpolatedTransform(const std::string& fromFrame, const std::string& toFrame, qint64 utime, double matx[16]);
+
   BotParam* mBotParam;
   BotFrames* mBotFrames;
 
@@ -152,6 +181,12 @@ protected:
   QMap<QString, bot_core::images_t> mImagesMessageMap;
   QMap<QString, ddLCMSubscriber*> mSubscribers;
   QMap<QString, CameraData*> mCameraData;
+
+  qint64 mTransformInterpolationInterval;
+  QCache<QString, CachedTransform> mTransformCache;
+  qint64 mTransformCacheHits;
+  qint64 mTransformCacheMisses;
+  mutable QMutex mTransformCacheMutex;
 };
 
 #endif
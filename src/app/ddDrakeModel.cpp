@@ -59,6 +59,28 @@ using std::istringstream;
   #define AddInputData(filter, obj) filter->AddInput(obj);
 #endif
 
+// Geometry of one mesh file or primitive shape.  The normals, mapper and
+// texture are created once and shared by the visuals of every ddDrakeModel
+// that uses the same mesh, so additional models only add actors.
+class ddMeshGeometry
+{
+ public:
+
+  ddPtrMacro(ddMeshGeometry);
+  ddMeshGeometry()
+  {
+
+  }
+
+  vtkSmartPointer<vtkPolyData> PolyData;
+  vtkSmartPointer<vtkPolyDataMapper> Mapper;
+  vtkSmartPointer<vtkTexture> Texture;
+
+private:
+
+  Q_DISABLE_COPY(ddMeshGeometry);
+};
+
 class ddMeshVisual
 {
  public:
@@ -345,10 +367,37 @@ vtkSmartPointer<vtkTexture> getTextureForMesh(vtkSmartPointer<vtkPolyData> polyD
   return texture;
 }
 
-ddMeshVisual::Ptr visualFromPolyData(vtkSmartPointer<vtkPolyData> polyData)
+namespace {
+
+typedef std::map<std::string, std::vector<ddMeshGeometry::Ptr> > GeometryMapType;
+GeometryMapType GeometryMap;
+
+}
+
+ddMeshGeometry::Ptr geometryFromPolyData(vtkSmartPointer<vtkPolyData> polyData)
+{
+  ddMeshGeometry::Ptr geometry(new ddMeshGeometry);
+  geometry->PolyData = computeNormals(polyData);
+  geometry->Mapper = vtkSmartPointer<vtkPolyDataMapper>::New();
+  SetInputData(geometry->Mapper, geometry->PolyData);
+  return geometry;
+}
+
+ddMeshGeometry::Ptr findPrimitiveGeometry(const std::string& key)
+{
+  GeometryMapType::const_iterator itr = GeometryMap.find(key);
+  if (itr != GeometryMap.end() && itr->second.size())
+  {
+    return itr->second[0];
+  }
+  return ddMeshGeometry::Ptr();
+}
+
+ddMeshVisual::Ptr visualFromGeometry(ddMeshGeometry::Ptr geometry)
 {
   ddMeshVisual::Ptr visual(new ddMeshVisual);
-  visual->PolyData = computeNormals(polyData);
+  visual->PolyData = geometry->PolyData;
+  visual->Texture = geometry->Texture;
   visual->Actor = vtkSmartPointer<vtkActor>::New();
   visual->Transform = vtkSmartPointer<vtkTransform>::New();
   visual->Actor->SetUserTransform(visual->Transform);
@@ -356,9 +405,7 @@ ddMeshVisual::Ptr visualFromPolyData(vtkSmartPointer<vtkPolyData> polyData)
   visual->Actor->GetProperty()->SetSpecular(0.9);
   visual->Actor->GetProperty()->SetSpecularPower(20);
   visual->Actor->GetProperty()->SetColor(GRAY_DEFAULT/255.0, GRAY_DEFAULT/255.0, GRAY_DEFAULT/255.0);
-  vtkSmartPointer<vtkPolyDataMapper> mapper = vtkSmartPointer<vtkPolyDataMapper>::New();
-  SetInputData(mapper, visual->PolyData);
-  visual->Actor->SetMapper(mapper);
+  visual->Actor->SetMapper(geometry->Mapper);
 
   bool useShadows = false;
   if (useShadows)
@@ -374,7 +421,7 @@ ddMeshVisual::Ptr visualFromPolyData(vtkSmartPointer<vtkPolyData> polyData)
     shadowT->Concatenate(visual->Transform);
 
     visual->ShadowActor = vtkSmartPointer<vtkActor>::New();
-    visual->ShadowActor->SetMapper(mapper);
+    visual->ShadowActor->SetMapper(geometry->Mapper);
     visual->ShadowActor->SetUserTransform(shadowT);
     visual->ShadowActor->GetProperty()->LightingOff();
     visual->ShadowActor->GetProperty()->SetColor(0, 0, 0);
@@ -383,41 +430,83 @@ ddMeshVisual::Ptr visualFromPolyData(vtkSmartPointer<vtkPolyData> polyData)
   return visual;
 }
 
+ddMeshVisual::Ptr visualFromPrimitive(const std::string& key, vtkSmartPointer<vtkPolyData> polyData)
+{
+  ddMeshGeometry::Ptr geometry = findPrimitiveGeometry(key);
+  if (!geometry)
+  {
+    geometry = geometryFromPolyData(polyData);
+    GeometryMap[key].push_back(geometry);
+  }
+  return visualFromGeometry(geometry);
+}
+
 std::vector<ddMeshVisual::Ptr> loadMeshVisuals(const std::string& filename)
 {
   std::vector<ddMeshVisual::Ptr> visuals;
 
-  std::vector<vtkSmartPointer<vtkPolyData> > polyDataList = loadPolyData(filename);
-
-  for (size_t i = 0; i < polyDataList.size(); ++i)
+  GeometryMapType::const_iterator itr = GeometryMap.find(filename);
+  if (itr == GeometryMap.end())
   {
-    ddMeshVisual::Ptr visual = visualFromPolyData(polyDataList[i]);
-    if (!visual)
+    std::vector<ddMeshGeometry::Ptr> geometries;
+    std::vector<vtkSmartPointer<vtkPolyData> > polyDataList = loadPolyData(filename);
+
+    for (size_t i = 0; i < polyDataList.size(); ++i)
     {
-      continue;
+      ddMeshGeometry::Ptr geometry = geometryFromPolyData(polyDataList[i]);
+      geometry->Texture = getTextureForMesh(polyDataList[i], filename);
+      geometries.push_back(geometry);
     }
 
-    visual->Texture = getTextureForMesh(polyDataList[i], filename);
-    //visual->Actor->SetTexture(visual->Texture);
-    visuals.push_back(visual);
+    if (geometries.empty())
+    {
+      return visuals;
+    }
+
+    itr = GeometryMap.insert(std::make_pair(filename, geometries)).first;
+  }
+
+  for (size_t i = 0; i < itr->second.size(); ++i)
+  {
+    visuals.push_back(visualFromGeometry(itr->second[i]));
   }
 
   return visuals;
 }
 
+std::string primitiveKey(const std::string& shape, double a, double b=0.0, double c=0.0)
+{
+  std::ostringstream key;
+  key.precision(17);
+  key << "<" << shape << " " << a << " " << b << " " << c << ">";
+  return key.str();
+}
+
 ddMeshVisual::Ptr makeSphereVisual(double radius)
 {
+  const std::string key = primitiveKey("sphere", radius);
+  if (ddMeshGeometry::Ptr geometry = findPrimitiveGeometry(key))
+  {
+    return visualFromGeometry(geometry);
+  }
+
   vtkSmartPointer<vtkSphereSource> sphere = vtkSmartPointer<vtkSphereSource>::New();
   sphere->SetPhiResolution(24);
   sphere->SetThetaResolution(24);
   sphere->SetRadius(radius);
   sphere->Update();
 
-  return visualFromPolyData(shallowCopy(sphere->GetOutput()));
+  return visualFromPrimitive(key, shallowCopy(sphere->GetOutput()));
 }
 
 ddMeshVisual::Ptr makeCylinderVisual(double radius, double length)
 {
+  const std::string key = primitiveKey("cylinder", radius, length);
+  if (ddMeshGeometry::Ptr geometry = findPrimitiveGeometry(key))
+  {
+    return visualFromGeometry(geometry);
+  }
+
   vtkSmartPointer<vtkCylinderSource> cylinder = vtkSmartPointer<vtkCylinderSource>::New();
   cylinder->SetHeight(length);
   cylinder->SetRadius(radius);
@@ -426,17 +515,23 @@ ddMeshVisual::Ptr makeCylinderVisual(double radius, double length)
 
   vtkSmartPointer<vtkTransform> transform = vtkSmartPointer<vtkTransform>::New();
   transform->RotateX(90);
-  return visualFromPolyData(transformPolyData(cylinder->GetOutput(), transform));
+  return visualFromPrimitive(key, transformPolyData(cylinder->GetOutput(), transform));
 }
 
 ddMeshVisual::Ptr makeBoxVisual(double x, double y, double z)
 {
+  const std::string key = primitiveKey("box", x, y, z);
+  if (ddMeshGeometry::Ptr geometry = findPrimitiveGeometry(key))
+  {
+    return visualFromGeometry(geometry);
+  }
+
   vtkSmartPointer<vtkCubeSource> cube = vtkSmartPointer<vtkCubeSource>::New();
   cube->SetXLength(x);
   cube->SetYLength(y);
   cube->SetZLength(z);
   cube->Update();
-  return visualFromPolyData(shallowCopy(cube->GetOutput()));
+  return visualFromPrimitive(key, shallowCopy(cube->GetOutput()));
 }
 
 class URDFRigidBodyManipulatorVTK : public RigidBodyManipulator
@@ -1162,6 +1257,32 @@ QString ddDrakeModel::getLinkNameForMesh(vtkPolyData* polyData)
 }
 
 
+//-----------------------------------------------------------------------------
+QString ddDrakeModel::getLinkNameForActor(vtkProp* prop)
+{
+  std::vector<ddMeshVisual::Ptr> visuals = this->Internal->Model->meshVisuals();
+  for (size_t i = 0; i < visuals.size(); ++i)
+  {
+    if (visuals[i]->Actor.GetPointer() == prop || (visuals[i]->ShadowActor && visuals[i]->ShadowActor.GetPointer() == prop))
+    {
+      return visuals[i]->Name.c_str();
+    }
+  }
+  return QString();
+}
+
+//-----------------------------------------------------------------------------
+void ddDrakeModel::clearGeometryCache()
+{
+  GeometryMap.clear();
+}
+
+//-----------------------------------------------------------------------------
+int ddDrakeModel::geometryCacheSize()
+{
+  return GeometryMap.size();
+}
+
 //-----------------------------------------------------------------------------
 bool ddDrakeModel::loadFromFile(const QString& filename)
 {
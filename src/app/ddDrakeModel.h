@@ -11,6 +11,7 @@
 class vtkRenderer;
 class vtkTransform;
 class vtkPolyData;
+class vtkProp;
 class RigidBodyManipulator;
 
 class DD_APP_EXPORT ddDrakeModel : public QObject
@@ -47,7 +48,11 @@ public:
 
   void getModelMesh(vtkPolyData* polyData);
 
+  // Link geometry is shared between models that load the same meshes, and
+  // between links of one model that use the same mesh, so a mesh may belong
+  // to several links.  getLinkNameForActor is unambiguous.
   QString getLinkNameForMesh(vtkPolyData* polyData);
+  QString getLinkNameForActor(vtkProp* prop);
 
   void setAlpha(double alpha);
   double alpha() const;
@@ -67,6 +72,11 @@ public:
   static void addPackageSearchPath(const QString& searchPath);
   static QString findPackageDirectory(const QString& packageName);
 
+  // Link meshes and primitives are loaded once per process and shared by
+  // all models.  Clearing the cache only affects models loaded afterwards.
+  static void clearGeometryCache();
+  static int geometryCacheSize();
+
 signals:
 
   void modelChanged();
@@ -0,0 +1,239 @@
+#include "ddLCMDispatchGroup.h"
+
+#include "ddLCMSubscriber.h"
+
+#include <QDateTime>
+
+#include <algorithm>
+
+#ifndef _WIN32
+  #include <sys/time.h>
+#endif
+
+namespace
+{
+  // Weight of a new sample in the latency and handler time moving averages
+  const double StatisticsAlpha = 1.0 / 16.0;
+}
+
+//-----------------------------------------------------------------------------
+ddLCMDispatchGroup::ddLCMDispatchGroup(const QString& name, int queueCapacity, QObject* parent) : QThread(parent)
+{
+  mName = name;
+  mQueueCapacity = std::max(queueCapacity, 0);
+  mShouldStop = false;
+  mCurrentSubscriber = 0;
+  this->resetStatistics();
+
+  if (!this->isInline())
+  {
+    this->start();
+  }
+}
+
+//-----------------------------------------------------------------------------
+ddLCMDispatchGroup::~ddLCMDispatchGroup()
+{
+  this->stop();
+}
+
+//-----------------------------------------------------------------------------
+qint64 ddLCMDispatchGroup::currentUtime()
+{
+#ifdef _WIN32
+  return QDateTime::currentMSecsSinceEpoch() * 1000;
+#else
+  // same clock as lcm::ReceiveBuffer::recv_utime
+  timeval tv;
+  gettimeofday(&tv, NULL);
+  return static_cast<qint64>(tv.tv_sec) * 1000000 + tv.tv_usec;
+#endif
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::addChannelPattern(const QString& pattern)
+{
+  QMutexLocker locker(&mMutex);
+  mChannelPatterns.append(QRegExp(pattern));
+}
+
+//-----------------------------------------------------------------------------
+bool ddLCMDispatchGroup::matchesChannel(const QString& channel) const
+{
+  QMutexLocker locker(&mMutex);
+  foreach (const QRegExp& pattern, mChannelPatterns)
+  {
+    if (pattern.exactMatch(channel))
+    {
+      return true;
+    }
+  }
+  return false;
+}
+
+//-----------------------------------------------------------------------------
+QStringList ddLCMDispatchGroup::channelPatterns() const
+{
+  QMutexLocker locker(&mMutex);
+  QStringList patterns;
+  foreach (const QRegExp& pattern, mChannelPatterns)
+  {
+    patterns << pattern.pattern();
+  }
+  return patterns;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::dispatch(ddLCMSubscriber* subscriber, const QByteArray& messageData, const QString& channel, qint64 receiveUtime)
+{
+  QueuedMessage message;
+  message.Subscriber = subscriber;
+  message.Data = messageData;
+  message.Channel = channel;
+  message.ReceiveUtime = receiveUtime;
+
+  if (this->isInline())
+  {
+    this->handleMessage(message);
+    return;
+  }
+
+  QMutexLocker locker(&mMutex);
+
+  if (static_cast<int>(mQueue.size()) >= mQueueCapacity)
+  {
+    mQueue.pop_front();
+    QMutexLocker statisticsLocker(&mStatisticsMutex);
+    ++mDroppedCount;
+  }
+
+  mQueue.push_back(message);
+  mQueueCondition.wakeOne();
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::removeSubscriber(ddLCMSubscriber* subscriber)
+{
+  QMutexLocker locker(&mMutex);
+
+  std::deque<QueuedMessage>::iterator itr = mQueue.begin();
+  while (itr != mQueue.end())
+  {
+    if (itr->Subscriber == subscriber)
+    {
+      itr = mQueue.erase(itr);
+    }
+    else
+    {
+      ++itr;
+    }
+  }
+
+  while (mCurrentSubscriber == subscriber)
+  {
+    mIdleCondition.wait(&mMutex);
+  }
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::handleMessage(const QueuedMessage& message)
+{
+  const qint64 startUtime = currentUtime();
+  message.Subscriber->handleMessage(message.Data, message.Channel, message.ReceiveUtime);
+  const qint64 endUtime = currentUtime();
+
+  const double latency = std::max(startUtime - message.ReceiveUtime, qint64(0)) * 1e-6;
+  const double handlerTime = (endUtime - startUtime) * 1e-6;
+
+  QMutexLocker locker(&mStatisticsMutex);
+
+  if (mMessageCount)
+  {
+    mMeanLatency += StatisticsAlpha * (latency - mMeanLatency);
+    mMeanHandlerTime += StatisticsAlpha * (handlerTime - mMeanHandlerTime);
+  }
+  else
+  {
+    mMeanLatency = latency;
+    mMeanHandlerTime = handlerTime;
+  }
+
+  mMaxLatency = std::max(mMaxLatency, latency);
+  mMaxHandlerTime = std::max(mMaxHandlerTime, handlerTime);
+  ++mMessageCount;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::run()
+{
+  QMutexLocker locker(&mMutex);
+
+  while (!mShouldStop)
+  {
+    if (mQueue.empty())
+    {
+      mQueueCondition.wait(&mMutex);
+      continue;
+    }
+
+    QueuedMessage message = mQueue.front();
+    mQueue.pop_front();
+    mCurrentSubscriber = message.Subscriber;
+
+    locker.unlock();
+    this->handleMessage(message);
+    locker.relock();
+
+    mCurrentSubscriber = 0;
+    mIdleCondition.wakeAll();
+  }
+}
+
+//-----------------------------------------------------------------------------
+QList<double> ddLCMDispatchGroup::statistics() const
+{
+  QList<double> values;
+  for (int i = 0; i < NumberOfFields; ++i)
+  {
+    values << 0.0;
+  }
+
+  {
+    QMutexLocker locker(&mMutex);
+    values[QueueLength] = mQueue.size();
+  }
+
+  QMutexLocker locker(&mStatisticsMutex);
+  values[QueueCapacity] = mQueueCapacity;
+  values[MessageCount] = mMessageCount;
+  values[DroppedCount] = mDroppedCount;
+  values[MeanLatency] = mMeanLatency;
+  values[MaxLatency] = mMaxLatency;
+  values[MeanHandlerTime] = mMeanHandlerTime;
+  values[MaxHandlerTime] = mMaxHandlerTime;
+  return values;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::resetStatistics()
+{
+  QMutexLocker locker(&mStatisticsMutex);
+  mMessageCount = 0;
+  mDroppedCount = 0;
+  mMeanLatency = 0.0;
+  mMaxLatency = 0.0;
+  mMeanHandlerTime = 0.0;
+  mMaxHandlerTime = 0.0;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMDispatchGroup::stop()
+{
+  {
+    QMutexLocker locker(&mMutex);
+    mShouldStop = true;
+    mQueue.clear();
+    mQueueCondition.wakeAll();
+  }
+  this->wait();
+}
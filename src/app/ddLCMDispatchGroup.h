@@ -0,0 +1,112 @@
+#ifndef __ddLCMDispatchGroup_h
+#define __ddLCMDispatchGroup_h
+
+#include <QThread>
+#include <QMutex>
+#include <QWaitCondition>
+#include <QByteArray>
+#include <QRegExp>
+#include <QStringList>
+#include <QList>
+
+#include <deque>
+
+#include "ddAppConfigure.h"
+
+
+class ddLCMSubscriber;
+
+// A dispatch group runs the message handlers of the subscribers whose
+// channels are assigned to it.  The default group of a ddLCMThread handles
+// messages inline on the LCM receive thread.  Every other group owns a worker
+// thread and a bounded queue, so a slow handler only delays the channels of
+// its own group.  When the queue is full the oldest message is dropped.
+// Latency is measured from the LCM receive time to the start of the handler,
+// which includes any time the message spent waiting behind other handlers.
+
+class DD_APP_EXPORT ddLCMDispatchGroup : public QThread
+ {
+  Q_OBJECT
+
+public:
+
+  // Layout of the list returned by statistics()
+  enum StatisticsField
+  {
+    QueueLength = 0,    // messages waiting to be handled
+    QueueCapacity,      // maximum queue length, 0 for inline groups
+    MessageCount,       // messages handled since reset
+    DroppedCount,       // messages dropped from a full queue since reset
+    MeanLatency,        // seconds, moving average of receive to handler start
+    MaxLatency,         // seconds, since reset
+    MeanHandlerTime,    // seconds, moving average of handler duration
+    MaxHandlerTime,     // seconds, since reset
+    NumberOfFields
+  };
+
+  ddLCMDispatchGroup(const QString& name, int queueCapacity, QObject* parent=NULL);
+  virtual ~ddLCMDispatchGroup();
+
+  const QString& name() const
+  {
+    return mName;
+  }
+
+  bool isInline() const
+  {
+    return mQueueCapacity == 0;
+  }
+
+  // Channel patterns are regular expressions that must match the whole channel name.
+  void addChannelPattern(const QString& pattern);
+  bool matchesChannel(const QString& channel) const;
+  QStringList channelPatterns() const;
+
+  void dispatch(ddLCMSubscriber* subscriber, const QByteArray& messageData, const QString& channel, qint64 receiveUtime);
+
+  // Discards queued messages for the subscriber and waits until the worker
+  // thread is no longer running its handler.
+  void removeSubscriber(ddLCMSubscriber* subscriber);
+
+  QList<double> statistics() const;
+  void resetStatistics();
+
+  void stop();
+
+  static qint64 currentUtime();
+
+protected:
+
+  struct QueuedMessage
+  {
+    ddLCMSubscriber* Subscriber;
+    QByteArray Data;
+    QString Channel;
+    qint64 ReceiveUtime;
+  };
+
+  void run();
+  void handleMessage(const QueuedMessage& message);
+
+  QString mName;
+  int mQueueCapacity;
+  bool mShouldStop;
+  QList<QRegExp> mChannelPatterns;
+
+  std::deque<QueuedMessage> mQueue;
+  ddLCMSubscriber* mCurrentSubscriber;
+
+  qint64 mMessageCount;
+  qint64 mDroppedCount;
+  double mMeanLatency;
+  double mMaxLatency;
+  double mMeanHandlerTime;
+  double mMaxHandlerTime;
+
+  mutable QMutex mMutex;
+  mutable QMutex mStatisticsMutex;
+  QWaitCondition mQueueCondition;
+  QWaitCondition mIdleCondition;
+};
+
+#endif
@@ -11,10 +11,16 @@
 #include <QMutexLocker>
 #include <QWaitCondition>
 #include <QTime>
+#include <QVector>
+#include <QList>
+
+#include <algorithm>
+#include <cstring>
 
 #include <lcm/lcm-cpp.hpp>
 
 #include "ddFPSCounter.h"
+#include "ddLCMDispatchGroup.h"
 #include "ddAppConfigure.h"
 
 
@@ -35,6 +41,10 @@ public:
     this->mEmitMessages = true;
     this->mNotifyAllMessages = false;
     this->mRequiredElapsedMilliseconds = 0;
+    this->mDispatchGroup = 0;
+    this->mBufferStart = 0;
+    this->mBufferCount = 0;
+    this->mOverflowCount = 0;
     this->connect(this, SIGNAL(messageReceivedInQueue(const QString&)), SLOT(onMessageInQueue(const QString&)));
   }
 
@@ -58,6 +68,21 @@ public:
     return mChannel;
   }
 
+  // Messages are handed to the dispatch group, which runs handleMessage()
+  // inline on the LCM thread or on the worker thread of the group.  If no
+  // group is set the message is handled inline.
+  void setDispatchGroup(ddLCMDispatchGroup* group)
+  {
+    QMutexLocker locker(&this->mMutex);
+    this->mDispatchGroup = group;
+  }
+
+  ddLCMDispatchGroup* dispatchGroup() const
+  {
+    QMutexLocker locker(&this->mMutex);
+    return this->mDispatchGroup;
+  }
+
   void setCallbackEnabled(bool enabled)
   {
     this->mEmitMessages = enabled;
@@ -105,6 +130,113 @@ public:
     return this->mFPSCounter.averageFPS();
   }
 
+  // Sets the capacity of the message ring buffer.  With a capacity greater
+  // than zero the subscriber keeps up to capacity of the most recent messages
+  // and does not emit messageReceived().  Instead messagesAvailable() is
+  // emitted once when the buffer becomes non-empty, and the main thread
+  // drains every pending message with takeMessages() or takePackedMessages().
+  // A capacity of zero restores the default delivery modes.  Changing the
+  // capacity discards buffered messages.
+  void setBufferCapacity(int capacity)
+  {
+    QMutexLocker locker(&this->mMutex);
+    capacity = std::max(capacity, 0);
+    this->mBufferMessages = QVector<QByteArray>(capacity);
+    this->mBufferUtimes = QVector<qint64>(capacity);
+    this->mBufferStart = 0;
+    this->mBufferCount = 0;
+  }
+
+  int bufferCapacity() const
+  {
+    QMutexLocker locker(&this->mMutex);
+    return this->mBufferMessages.size();
+  }
+
+  int bufferedMessageCount() const
+  {
+    QMutexLocker locker(&this->mMutex);
+    return this->mBufferCount;
+  }
+
+  // Number of messages overwritten in a full ring buffer before they were taken.
+  qint64 overflowCount() const
+  {
+    QMutexLocker locker(&this->mMutex);
+    return this->mOverflowCount;
+  }
+
+  void resetOverflowCount()
+  {
+    QMutexLocker locker(&this->mMutex);
+    this->mOverflowCount = 0;
+  }
+
+  // Returns and removes every buffered message, oldest first.
+  QList<QByteArray> takeMessages()
+  {
+    QMutexLocker locker(&this->mMutex);
+
+    QList<QByteArray> messages;
+    messages.reserve(this->mBufferCount);
+    for (int i = 0; i < this->mBufferCount; ++i)
+    {
+      int index = (this->mBufferStart + i) % this->mBufferMessages.size();
+      messages.append(this->mBufferMessages[index]);
+      this->mBufferMessages[index].clear();
+    }
+
+    this->mBufferStart = 0;
+    this->mBufferCount = 0;
+    return messages;
+  }
+
+  // Returns and removes every buffered message, oldest first, packed in a
+  // single byte array made of native int64 values followed by the message
+  // bytes:
+  //
+  //   count | receive utimes[count] | offsets[count + 1] | message bytes
+  //
+  // Message i is bytes [offsets[i], offsets[i+1]) of the message section.
+  QByteArray takePackedMessages()
+  {
+    QMutexLocker locker(&this->mMutex);
+
+    const int count = this->mBufferCount;
+    const int capacity = this->mBufferMessages.size();
+
+    qint64 dataSize = 0;
+    for (int i = 0; i < count; ++i)
+    {
+      dataSize += this->mBufferMessages[(this->mBufferStart + i) % capacity].size();
+    }
+
+    const int headerSize = (2 * count + 2) * sizeof(qint64);
+    QByteArray packed(headerSize + dataSize, Qt::Uninitialized);
+
+    qint64* header = reinterpret_cast<qint64*>(packed.data());
+    qint64* utimes = header + 1;
+    qint64* offsets = utimes + count;
+    char* data = packed.data() + headerSize;
+
+    header[0] = count;
+    offsets[0] = 0;
+
+    for (int i = 0; i < count; ++i)
+    {
+      int index = (this->mBufferStart + i) % capacity;
+      const QByteArray& message = this->mBufferMessages[index];
+      utimes[i] = this->mBufferUtimes[index];
+      memcpy(data + offsets[i], message.constData(), message.size());
+      offsets[i + 1] = offsets[i] + message.size();
+      this->mBufferMessages[index].clear();
+    }
+
+    this->mBufferStart = 0;
+    this->mBufferCount = 0;
+    return packed;
+  }
+
   QByteArray getNextMessage(int timeout)
   {
 
@@ -136,6 +268,7 @@ signals:
 
   void messageReceived(const QByteArray& messageData, const QString& channel);
   void messageReceivedInQueue(const QString& channel);
+  void messagesAvailable(const QString& channel);
 
 protected slots:
 
@@ -151,12 +284,31 @@ protected:
 
   void messageHandler(const lcm::ReceiveBuffer* rbuf, const std::string& channel)
   {
-    ddNotUsed(channel);
-
     QByteArray messageBytes = QByteArray((char*)rbuf->data, rbuf->data_size);
 
     mFPSCounter.update();
 
+    ddLCMDispatchGroup* group = this->dispatchGroup();
+    if (group)
+    {
+      group->dispatch(this, messageBytes, QString(channel.c_str()), rbuf->recv_utime);
+    }
+    else
+    {
+      this->handleMessage(messageBytes, QString(channel.c_str()), rbuf->recv_utime);
+    }
+  }
+
+public:
+
+  // Called by the dispatch group with a message received on this subscriber's channel.
+  void handleMessage(const QByteArray& messageBytes, const QString& channel, qint64 receiveUtime)
+  {
+    if (this->bufferMessage(messageBytes, receiveUtime))
+    {
+      return;
+    }
+
     if (this->mEmitMessages)
     {
       if (this->mRequiredElapsedMilliseconds == 0 || mTimer.elapsed() > this->mRequiredElapsedMilliseconds)
@@ -165,7 +317,7 @@ protected:
 
         if (this->mNotifyAllMessages)
         {
-          emit this->messageReceived(messageBytes, QString(channel.c_str()));
+          emit this->messageReceived(messageBytes, channel);
         }
         else
         {
@@ -176,7 +328,7 @@ protected:
 
           if (doEmit)
           {
-            emit this->messageReceivedInQueue(QString(channel.c_str()));
+            emit this->messageReceivedInQueue(channel);
           }
         }
 
@@ -192,6 +344,46 @@ protected:
 
   }
 
+protected:
+
+  // Appends the message to the ring buffer if buffering is enabled, returns
+  // false if it is not.
+  bool bufferMessage(const QByteArray& messageBytes, qint64 receiveUtime)
+  {
+    this->mMutex.lock();
+
+    const int capacity = this->mBufferMessages.size();
+    if (!capacity)
+    {
+      this->mMutex.unlock();
+      return false;
+    }
+
+    const bool wasEmpty = (this->mBufferCount == 0);
+    int index = (this->mBufferStart + this->mBufferCount) % capacity;
+
+    if (this->mBufferCount == capacity)
+    {
+      // overwrite the oldest message
+      this->mBufferStart = (this->mBufferStart + 1) % capacity;
+      ++this->mOverflowCount;
+    }
+    else
+    {
+      ++this->mBufferCount;
+    }
+
+    this->mBufferMessages[index] = messageBytes;
+    this->mBufferUtimes[index] = receiveUtime;
+    this->mMutex.unlock();
+
+    if (wasEmpty && this->mEmitMessages)
+    {
+      emit this->messagesAvailable(this->mChannel);
+    }
+    return true;
+  }
+
   bool mEmitMessages;
   bool mNotifyAllMessages;
   int mRequiredElapsedMilliseconds;
@@ -202,6 +394,13 @@ protected:
   QTime mTimer;
   QString mChannel;
   lcm::Subscription* mSubscription;
+  ddLCMDispatchGroup* mDispatchGroup;
+
+  QVector<QByteArray> mBufferMessages;
+  QVector<qint64> mBufferUtimes;
+  int mBufferStart;
+  int mBufferCount;
+  qint64 mOverflowCount;
 
 };
 
@@ -1,9 +1,12 @@
 #include "ddLCMThread.h"
 
 #include "ddLCMSubscriber.h"
+#include "ddLCMTrafficMonitor.h"
+#include "ddLCMDispatchGroup.h"
 
 #include <lcm/lcm-cpp.hpp>
 #include <iostream>
+#include <algorithm>
 
 #ifdef _WIN32
   #include <Windows.h>
@@ -15,6 +18,8 @@ ddLCMThread::ddLCMThread(QObject* parent) : QThread(parent)
   mSelectTimeout = 0.3;
   mShouldStop = false;
   mLCM = 0;
+  mTrafficMonitor = 0;
+  mGroups.append(new ddLCMDispatchGroup("default", 0, this));
 }
 
 //-----------------------------------------------------------------------------
@@ -45,6 +50,7 @@ void ddLCMThread::initLCM()
 void ddLCMThread::addSubscriber(ddLCMSubscriber* subscriber)
 {
   this->initLCM();
+  subscriber->setDispatchGroup(this->groupForChannel(subscriber->channel()));
   mSubscribers.append(subscriber);
   subscriber->subscribe(mLCM);
 }
@@ -54,6 +60,123 @@ void ddLCMThread::removeSubscriber(ddLCMSubscriber* subscriber)
 {
   subscriber->unsubscribe(mLCM);
   mSubscribers.removeAll(subscriber);
+
+  ddLCMDispatchGroup* group = subscriber->dispatchGroup();
+  subscriber->setDispatchGroup(0);
+  if (group)
+  {
+    group->removeSubscriber(subscriber);
+  }
+}
+
+//-----------------------------------------------------------------------------
+ddLCMDispatchGroup* ddLCMThread::findGroup(const QString& group) const
+{
+  foreach (ddLCMDispatchGroup* dispatchGroup, mGroups)
+  {
+    if (dispatchGroup->name() == group)
+    {
+      return dispatchGroup;
+    }
+  }
+  return 0;
+}
+
+//-----------------------------------------------------------------------------
+ddLCMDispatchGroup* ddLCMThread::groupForChannel(const QString& channel) const
+{
+  foreach (ddLCMDispatchGroup* dispatchGroup, mGroups)
+  {
+    if (dispatchGroup->matchesChannel(channel))
+    {
+      return dispatchGroup;
+    }
+  }
+  return mGroups.first();
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMThread::addGroup(const QString& group, int queueCapacity)
+{
+  if (this->findGroup(group))
+  {
+    printf("addGroup: group already exists: %s\n", group.toAscii().data());
+    return;
+  }
+
+  mGroups.append(new ddLCMDispatchGroup(group, std::max(queueCapacity, 1), this));
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMThread::addChannelToGroup(const QString& channelPattern, const QString& group)
+{
+  ddLCMDispatchGroup* dispatchGroup = this->findGroup(group);
+  if (!dispatchGroup)
+  {
+    printf("addChannelToGroup: cannot find group: %s\n", group.toAscii().data());
+    return;
+  }
+
+  dispatchGroup->addChannelPattern(channelPattern);
+
+  // move existing subscribers, messages already queued on their previous
+  // group are still delivered
+  foreach (ddLCMSubscriber* subscriber, mSubscribers)
+  {
+    subscriber->setDispatchGroup(this->groupForChannel(subscriber->channel()));
+  }
+}
+
+//-----------------------------------------------------------------------------
+QString ddLCMThread::channelGroup(const QString& channel) const
+{
+  return this->groupForChannel(channel)->name();
+}
+
+//-----------------------------------------------------------------------------
+QStringList ddLCMThread::groups() const
+{
+  QStringList names;
+  foreach (ddLCMDispatchGroup* dispatchGroup, mGroups)
+  {
+    names << dispatchGroup->name();
+  }
+  return names;
+}
+
+//-----------------------------------------------------------------------------
+QStringList ddLCMThread::groupChannelPatterns(const QString& group) const
+{
+  ddLCMDispatchGroup* dispatchGroup = this->findGroup(group);
+  return dispatchGroup ? dispatchGroup->channelPatterns() : QStringList();
+}
+
+//-----------------------------------------------------------------------------
+QList<double> ddLCMThread::groupStatistics(const QString& group) const
+{
+  ddLCMDispatchGroup* dispatchGroup = this->findGroup(group);
+  return dispatchGroup ? dispatchGroup->statistics() : QList<double>();
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMThread::resetGroupStatistics()
+{
+  foreach (ddLCMDispatchGroup* dispatchGroup, mGroups)
+  {
+    dispatchGroup->resetStatistics();
+  }
+}
+
+//-----------------------------------------------------------------------------
+ddLCMTrafficMonitor* ddLCMThread::trafficMonitor()
+{
+  if (!mTrafficMonitor)
+  {
+    this->initLCM();
+    mTrafficMonitor = new ddLCMTrafficMonitor(this);
+    mTrafficMonitor->subscribe(mLCM);
+  }
+  return mTrafficMonitor;
 }
 
 //-----------------------------------------------------------------------------
@@ -117,4 +240,9 @@ void ddLCMThread::stop()
 {
   mShouldStop = true;
   this->wait();
+
+  foreach (ddLCMDispatchGroup* dispatchGroup, mGroups)
+  {
+    dispatchGroup->stop();
+  }
 }
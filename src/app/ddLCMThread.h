@@ -3,10 +3,14 @@
 
 #include <QThread>
 #include <QMutex>
+#include <QStringList>
+#include <QList>
 #include "ddAppConfigure.h"
 
 
 class ddLCMSubscriber;
+class ddLCMTrafficMonitor;
+class ddLCMDispatchGroup;
 
 namespace lcm
 {
@@ -27,6 +31,25 @@ public:
   void addSubscriber(ddLCMSubscriber* subscriber);
   void removeSubscriber(ddLCMSubscriber* subscriber);
 
+  // Returns the traffic monitor for this thread, creating and subscribing it
+  // on first use.
+  ddLCMTrafficMonitor* trafficMonitor();
+
+  // Dispatch groups partition the receive side by channel.  Subscribers on
+  // channels of the "default" group are handled inline on this thread, every
+  // other group handles its channels on its own worker thread with a queue of
+  // at most queueCapacity messages.  A subscriber uses the first group with a
+  // channel pattern that matches its channel.
+  void addGroup(const QString& group, int queueCapacity);
+  void addChannelToGroup(const QString& channelPattern, const QString& group);
+  QString channelGroup(const QString& channel) const;
+  QStringList groups() const;
+  QStringList groupChannelPatterns(const QString& group) const;
+
+  // See ddLCMDispatchGroup::StatisticsField for the layout of the list.
+  QList<double> groupStatistics(const QString& group) const;
+  void resetGroupStatistics();
+
   lcm::LCM* lcmHandle()
   {
     this->initLCM();
@@ -39,10 +62,14 @@ public:
   void threadLoopWithSelect();
   bool waitForLCM(double timeout);
   void initLCM();
+  ddLCMDispatchGroup* findGroup(const QString& group) const;
+  ddLCMDispatchGroup* groupForChannel(const QString& channel) const;
 
   bool mShouldStop;
   double mSelectTimeout;
   QList<ddLCMSubscriber*> mSubscribers;
+  QList<ddLCMDispatchGroup*> mGroups;
+  ddLCMTrafficMonitor* mTrafficMonitor;
   lcm::LCM* mLCM;
 
   QMutex mMutex;
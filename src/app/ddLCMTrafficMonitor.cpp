@@ -0,0 +1,268 @@
+#include "ddLCMTrafficMonitor.h"
+
+#include <lcm/lcm-cpp.hpp>
+
+#include <QDateTime>
+
+#include <algorithm>
+#include <cmath>
+#include <cstring>
+
+namespace
+{
+  // Weight of a new sample in the inter-arrival moving averages
+  const double IntervalAlpha = 1.0 / 16.0;
+}
+
+//-----------------------------------------------------------------------------
+ddLCMTrafficMonitor::ChannelStatistics::ChannelStatistics()
+{
+  this->MessageCount = 0;
+  this->TotalBytes = 0;
+  this->LastUtime = 0;
+  this->LastMessageSize = 0;
+  this->CurrentBin = 0;
+  this->IntervalMean = 0.0;
+  this->IntervalVariance = 0.0;
+  this->DecodeCount = 0;
+  this->DecodeSeconds = 0.0;
+  memset(this->BinMessages, 0, sizeof(this->BinMessages));
+  memset(this->BinBytes, 0, sizeof(this->BinBytes));
+  memset(this->IntervalHistogram, 0, sizeof(this->IntervalHistogram));
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::ChannelStatistics::advanceToBin(qint64 bin)
+{
+  if (bin <= this->CurrentBin)
+  {
+    return;
+  }
+
+  // clear the bins that have fallen out of the window
+  qint64 firstBin = std::max(this->CurrentBin + 1, bin - NumberOfBins + 1);
+  for (qint64 i = firstBin; i <= bin; ++i)
+  {
+    this->BinMessages[i % NumberOfBins] = 0;
+    this->BinBytes[i % NumberOfBins] = 0;
+  }
+
+  this->CurrentBin = bin;
+}
+
+//-----------------------------------------------------------------------------
+ddLCMTrafficMonitor::ddLCMTrafficMonitor(QObject* parent) : QObject(parent)
+{
+  mSubscription = 0;
+  mBinDuration = 200000;
+}
+
+//-----------------------------------------------------------------------------
+ddLCMTrafficMonitor::~ddLCMTrafficMonitor()
+{
+  this->reset();
+}
+
+//-----------------------------------------------------------------------------
+qint64 ddLCMTrafficMonitor::currentUtime()
+{
+  return QDateTime::currentMSecsSinceEpoch() * 1000;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::subscribe(lcm::LCM* lcmHandle)
+{
+  mSubscription = lcmHandle->subscribe(".*", &ddLCMTrafficMonitor::messageHandler, this);
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::unsubscribe(lcm::LCM* lcmHandle)
+{
+  lcmHandle->unsubscribe(mSubscription);
+  mSubscription = 0;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::messageHandler(const lcm::ReceiveBuffer* rbuf, const std::string& channel)
+{
+  const qint64 utime = rbuf->recv_utime;
+  const int messageSize = rbuf->data_size;
+
+  QMutexLocker locker(&mMutex);
+
+  ChannelStatistics*& stats = mChannels[channel];
+  if (!stats)
+  {
+    stats = new ChannelStatistics;
+    stats->CurrentBin = utime / mBinDuration;
+  }
+
+  if (stats->MessageCount)
+  {
+    const qint64 interval = utime - stats->LastUtime;
+    const double seconds = interval * 1e-6;
+
+    if (stats->MessageCount == 1)
+    {
+      stats->IntervalMean = seconds;
+    }
+    else
+    {
+      const double delta = seconds - stats->IntervalMean;
+      stats->IntervalMean += IntervalAlpha * delta;
+      stats->IntervalVariance = (1.0 - IntervalAlpha) * (stats->IntervalVariance + IntervalAlpha * delta * delta);
+    }
+
+    int histogramBin = 0;
+    for (qint64 value = interval >> 1; value && histogramBin < NumberOfIntervalBins - 1; value >>= 1)
+    {
+      ++histogramBin;
+    }
+    ++stats->IntervalHistogram[histogramBin];
+  }
+
+  stats->advanceToBin(utime / mBinDuration);
+  const int binIndex = stats->CurrentBin % NumberOfBins;
+  ++stats->BinMessages[binIndex];
+  stats->BinBytes[binIndex] += messageSize;
+
+  ++stats->MessageCount;
+  stats->TotalBytes += messageSize;
+  stats->LastUtime = utime;
+  stats->LastMessageSize = messageSize;
+}
+
+//-----------------------------------------------------------------------------
+QStringList ddLCMTrafficMonitor::channels() const
+{
+  QMutexLocker locker(&mMutex);
+
+  QStringList channelNames;
+  for (ChannelMap::const_iterator itr = mChannels.begin(); itr != mChannels.end(); ++itr)
+  {
+    channelNames << QString::fromStdString(itr->first);
+  }
+  return channelNames;
+}
+
+//-----------------------------------------------------------------------------
+QList<double> ddLCMTrafficMonitor::channelStatistics(const QString& channel) const
+{
+  QMutexLocker locker(&mMutex);
+
+  QList<double> values;
+
+  ChannelMap::const_iterator itr = mChannels.find(channel.toStdString());
+  if (itr == mChannels.end())
+  {
+    return values;
+  }
+
+  // Work on a copy so that stale bins can be cleared without touching the
+  // record that the LCM thread is writing.
+  ChannelStatistics stats = *itr->second;
+
+  const qint64 now = currentUtime();
+  stats.advanceToBin(now / mBinDuration);
+
+  qint64 windowMessages = 0;
+  qint64 windowBytes = 0;
+  for (int i = 0; i < NumberOfBins; ++i)
+  {
+    windowMessages += stats.BinMessages[i];
+    windowBytes += stats.BinBytes[i];
+  }
+
+  const double windowSeconds = this->windowDuration();
+
+  for (int i = 0; i < NumberOfFields; ++i)
+  {
+    values << 0.0;
+  }
+
+  values[MessageCount] = stats.MessageCount;
+  values[TotalBytes] = stats.TotalBytes;
+  values[MessageRate] = windowMessages / windowSeconds;
+  values[Bandwidth] = windowBytes / windowSeconds;
+  values[MeanInterval] = stats.IntervalMean;
+  values[Jitter] = std::sqrt(stats.IntervalVariance);
+  values[Age] = std::max(now - stats.LastUtime, qint64(0)) * 1e-6;
+  values[LastMessageSize] = stats.LastMessageSize;
+  values[DecodeTime] = stats.DecodeCount ? stats.DecodeSeconds / stats.DecodeCount : 0.0;
+  return values;
+}
+
+//-----------------------------------------------------------------------------
+QList<double> ddLCMTrafficMonitor::intervalHistogram(const QString& channel) const
+{
+  QMutexLocker locker(&mMutex);
+
+  QList<double> values;
+
+  ChannelMap::const_iterator itr = mChannels.find(channel.toStdString());
+  if (itr == mChannels.end())
+  {
+    return values;
+  }
+
+  for (int i = 0; i < NumberOfIntervalBins; ++i)
+  {
+    values << itr->second->IntervalHistogram[i];
+  }
+  return values;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::recordDecodeTime(const QString& channel, double seconds)
+{
+  QMutexLocker locker(&mMutex);
+
+  ChannelMap::iterator itr = mChannels.find(channel.toStdString());
+  if (itr == mChannels.end())
+  {
+    return;
+  }
+
+  ++itr->second->DecodeCount;
+  itr->second->DecodeSeconds += seconds;
+}
+
+//-----------------------------------------------------------------------------
+double ddLCMTrafficMonitor::windowDuration() const
+{
+  return NumberOfBins * mBinDuration * 1e-6;
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::setWindowDuration(double seconds)
+{
+  QMutexLocker locker(&mMutex);
+
+  qint64 binDuration = std::max(static_cast<qint64>(seconds * 1e6 / NumberOfBins), qint64(1000));
+  if (binDuration == mBinDuration)
+  {
+    return;
+  }
+
+  // the bins are no longer meaningful with a different bin duration
+  mBinDuration = binDuration;
+  for (ChannelMap::iterator itr = mChannels.begin(); itr != mChannels.end(); ++itr)
+  {
+    ChannelStatistics* stats = itr->second;
+    memset(stats->BinMessages, 0, sizeof(stats->BinMessages));
+    memset(stats->BinBytes, 0, sizeof(stats->BinBytes));
+    stats->CurrentBin = stats->LastUtime / mBinDuration;
+  }
+}
+
+//-----------------------------------------------------------------------------
+void ddLCMTrafficMonitor::reset()
+{
+  QMutexLocker locker(&mMutex);
+
+  for (ChannelMap::iterator itr = mChannels.begin(); itr != mChannels.end(); ++itr)
+  {
+    delete itr->second;
+  }
+  mChannels.clear();
+}
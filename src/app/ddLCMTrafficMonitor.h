@@ -0,0 +1,109 @@
+#ifndef __ddLCMTrafficMonitor_h
+#define __ddLCMTrafficMonitor_h
+
+#include <QObject>
+#include <QMutex>
+#include <QStringList>
+#include <QList>
+
+#include <map>
+#include <string>
+
+#include "ddAppConfigure.h"
+
+namespace lcm
+{
+  class LCM;
+  class Subscription;
+  class ReceiveBuffer;
+}
+
+// Collects per channel traffic statistics for every message handled by the
+// LCM thread.  Messages are never copied or decoded, the handler only updates
+// a fixed size record for the channel, so it is cheap enough to leave enabled
+// all the time.  Message and byte counts are kept in a ring of time bins that
+// covers a sliding window, and inter-arrival times are kept in a histogram of
+// power of two microsecond bins plus an exponential moving average used to
+// report jitter.  Queries are made from the main thread.
+
+class DD_APP_EXPORT ddLCMTrafficMonitor : public QObject
+ {
+  Q_OBJECT
+
+public:
+
+  // Layout of the list returned by channelStatistics()
+  enum StatisticsField
+  {
+    MessageCount = 0,   // total messages since reset
+    TotalBytes,         // total bytes since reset
+    MessageRate,        // messages per second over the window
+    Bandwidth,          // bytes per second over the window
+    MeanInterval,       // seconds, moving average of inter-arrival time
+    Jitter,             // seconds, moving standard deviation of inter-arrival time
+    Age,                // seconds since the last message
+    LastMessageSize,    // bytes
+    DecodeTime,         // seconds, mean of times reported with recordDecodeTime()
+    NumberOfFields
+  };
+
+  enum
+  {
+    NumberOfBins = 50,
+    NumberOfIntervalBins = 24
+  };
+
+  ddLCMTrafficMonitor(QObject* parent=NULL);
+  virtual ~ddLCMTrafficMonitor();
+
+  void subscribe(lcm::LCM* lcmHandle);
+  void unsubscribe(lcm::LCM* lcmHandle);
+
+  QStringList channels() const;
+  QList<double> channelStatistics(const QString& channel) const;
+  QList<double> intervalHistogram(const QString& channel) const;
+
+  void recordDecodeTime(const QString& channel, double seconds);
+
+  double windowDuration() const;
+  void setWindowDuration(double seconds);
+
+  void reset();
+
+protected:
+
+  struct ChannelStatistics
+  {
+    ChannelStatistics();
+    void advanceToBin(qint64 bin);
+
+    qint64 MessageCount;
+    qint64 TotalBytes;
+    qint64 LastUtime;
+    int LastMessageSize;
+
+    qint64 CurrentBin;
+    int BinMessages[NumberOfBins];
+    int BinBytes[NumberOfBins];
+
+    double IntervalMean;
+    double IntervalVariance;
+    int IntervalHistogram[NumberOfIntervalBins];
+
+    int DecodeCount;
+    double DecodeSeconds;
+  };
+
+  void messageHandler(const lcm::ReceiveBuffer* rbuf, const std::string& channel);
+
+  static qint64 currentUtime();
+
+  typedef std::map<std::string, ChannelStatistics*> ChannelMap;
+
+  ChannelMap mChannels;
+  qint64 mBinDuration;
+  lcm::Subscription* mSubscription;
+  mutable QMutex mMutex;
+};
+
+#endif
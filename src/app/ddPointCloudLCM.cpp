@@ -5,6 +5,9 @@
 #include <vtkIdTypeArray.h>
 #include <vtkCellArray.h>
 #include <vtkNew.h>
+#include <vtkMatrix4x4.h>
+
+#include <algorithm>
 
 #include <multisense_utils/conversions_lcm.hpp>
 
@@ -29,10 +32,113 @@ POINT_CLOUD_REGISTER_POINT_STRUCT(pcl::PointXYZIR,
                                   (uint16_t, ring, ring))
 
 
+namespace {
+
+const int DefaultHistoryLength = 10;
+
+//----------------------------------------------------------------------------
+void SetIdentity(double matx[16])
+{
+  for (int i = 0; i < 16; ++i)
+  {
+    matx[i] = (i % 5 == 0) ? 1.0 : 0.0;
+  }
+}
+
+//----------------------------------------------------------------------------
+vtkSmartPointer<vtkCellArray> NewVertexCells(vtkIdType numberOfVerts)
+{
+  vtkNew<vtkIdTypeArray> cells;
+  cells->SetNumberOfValues(numberOfVerts*2);
+  vtkIdType* ids = cells->GetPointer(0);
+  for (vtkIdType i = 0; i < numberOfVerts; ++i)
+    {
+    ids[i*2] = 1;
+    ids[i*2+1] = i;
+    }
+
+  vtkSmartPointer<vtkCellArray> cellArray = vtkSmartPointer<vtkCellArray>::New();
+  cellArray->SetCells(numberOfVerts, cells.GetPointer());
+  return cellArray;
+}
+
+//----------------------------------------------------------------------------
+void UpdateVertexCells(vtkPolyData* polyData, vtkIdType numberOfVerts)
+{
+  vtkCellArray* verts = polyData->GetVerts();
+  if (verts->GetNumberOfCells() == numberOfVerts)
+    {
+    return;
+    }
+
+  // vtkPolyData returns a shared dummy cell array when it has no verts,
+  // only an existing non-empty cell array is reused
+  if (!verts->GetNumberOfCells())
+    {
+    polyData->SetVerts(NewVertexCells(numberOfVerts));
+    return;
+    }
+
+  vtkIdTypeArray* cells = verts->GetData();
+  cells->SetNumberOfValues(numberOfVerts*2);
+  vtkIdType* ids = cells->GetPointer(0);
+  for (vtkIdType i = 0; i < numberOfVerts; ++i)
+    {
+    ids[i*2] = 1;
+    ids[i*2+1] = i;
+    }
+  verts->SetCells(numberOfVerts, cells);
+}
+
+//----------------------------------------------------------------------------
+vtkFloatArray* GetOutputPoints(vtkPolyData* polyData, vtkIdType numberOfPoints)
+{
+  vtkPoints* points = polyData->GetPoints();
+  if (!points || points->GetDataType() != VTK_FLOAT)
+    {
+    vtkNew<vtkPoints> newPoints;
+    newPoints->SetDataTypeToFloat();
+    polyData->SetPoints(newPoints.GetPointer());
+    points = newPoints.GetPointer();
+    }
+
+  points->SetNumberOfPoints(numberOfPoints);
+  points->Modified();
+  return vtkFloatArray::SafeDownCast(points->GetData());
+}
+
+//----------------------------------------------------------------------------
+template <typename ArrayType>
+ArrayType* GetOutputArray(vtkPolyData* polyData, const char* name, vtkIdType numberOfValues)
+{
+  ArrayType* array = ArrayType::SafeDownCast(polyData->GetPointData()->GetArray(name));
+  if (!array)
+    {
+    vtkSmartPointer<ArrayType> newArray = vtkSmartPointer<ArrayType>::New();
+    newArray->SetName(name);
+    newArray->SetNumberOfComponents(1);
+    polyData->GetPointData()->AddArray(newArray);
+    array = newArray;
+    }
+
+  array->SetNumberOfValues(numberOfValues);
+  array->Modified();
+  return array;
+}
+
+};
+
+
 //-----------------------------------------------------------------------------
 ddPointCloudLCM::ddPointCloudLCM(QObject* parent) : QObject(parent)
 {
-  mPolyData = vtkSmartPointer<vtkPolyData>::New();
+  mLCM = 0;
+  mBotParam = 0;
+  mBotFrames = 0;
+  mSensorFrame = "VELODYNE";
+  mTargetFrame = "local";
+  mTransformEnabled = true;
+  this->resetHistory(DefaultHistoryLength);
 }
 
 
@@ -41,6 +147,20 @@ void ddPointCloudLCM::init(ddLCMThread* lcmThread, const QString& botConfigFile)
 {
   
   mLCM = lcmThread;
+
+  if (botConfigFile.length())
+  {
+    mBotParam = bot_param_new_from_file(botConfigFile.toAscii().data());
+  }
+  else
+  {
+    while (!mBotParam)
+    {
+      mBotParam = bot_param_new_from_server(mLCM->lcmHandle()->getUnderlyingLCM(), 0);
+    }
+  }
+
+  mBotFrames = bot_frames_get_global(mLCM->lcmHandle()->getUnderlyingLCM(), mBotParam);
   
   QString channelName = "VELODYNE";
   ddLCMSubscriber* subscriber = new ddLCMSubscriber(channelName, this);
@@ -53,108 +173,320 @@ void ddPointCloudLCM::init(ddLCMThread* lcmThread, const QString& botConfigFile)
 }
 
 
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::resetHistory(int length)
+{
+  mFrames.clear();
+  mFrames.resize(std::max(length, 1));
+  for (int i = 0; i < mFrames.size(); ++i)
+  {
+    Frame& frame = mFrames[i];
+    frame.Utime = 0;
+    frame.NumberOfPoints = 0;
+    SetIdentity(frame.SensorToTarget);
+
+    frame.Points = vtkSmartPointer<vtkFloatArray>::New();
+    frame.Points->SetNumberOfComponents(3);
 
-namespace {
+    frame.Intensity = vtkSmartPointer<vtkFloatArray>::New();
+    frame.Intensity->SetName("intensity");
 
+    frame.Ring = vtkSmartPointer<vtkUnsignedIntArray>::New();
+    frame.Ring->SetName("ring");
+  }
 
+  mFrameCount = 0;
+  mLastFrame = mFrames.size() - 1;
+}
 
-//----------------------------------------------------------------------------
-vtkSmartPointer<vtkCellArray> NewVertexCells(vtkIdType numberOfVerts)
+
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::setHistoryLength(int length)
 {
-  vtkNew<vtkIdTypeArray> cells;
-  cells->SetNumberOfValues(numberOfVerts*2);
-  vtkIdType* ids = cells->GetPointer(0);
-  for (vtkIdType i = 0; i < numberOfVerts; ++i)
+  QMutexLocker locker(&this->mPolyDataMutex);
+  this->resetHistory(length);
+}
+
+
+//-----------------------------------------------------------------------------
+int ddPointCloudLCM::historyLength() const
+{
+  QMutexLocker locker(&this->mPolyDataMutex);
+  return mFrames.size();
+}
+
+
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::setCoordinateFrames(const QString& sensorFrame, const QString& targetFrame)
+{
+  QMutexLocker locker(&this->mPolyDataMutex);
+  mSensorFrame = sensorFrame.toAscii().data();
+  mTargetFrame = targetFrame.toAscii().data();
+}
+
+
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::setTransformEnabled(bool enabled)
+{
+  QMutexLocker locker(&this->mPolyDataMutex);
+  mTransformEnabled = enabled;
+}
+
+
+//-----------------------------------------------------------------------------
+bool ddPointCloudLCM::transformEnabled() const
+{
+  QMutexLocker locker(&this->mPolyDataMutex);
+  return mTransformEnabled;
+}
+
+
+//-----------------------------------------------------------------------------
+bool ddPointCloudLCM::getSensorToTarget(qint64 utime, double matx[16])
+{
+  std::string sensorFrame;
+  std::string targetFrame;
+  {
+    QMutexLocker locker(&this->mPolyDataMutex);
+    if (!mTransformEnabled || !mBotFrames)
     {
-    ids[i*2] = 1;
-    ids[i*2+1] = i;
+      SetIdentity(matx);
+      return false;
     }
+    sensorFrame = mSensorFrame;
+    targetFrame = mTargetFrame;
+  }
 
-  vtkSmartPointer<vtkCellArray> cellArray = vtkSmartPointer<vtkCellArray>::New();
-  cellArray->SetCells(numberOfVerts, cells.GetPointer());
-  return cellArray;
+  int status = bot_frames_get_trans_mat_4x4_with_utime(mBotFrames, sensorFrame.c_str(), targetFrame.c_str(), utime, matx);
+  if (!status)
+  {
+    SetIdentity(matx);
+    return false;
+  }
+  return true;
 }
 
 
+//-----------------------------------------------------------------------------
+int ddPointCloudLCM::frameIndex(int i) const
+{
+  const int length = mFrames.size();
+  return (mLastFrame - mFrameCount + 1 + i + length) % length;
+}
+
 
-//----------------------------------------------------------------------------
-vtkSmartPointer<vtkPolyData> PolyDataFromPointCloud(pcl::PointCloud<pcl::PointXYZIR>::ConstPtr cloud)
+//-----------------------------------------------------------------------------
+int ddPointCloudLCM::findFrame(qint64 utime) const
 {
-  vtkIdType nr_points = cloud->points.size();
+  int bestIndex = -1;
+  qint64 bestDifference = 0;
+  for (int i = 0; i < mFrameCount; ++i)
+  {
+    const int index = this->frameIndex(i);
+    const qint64 difference = mFrames[index].Utime > utime ? mFrames[index].Utime - utime : utime - mFrames[index].Utime;
+    if (bestIndex < 0 || difference < bestDifference)
+    {
+      bestIndex = index;
+      bestDifference = difference;
+    }
+  }
+  return bestIndex;
+}
 
-  vtkNew<vtkPoints> points;
-  points->SetDataTypeToFloat();
-  points->SetNumberOfPoints(nr_points);
 
-  vtkNew<vtkFloatArray> intensityArray;
-  intensityArray->SetName("intensity");
-  intensityArray->SetNumberOfComponents(1);
-  intensityArray->SetNumberOfValues(nr_points);
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::onPointCloudFrame(const QByteArray& data, const QString& channel)
+{
+  
+  drc::pointcloud2_t message;
+  message.decode(data.data(), 0, data.size());
+
+  //convert to pcl object:
+  pcl::PointCloud<pcl::PointXYZIR>::Ptr cloud (new pcl::PointCloud<pcl::PointXYZIR> ());
+  pcl::fromLCMPointCloud2( message, *cloud);
+
+  double matx[16];
+  this->getSensorToTarget(message.utime, matx);
+
+  QMutexLocker locker(&this->mPolyDataMutex);
+
+  mLastFrame = (mLastFrame + 1) % mFrames.size();
+  mFrameCount = std::min(mFrameCount + 1, mFrames.size());
+
+  Frame& frame = mFrames[mLastFrame];
+  frame.Utime = message.utime;
+  std::copy(matx, matx + 16, frame.SensorToTarget);
+
+  // the arrays only reallocate when a frame is larger than any previous
+  // frame stored in this slot
+  const vtkIdType nr_points = cloud->points.size();
+  frame.Points->SetNumberOfTuples(nr_points);
+  frame.Intensity->SetNumberOfValues(nr_points);
+  frame.Ring->SetNumberOfValues(nr_points);
 
-  vtkNew<vtkUnsignedIntArray> ringArray;
-  ringArray->SetName("ring");
-  ringArray->SetNumberOfComponents(1);
-  ringArray->SetNumberOfValues(nr_points);
+  float* points = frame.Points->GetPointer(0);
+  float* intensity = frame.Intensity->GetPointer(0);
+  unsigned int* ring = frame.Ring->GetPointer(0);
 
-  vtkIdType j = 0;    
+  vtkIdType j = 0;
   for (vtkIdType i = 0; i < nr_points; ++i)
   {
+    const pcl::PointXYZIR& point = cloud->points[i];
+
     // Check if the point is invalid
-    if (!pcl_isfinite (cloud->points[i].x) ||
-        !pcl_isfinite (cloud->points[i].y) ||
-        !pcl_isfinite (cloud->points[i].z))
+    if (!pcl_isfinite (point.x) ||
+        !pcl_isfinite (point.y) ||
+        !pcl_isfinite (point.z))
       continue;
 
-    float point[3] = {cloud->points[i].x, cloud->points[i].y, cloud->points[i].z};
-    points->SetPoint(j, point);
+    for (int k = 0; k < 3; ++k)
+    {
+      points[j*3+k] = matx[k*4]*point.x + matx[k*4+1]*point.y + matx[k*4+2]*point.z + matx[k*4+3];
+    }
 
-    float intensity = cloud->points[i].intensity;
-    intensityArray->SetValue(j,intensity);
+    intensity[j] = point.intensity;
+    ring[j] = point.ring;
+    j++;
+  }
 
-    uint16_t ring = cloud->points[i].ring;
-    ringArray->SetValue(j,ring);
+  frame.NumberOfPoints = j;
+  frame.Points->SetNumberOfTuples(j);
+  frame.Intensity->SetNumberOfValues(j);
+  frame.Ring->SetNumberOfValues(j);
+}
 
-    j++;
+
+//-----------------------------------------------------------------------------
+QList<double> ddPointCloudLCM::frameUtimes() const
+{
+  QMutexLocker locker(&this->mPolyDataMutex);
+  QList<double> utimes;
+  for (int i = 0; i < mFrameCount; ++i)
+  {
+    utimes << mFrames[this->frameIndex(i)].Utime;
+  }
+  return utimes;
+}
+
+
+//-----------------------------------------------------------------------------
+void ddPointCloudLCM::copyFrames(const QList<int>& indices, vtkPolyData* polyData) const
+{
+  vtkIdType numberOfPoints = 0;
+  foreach (int index, indices)
+  {
+    numberOfPoints += mFrames[index].NumberOfPoints;
+  }
+
+  float* points = GetOutputPoints(polyData, numberOfPoints)->GetPointer(0);
+  float* intensity = GetOutputArray<vtkFloatArray>(polyData, "intensity", numberOfPoints)->GetPointer(0);
+  unsigned int* ring = GetOutputArray<vtkUnsignedIntArray>(polyData, "ring", numberOfPoints)->GetPointer(0);
+
+  foreach (int index, indices)
+  {
+    const Frame& frame = mFrames[index];
+    const vtkIdType n = frame.NumberOfPoints;
+    std::copy(frame.Points->GetPointer(0), frame.Points->GetPointer(0) + n*3, points);
+    std::copy(frame.Intensity->GetPointer(0), frame.Intensity->GetPointer(0) + n, intensity);
+    std::copy(frame.Ring->GetPointer(0), frame.Ring->GetPointer(0) + n, ring);
+    points += n*3;
+    intensity += n;
+    ring += n;
   }
-  nr_points = j;
-  points->SetNumberOfPoints(nr_points);
 
-  vtkSmartPointer<vtkPolyData> polyData = vtkSmartPointer<vtkPolyData>::New();
-  polyData->SetPoints(points.GetPointer());
-  polyData->GetPointData()->AddArray(intensityArray.GetPointer());
-  polyData->GetPointData()->AddArray(ringArray.GetPointer());
-  polyData->SetVerts(NewVertexCells(nr_points));
-  return polyData;
+  UpdateVertexCells(polyData, numberOfPoints);
+  polyData->Modified();
 }
 
 
-};
+//-----------------------------------------------------------------------------
+int ddPointCloudLCM::getMergedFrames(qint64 startUtime, qint64 endUtime, vtkPolyData* polyData)
+{
+  if (!polyData)
+  {
+    return 0;
+  }
+
+  QMutexLocker locker(&this->mPolyDataMutex);
 
+  QList<int> indices;
+  for (int i = 0; i < mFrameCount; ++i)
+  {
+    const int index = this->frameIndex(i);
+    if (mFrames[index].Utime >= startUtime && mFrames[index].Utime <= endUtime)
+    {
+      indices << index;
+    }
+  }
+
+  this->copyFrames(indices, polyData);
+  return indices.size();
+}
 
 
 //-----------------------------------------------------------------------------
-void ddPointCloudLCM::onPointCloudFrame(const QByteArray& data, const QString& channel)
+qint64 ddPointCloudLCM::getFrameAtUtime(qint64 utime, vtkPolyData* polyData)
 {
-  
-  drc::pointcloud2_t message;
-  message.decode(data.data(), 0, data.size());
+  if (!polyData)
+  {
+    return 0;
+  }
+
+  QMutexLocker locker(&this->mPolyDataMutex);
+  const int index = this->findFrame(utime);
+  if (index < 0)
+  {
+    return 0;
+  }
+
+  this->copyFrames(QList<int>() << index, polyData);
+  return mFrames[index].Utime;
+}
 
-  //convert to pcl object:
-  pcl::PointCloud<pcl::PointXYZIR>::Ptr cloud (new pcl::PointCloud<pcl::PointXYZIR> ());
-  pcl::fromLCMPointCloud2( message, *cloud);
-  vtkSmartPointer<vtkPolyData> polyData = PolyDataFromPointCloud(cloud);
+
+//-----------------------------------------------------------------------------
+qint64 ddPointCloudLCM::getLatestFrame(vtkPolyData* polyData)
+{
+  if (!polyData)
+  {
+    return 0;
+  }
 
   QMutexLocker locker(&this->mPolyDataMutex);
-  this->mPolyData = polyData;
-  this->mUtime = message.utime;
+  if (!mFrameCount)
+  {
+    return 0;
+  }
+
+  this->copyFrames(QList<int>() << mLastFrame, polyData);
+  return mFrames[mLastFrame].Utime;
 }
 
 
 //-----------------------------------------------------------------------------
 qint64 ddPointCloudLCM::getPointCloudFromPointCloud(vtkPolyData* polyDataRender)
 {
-  QMutexLocker locker(&this->mPolyDataMutex);
-  polyDataRender->ShallowCopy(this->mPolyData);
-  return this->mUtime;
+  return this->getLatestFrame(polyDataRender);
 }
 
+
+//-----------------------------------------------------------------------------
+bool ddPointCloudLCM::getFrameTransform(qint64 utime, vtkTransform* transform)
+{
+  if (!transform)
+  {
+    return false;
+  }
+
+  QMutexLocker locker(&this->mPolyDataMutex);
+  const int index = this->findFrame(utime);
+  if (index < 0)
+  {
+    return false;
+  }
+
+  vtkSmartPointer<vtkMatrix4x4> vtkmat = vtkSmartPointer<vtkMatrix4x4>::New();
+  vtkmat->DeepCopy(mFrames[index].SensorToTarget);
+  transform->SetMatrix(vtkmat);
+  return true;
+}
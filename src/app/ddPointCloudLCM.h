@@ -2,6 +2,8 @@
 #define __ddPointCloudLCM_h
 
 #include <QObject>
+#include <QList>
+#include <QVector>
 
 #include "ddLCMThread.h"
 #include "ddLCMSubscriber.h"
@@ -15,10 +17,22 @@
 #include <vtkPointData.h>
 #include <vtkUnsignedIntArray.h>
 #include <vtkFloatArray.h>
+#include <vtkTransform.h>
 
 #include <lcm/lcm-cpp.hpp>
 #include <lcmtypes/drc/pointcloud2_t.hpp>
 
+#include <bot_param/param_client.h>
+#include <bot_frames/bot_frames.h>
+
+// Keeps a bounded history of decoded point cloud frames, indexed by utime.
+// Each frame is stored in float32 buffers that are allocated once and reused
+// when the slot is overwritten.  When the transform is enabled the points
+// are moved from the sensor frame to the target frame (local by default)
+// at decode time, using the bot frames transform at the message utime.
+// The query methods copy into the arrays of the given vtkPolyData and reuse
+// them when they are large enough, so polling does not allocate per frame.
+
 class DD_APP_EXPORT ddPointCloudLCM : public QObject
 {
   Q_OBJECT
@@ -26,10 +40,36 @@ class DD_APP_EXPORT ddPointCloudLCM : public QObject
 public:
 
   ddPointCloudLCM(QObject* parent=NULL);
-  
+
   void init(ddLCMThread* lcmThread, const QString& botConfigFile);
+
+  // Same as getLatestFrame, kept for existing callers.
   qint64 getPointCloudFromPointCloud(vtkPolyData* polyDataRender);
 
+  // Number of frames kept in the history, default 10.  Changing the length
+  // clears the history.
+  void setHistoryLength(int length);
+  int historyLength() const;
+
+  void setCoordinateFrames(const QString& sensorFrame, const QString& targetFrame);
+  void setTransformEnabled(bool enabled);
+  bool transformEnabled() const;
+
+  // Utimes of the frames in the history, oldest first.
+  QList<double> frameUtimes() const;
+
+  // These return the utime of the copied frame, or 0 if the history is empty.
+  qint64 getLatestFrame(vtkPolyData* polyData);
+  qint64 getFrameAtUtime(qint64 utime, vtkPolyData* polyData);
+
+  // Copies the sensor to target frame transform that was applied to the
+  // frame closest to utime.  Returns false if the history is empty.
+  bool getFrameTransform(qint64 utime, vtkTransform* transform);
+
+  // Merges all frames with startUtime <= utime <= endUtime into one
+  // polydata.  Returns the number of merged frames.
+  int getMergedFrames(qint64 startUtime, qint64 endUtime, vtkPolyData* polyData);
+
 protected slots:
 
   void onPointCloudFrame(const QByteArray& data, const QString& channel);
@@ -37,11 +77,35 @@ protected slots:
 
 protected:
 
+  struct Frame
+  {
+    qint64 Utime;
+    vtkIdType NumberOfPoints;
+    double SensorToTarget[16];
+    vtkSmartPointer<vtkFloatArray> Points;
+    vtkSmartPointer<vtkFloatArray> Intensity;
+    vtkSmartPointer<vtkUnsignedIntArray> Ring;
+  };
+
+  void resetHistory(int length);
+  int findFrame(qint64 utime) const;
+  int frameIndex(int i) const;
+  void copyFrames(const QList<int>& indices, vtkPolyData* polyData) const;
+  bool getSensorToTarget(qint64 utime, double matx[16]);
+
   ddLCMThread* mLCM;
 
-  vtkSmartPointer<vtkPolyData> mPolyData;
-  int64_t mUtime;
-  QMutex mPolyDataMutex;
+  BotParam* mBotParam;
+  BotFrames* mBotFrames;
+  std::string mSensorFrame;
+  std::string mTargetFrame;
+  bool mTransformEnabled;
+
+  // ring buffer of frames, mFrameCount valid entries ending at mLastFrame
+  QVector<Frame> mFrames;
+  int mFrameCount;
+  int mLastFrame;
+  mutable QMutex mPolyDataMutex;
 
 };
 
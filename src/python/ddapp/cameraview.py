@@ -18,6 +18,8 @@ import numpy as np
 from ddapp.simpletimer import SimpleTimer
 from ddapp import ioUtils
 import sys
+import time
+import weakref
 import drc as lcmdrc
 import multisense as lcmmultisense
 
@@ -106,13 +108,74 @@ def rayDebug(position, ray):
     obj.actor.GetProperty().SetLineWidth(2)
 
 
+class ImageConsumer(object):
+    '''
+    Registers interest in an image managed by an ImageManager.  The image is
+    only decoded while at least one of its consumers is active, at the
+    highest targetFps requested by the active consumers.  isActive is an
+    optional function, for example the isVisible method of the view that
+    displays the image.  A shrinkFactor > 1 gives the consumer a reduced
+    resolution copy of the image, suitable for thumbnails.
+    '''
+
+    def __init__(self, imageManager, imageName, isActive=None, targetFps=60, shrinkFactor=1):
+
+        self.imageManager = imageManager
+        self.imageName = imageName
+        self.isActiveFunc = isActive
+        self.targetFps = targetFps
+        self.enabled = True
+        self.updateUtime = 0
+
+        self.shrink = None
+        if shrinkFactor > 1:
+            self.shrink = vtk.vtkImageShrink3D()
+            self.shrink.SetShrinkFactors(shrinkFactor, shrinkFactor, 1)
+            self.shrink.AveragingOn()
+            self.shrink.SetInput(imageManager.getImage(imageName))
+
+    def isActive(self):
+        return self.enabled and (self.isActiveFunc is None or bool(self.isActiveFunc()))
+
+    def getImage(self):
+        if self.shrink:
+            return self.shrink.GetOutput()
+        return self.imageManager.getImage(self.imageName)
+
+    def setImageName(self, imageName):
+        self.imageManager.removeConsumer(self)
+        self.imageName = imageName
+        self.updateUtime = 0
+        self.imageManager.addConsumer(self)
+        if self.shrink:
+            self.shrink.SetInput(self.imageManager.getImage(imageName))
+
+    def update(self):
+        '''
+        Returns True if a new image has been decoded since the last call.
+        '''
+        if not self.isActive():
+            return False
+
+        utime = self.imageManager.updateImage(self.imageName)
+        if utime == self.updateUtime:
+            return False
+
+        self.updateUtime = utime
+        if self.shrink:
+            self.shrink.Update()
+        return True
+
+
 class ImageManager(object):
 
     def __init__(self):
 
         self.images = {}
         self.imageUtimes = {}
+        self.imageDecodeTimes = {}
         self.textures = {}
+        self.consumers = {}
 
         self.queue = PythonQt.dd.ddBotImageQueue(lcmUtils.getGlobalLCMThread())
         self.queue.init(lcmUtils.getGlobalLCMThread(), drcargs.args().config_file)
@@ -130,21 +193,66 @@ class ImageManager(object):
         tex.RepeatOff()
 
         self.imageUtimes[name] = 0
+        self.imageDecodeTimes[name] = 0.0
         self.images[name] = image
         self.textures[name] = tex
 
+    def addConsumer(self, consumer):
+        '''
+        Registers an ImageConsumer.  Once an image has registered consumers,
+        updateImage only decodes it when one of them is active.
+        '''
+        self.addImage(consumer.imageName)
+        consumers = self.consumers.setdefault(consumer.imageName, [])
+        if consumer not in consumers:
+            consumers.append(consumer)
+        return consumer
+
+    def removeConsumer(self, consumer):
+        consumers = self.consumers.get(consumer.imageName, [])
+        if consumer in consumers:
+            consumers.remove(consumer)
+
+    def createConsumer(self, imageName, isActive=None, targetFps=60, shrinkFactor=1):
+        self.addImage(imageName)
+        return self.addConsumer(ImageConsumer(self, imageName, isActive, targetFps, shrinkFactor))
+
+    def getActiveConsumers(self, imageName):
+        return [consumer for consumer in self.consumers.get(imageName, []) if consumer.isActive()]
+
+    def isUpdateDue(self, imageName):
+        '''
+        Returns True if the image should be decoded now.  Images without
+        registered consumers are always decoded on request.
+        '''
+        if not self.consumers.get(imageName):
+            return True
+
+        activeConsumers = self.getActiveConsumers(imageName)
+        if not activeConsumers:
+            return False
+
+        targetFps = max(consumer.targetFps for consumer in activeConsumers)
+        return time.time() - self.imageDecodeTimes[imageName] >= 1.0/targetFps
+
     def writeImage(self, imageName, outFile):
         writer = vtk.vtkPNGWriter()
         writer.SetInput(self.images[imageName])
         writer.SetFileName(outFile)
         writer.Write()
 
-    def updateImage(self, imageName):
+    def updateImage(self, imageName, force=False):
+        '''
+        Decodes the latest image into the vtkImageData if it has changed and
+        an update is due, or force is True.  Returns the utime of the image
+        currently held in the vtkImageData.
+        '''
         imageUtime = self.queue.getCurrentImageTime(imageName)
-        if imageUtime != self.imageUtimes[imageName]:
+        if imageUtime != self.imageUtimes[imageName] and (force or self.isUpdateDue(imageName)):
             image = self.images[imageName]
             self.imageUtimes[imageName] = self.queue.getImage(imageName, image)
-        return imageUtime
+            self.imageDecodeTimes[imageName] = time.time()
+        return self.imageUtimes[imageName]
 
     def updateImages(self):
         for imageName in self.images.keys():
@@ -162,12 +270,33 @@ class ImageManager(object):
     def getTexture(self, imageName):
         return self.textures[imageName]
 
+    def getTransforms(self, fromFrames, toFrames, utimes, interpolate=False):
+        '''
+        Returns an Nx4x4 array of fromFrame to toFrame transforms evaluated
+        at each of the N utimes, in a single call to the image queue.  The
+        frame arguments are a frame name or a list of N frame names.
+        Transforms that are not available are filled with NaN.  With
+        interpolate the transforms are interpolated between samples spaced
+        by queue.transformInterpolationInterval(), which is faster for many
+        nearby utimes, for example when deskewing a sweep.
+        '''
+        if isinstance(fromFrames, basestring):
+            fromFrames = [fromFrames]
+        if isinstance(toFrames, basestring):
+            toFrames = [toFrames]
+
+        utimes = np.ascontiguousarray(utimes, dtype=np.int64).reshape(-1)
+        data = self.queue.getTransforms(list(fromFrames), list(toFrames), utimes.tostring(), interpolate)
+        return np.frombuffer(data.data(), dtype=np.float64).reshape(-1, 4, 4)
+
 
 def disableCameraTexture(obj):
     obj.actor.SetTexture(None)
     obj.actor.GetProperty().LightingOn()
     obj.actor.GetProperty().SetColor(obj.getProperty('Color'))
 
+_cameraTextureBuffers = weakref.WeakKeyDictionary()
+
 def applyCameraTexture(obj, imageManager, imageName='CAMERA_LEFT'):
 
     imageUtime = imageManager.getUtime(imageName)
@@ -177,8 +306,9 @@ def applyCameraTexture(obj, imageManager, imageName='CAMERA_LEFT'):
     cameraToLocal = vtk.vtkTransform()
     imageManager.queue.getTransform(imageName, 'local', imageUtime, cameraToLocal)
 
-    pd = filterUtils.transformPolyData(obj.polyData, obj.actor.GetUserTransform())
-    pd = filterUtils.transformPolyData(pd, cameraToLocal.GetLinearInverse())
+    objToCamera = transformUtils.concatenateTransforms([obj.actor.GetUserTransform(), cameraToLocal.GetLinearInverse()])
+    pd = filterUtils.transformPolyData(obj.polyData, objToCamera, output=_cameraTextureBuffers.get(obj))
+    _cameraTextureBuffers[obj] = pd
 
     imageManager.queue.computeTextureCoords(imageName, pd)
 
@@ -200,18 +330,17 @@ class CameraView(object):
     def __init__(self, imageManager, view=None):
 
         self.imageManager = imageManager
-        self.updateUtimes = {}
         self.sphereObjects = {}
         self.sphereImages = [
                 'CAMERA_LEFT',
                 'CAMERACHEST_RIGHT',
                 'CAMERACHEST_LEFT']
 
-        for name in self.sphereImages:
-            imageManager.addImage(name)
-            self.updateUtimes[name] = 0
-
         self.initView(view)
+
+        self.imageConsumers = {}
+        for name in self.sphereImages:
+            self.imageConsumers[name] = imageManager.createConsumer(name, isActive=self.view.isVisible)
         self.initEventFilter()
         self.rayCallback = rayDebug
 
@@ -343,10 +472,8 @@ class CameraView(object):
     def updateImages(self):
 
         updated = False
-        for imageName, lastUtime in self.updateUtimes.iteritems():
-            currentUtime = self.imageManager.updateImage(imageName)
-            if currentUtime != lastUtime:
-                self.updateUtimes[imageName] = currentUtime
+        for consumer in self.imageConsumers.values():
+            if consumer.update():
                 updated = True
 
         return updated
@@ -365,12 +492,11 @@ class CameraView(object):
 
 class ImageWidget(object):
 
-    def __init__(self, imageManager, imageName, view):
+    def __init__(self, imageManager, imageName, view, shrinkFactor=1):
         self.view = view
         self.imageManager = imageManager
         self.imageName = imageName
 
-        self.updateUtime = 0
         self.initialized = False
 
         self.imageWidget = vtk.vtkLogoWidget()
@@ -378,9 +504,11 @@ class ImageWidget(object):
         rep.GetImageProperty().SetOpacity(1.0)
         self.imageWidget.SetInteractor(self.view.renderWindow().GetInteractor())
 
+        self.imageConsumer = imageManager.createConsumer(imageName, isActive=self.isImageVisible, shrinkFactor=shrinkFactor)
+
         self.flip = vtk.vtkImageFlip()
         self.flip.SetFilteredAxis(1)
-        self.flip.SetInput(imageManager.getImage(imageName))
+        self.flip.SetInput(self.imageConsumer.getImage())
         rep.SetImage(self.flip.GetOutput())
 
         self.timerCallback = TimerCallback()
@@ -395,18 +523,16 @@ class ImageWidget(object):
     def show(self):
         self.imageWidget.On()
 
-    def updateView(self):
+    def isImageVisible(self):
+        return self.view.isVisible() and (self.imageWidget.GetEnabled() or not self.initialized)
 
-        if not self.view.isVisible():
-            return
+    def updateView(self):
 
-        currentUtime = self.imageManager.updateImage(self.imageName)
-        if currentUtime != self.updateUtime:
+        if self.imageConsumer.update():
             if not self.initialized:
                 self.show()
                 self.initialized = True
 
-            self.updateUtime = currentUtime
             self.flip.Update()
             self.view.render()
 
@@ -421,7 +547,6 @@ class CameraImageView(object):
         self.viewName = viewName or imageName
         self.imageName = imageName
         self.imageInitialized = False
-        self.updateUtime = 0
         self.initView(view)
         self.initEventFilter()
 
@@ -490,6 +615,8 @@ class CameraImageView(object):
         self.interactorStyle = self.view.renderWindow().GetInteractor().GetInteractorStyle()
         self.interactorStyle.AddObserver('SelectionChangedEvent', self.onRubberBandPick)
 
+        self.imageConsumer = self.imageManager.createConsumer(self.imageName, isActive=self.view.isVisible)
+
         self.imageActor = vtk.vtkImageActor()
         self.imageActor.SetInput(self.getImage())
         self.imageActor.SetVisibility(False)
@@ -538,19 +665,14 @@ class CameraImageView(object):
 
         self.imageName = imageName
         self.imageInitialized = False
-        self.updateUtime = 0
+        self.imageConsumer.setImageName(imageName)
         self.imageActor.SetInput(self.imageManager.getImage(self.imageName))
         self.imageActor.SetVisibility(False)
         self.view.render()
 
     def updateView(self):
 
-        if not self.view.isVisible():
-            return
-
-        currentUtime = self.imageManager.updateImage(self.imageName)
-        if currentUtime != self.updateUtime:
-            self.updateUtime = currentUtime
+        if self.imageConsumer.update():
             self.view.render()
 
             if not self.imageInitialized and self.imageActor.GetInput().GetDimensions()[0]:
@@ -658,22 +780,240 @@ def getStereoPointCloud(decimation=4, imagesChannel='CAMERA', cameraName='CAMERA
 
     q.getPointCloudFromImages(imagesChannel, p, decimation, removeSize)
     q.getTransform('CAMERA_LEFT', 'local', utime, cameraToLocal)
-    p = filterUtils.transformPolyData(p, cameraToLocal)
+    p = filterUtils.transformPolyData(p, cameraToLocal, inPlace=True)
 
     return p
 
 
 
+class FusedPointCloudMap(object):
+    '''
+    Accumulates stereo point clouds into a single voxel deduplicated map.
+
+    Each cloud is transformed into the fused (CAMERA_LEFT_ALT) frame exactly
+    once, at insert time.  Points that fall into an already occupied voxel
+    are discarded.  Occupied voxels are kept in a sorted key array, and the
+    points, colors and vertex cells of the map live in buffers that grow
+    geometrically, so an insert only touches the new points.  When the
+    total number of points exceeds maxPoints, the oldest clouds are
+    downsampled to coarser voxel sizes, and dropped altogether once they
+    reach maxDownsampleLevel; the voxels of discarded points become free.
+    '''
+
+    class CloudData(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    _keyOffset = 2**20
+
+    def __init__(self, voxelSize=0.02, maxPoints=2000000, maxDownsampleLevel=3):
+
+        self.voxelSize = voxelSize
+        self.maxPoints = maxPoints
+        self.maxDownsampleLevel = maxDownsampleLevel
+
+        self.clouds = []
+        self.occupiedKeys = np.zeros(0, dtype=np.int64)
+        self.numberOfPoints = 0
+        self.pointBuffer = np.zeros((0, 3))
+        self.colorBuffer = None
+        self.vertexIds = np.zeros(0, dtype=vtkNumpy.numpy_support.ID_TYPE_CODE)
+        self.polyData = vtk.vtkPolyData()
+
+    @property
+    def points(self):
+        return self.pointBuffer[:self.numberOfPoints]
+
+    @property
+    def colors(self):
+        return self.colorBuffer[:self.numberOfPoints] if self.colorBuffer is not None else None
+
+    def _computeVoxelKeys(self, points, voxelSize):
+        '''
+        Packs the integer voxel coordinates of each point into one int64 key,
+        21 bits per axis.
+        '''
+        ijk = np.floor(points / voxelSize).astype(np.int64) + self._keyOffset
+        return (ijk[:,0] << 42) | (ijk[:,1] << 21) | ijk[:,2]
+
+    def getNumberOfPoints(self):
+        return self.numberOfPoints
+
+    def _findOccupiedKeys(self, keys):
+        '''
+        Returns the insert positions of the sorted keys in occupiedKeys and
+        a mask of the keys that are already occupied.
+        '''
+        positions = np.searchsorted(self.occupiedKeys, keys)
+        if not len(self.occupiedKeys):
+            return positions, np.zeros(len(keys), dtype=bool)
+        return positions, self.occupiedKeys[np.minimum(positions, len(self.occupiedKeys) - 1)] == keys
+
+    def _removeOccupiedKeys(self, keys):
+        positions, found = self._findOccupiedKeys(np.sort(keys))
+        self.occupiedKeys = np.delete(self.occupiedKeys, positions[found])
+
+    def addCloud(self, polyData, cameraToLocalFused):
+        '''
+        Inserts the camera frame polyData into the map using the
+        cameraToLocalFused transform.  Returns the number of points added.
+        '''
+        points = vtkNumpy.getNumpyFromVtk(polyData, 'Points')
+        if not len(points):
+            return 0
+
+        mat = transformUtils.getNumpyFromTransform(cameraToLocalFused)
+        points = np.dot(points, mat[:3,:3].T) + mat[:3,3]
+
+        keys, inds = np.unique(self._computeVoxelKeys(points, self.voxelSize), return_index=True)
+        positions, occupied = self._findOccupiedKeys(keys)
+        isNew = np.logical_not(occupied)
+        keys, inds, positions = keys[isNew], inds[isNew], positions[isNew]
+
+        colors = None
+        if polyData.GetPointData().GetArray('rgb_colors'):
+            colors = vtkNumpy.getNumpyFromVtk(polyData, 'rgb_colors')[inds]
+
+        cloud = FusedPointCloudMap.CloudData(
+            points=points[inds],
+            colors=colors,
+            keys=keys,
+            downsampleLevel=0)
+
+        self.clouds.append(cloud)
+        self.occupiedKeys = np.insert(self.occupiedKeys, positions, keys)
+
+        if self._enforceMemoryBudget():
+            self._concatenateClouds()
+        else:
+            self._appendCloud(cloud)
+
+        self._updatePolyData()
+        return len(inds)
+
+    def _downsampleCloud(self, cloud):
+
+        cloud.downsampleLevel += 1
+        voxelSize = self.voxelSize * 2**cloud.downsampleLevel
+        _, inds = np.unique(self._computeVoxelKeys(cloud.points, voxelSize), return_index=True)
+
+        dropped = np.ones(len(cloud.points), dtype=bool)
+        dropped[inds] = False
+        self._removeOccupiedKeys(cloud.keys[dropped])
+
+        cloud.points = cloud.points[inds]
+        cloud.keys = cloud.keys[inds]
+        if cloud.colors is not None:
+            cloud.colors = cloud.colors[inds]
+
+    def _enforceMemoryBudget(self):
+        '''
+        Downsamples or drops the oldest clouds until the map fits in
+        maxPoints.  The most recent cloud is always kept at full resolution.
+        Returns True if any cloud was modified.
+        '''
+        numberOfPoints = sum(len(cloud.points) for cloud in self.clouds)
+        modified = False
+
+        while numberOfPoints > self.maxPoints and len(self.clouds) > 1:
+
+            modified = True
+            cloud = min(self.clouds[:-1], key=lambda c: c.downsampleLevel)
+            numberOfPoints -= len(cloud.points)
+
+            if cloud.downsampleLevel < self.maxDownsampleLevel:
+                self._downsampleCloud(cloud)
+                numberOfPoints += len(cloud.points)
+            else:
+                self.clouds.remove(cloud)
+                self._removeOccupiedKeys(cloud.keys)
+
+        return modified
+
+    def _reserve(self, numberOfPoints, colorDtype=None):
+        '''
+        Grows the buffers to hold at least numberOfPoints points.  The
+        capacity at least doubles, so appends are amortized constant time
+        per point.
+        '''
+        capacity = len(self.pointBuffer)
+        if numberOfPoints <= capacity:
+            return
+
+        capacity = max(numberOfPoints, 2*capacity, 1024)
+        n = self.numberOfPoints
+
+        pointBuffer = np.empty((capacity, 3))
+        pointBuffer[:n] = self.pointBuffer[:n]
+        self.pointBuffer = pointBuffer
+
+        if colorDtype is not None:
+            colorBuffer = np.empty((capacity, 3), dtype=colorDtype)
+            colorBuffer[:n] = self.colorBuffer[:n]
+            self.colorBuffer = colorBuffer
+
+        # one vertex cell per point, the ids never change so old cell arrays
+        # that share a previous buffer stay valid
+        vertexIds = np.empty((capacity, 2), dtype=vtkNumpy.numpy_support.ID_TYPE_CODE)
+        vertexIds[:,0] = 1
+        vertexIds[:,1] = np.arange(capacity)
+        self.vertexIds = vertexIds.reshape(-1)
+
+    def _appendCloud(self, cloud):
+
+        n = self.numberOfPoints
+        if n == 0 or cloud.colors is None:
+            self.colorBuffer = None if cloud.colors is None else np.zeros((0, 3), dtype=cloud.colors.dtype)
+
+        count = len(cloud.points)
+        self._reserve(n + count, self.colorBuffer.dtype if self.colorBuffer is not None else None)
+
+        self.pointBuffer[n:n+count] = cloud.points
+        if self.colorBuffer is not None:
+            self.colorBuffer[n:n+count] = cloud.colors
+        self.numberOfPoints = n + count
+
+    def _concatenateClouds(self):
+
+        self.numberOfPoints = 0
+        self.pointBuffer = np.zeros((0, 3))
+        self.colorBuffer = None
+        for cloud in self.clouds:
+            self._appendCloud(cloud)
+
+    def _updatePolyData(self):
+        '''
+        Points the polyData at the current buffer contents.  No point data is
+        copied, the vtk arrays reference the buffers.
+        '''
+        n = self.numberOfPoints
+        polyData = self.polyData
+
+        points = vtk.vtkPoints()
+        points.SetData(vtkNumpy.getVtkFromNumpy(self.pointBuffer[:n]))
+        polyData.SetPoints(points)
+
+        verts = vtk.vtkCellArray()
+        verts.SetCells(n, vtkNumpy.getVtkIdTypeArrayFromNumpy(self.vertexIds[:2*n]))
+        polyData.SetVerts(verts)
+
+        polyData.GetPointData().RemoveArray('rgb_colors')
+        if self.colorBuffer is not None:
+            vtkNumpy.addNumpyToVtk(polyData, self.colorBuffer[:n], 'rgb_colors')
+
+        polyData.Modified()
+
+
 class KintinuousMapping(object):
 
-    def __init__(self):
+    def __init__(self, voxelSize=0.02, maxPoints=2000000):
 
         self.lastUtime = 0
         self.lastCameraToLocal = vtk.vtkTransform()
 
-        self.cameraToLocalFusedTransforms = []
-        self.cameraToLocalTransforms = []
-        self.pointClouds = []
+        self.fusedMap = FusedPointCloudMap(voxelSize, maxPoints)
+        self.fusedMapTransform = vtk.vtkTransform()
+        self.lastCameraToLocalFused = None
 
     def getStereoPointCloudElapsed(self,decimation=4, imagesChannel='CAMERA', cameraName='CAMERA_LEFT', removeSize=0):
         q = imageManager.queue
@@ -708,45 +1048,41 @@ class KintinuousMapping(object):
         self.lastUtime = utime
         return p, cameraToLocalFused, cameraToLocal
 
-
-    def showFusedMaps(self):
-        om.removeFromObjectModel(om.findObjectByName('stereo'))
-        om.getOrCreateContainer('stereo')
-
+    def updateFusedMapTransform(self):
+        '''
+        The map points are stored in the fused frame, so compensating for
+        fusion motion estimation only requires updating the actor transform
+        fusedNowToLocalNow.  No points are re-transformed.
+        '''
         q = imageManager.queue
-        cameraToLocalNow = vtk.vtkTransform()
         utime = q.getCurrentImageTime('CAMERA_TSDF')
 
+        cameraToLocalNow = vtk.vtkTransform()
         q.getTransform('CAMERA_LEFT','local', utime,cameraToLocalNow)
         cameraToLocalFusedNow = vtk.vtkTransform()
         q.getTransform('CAMERA_LEFT_ALT','local', utime,cameraToLocalFusedNow)
 
-        for i in range(len(self.pointClouds)):
+        fusedNowToLocalNow = vtk.vtkTransform()
+        fusedNowToLocalNow.PreMultiply()
+        fusedNowToLocalNow.Concatenate( cameraToLocalNow)
+        fusedNowToLocalNow.Concatenate( cameraToLocalFusedNow.GetLinearInverse() )
 
-            fusedNowToLocalNow = vtk.vtkTransform()
-            fusedNowToLocalNow.PreMultiply()
-            fusedNowToLocalNow.Concatenate( cameraToLocalNow)
-            fusedNowToLocalNow.Concatenate( cameraToLocalFusedNow.GetLinearInverse() )
+        self.fusedMapTransform.SetMatrix(fusedNowToLocalNow.GetMatrix())
 
+    def showFusedMaps(self):
 
-            fusedTransform = vtk.vtkTransform()
-            fusedTransform.PreMultiply()
-            fusedTransform.Concatenate( fusedNowToLocalNow)
-            fusedTransform.Concatenate( self.cameraToLocalFusedTransforms[i] )
-
-            pd = filterUtils.transformPolyData(self.pointClouds[i], fusedTransform)
-            vis.showFrame(fusedTransform, ('cloud frame ' + str(i)), visible=True, scale=0.2, parent='stereo')
-            vis.showPolyData(pd, ('stereo ' + str(i)), parent='stereo', colorByName='rgb_colors')
+        self.updateFusedMapTransform()
 
-            # Without compensation for fusion motion estimation:
-            #pd = filterUtils.transformPolyData(self.pointClouds[i], self.cameraToLocalTransforms[i])
-            #vis.showFrame(self.cameraToLocalTransforms[i], ('cloud frame ' + str(i)), visible=True, scale=0.2)
-            #vis.showPolyData(pd, ('stereo ' + str(i)) )
+        obj = om.findObjectByName('stereo fused map')
+        if obj is None:
+            obj = vis.showPolyData(self.fusedMap.polyData, 'stereo fused map', parent='stereo', colorByName='rgb_colors')
+            obj.actor.SetUserTransform(self.fusedMapTransform)
+        else:
+            obj.setPolyData(self.fusedMap.polyData)
 
-            # in fusion coordinate frame:
-            #pd = filterUtils.transformPolyData(self.pointClouds[i], self.cameraToLocalFusedTransforms[i])
-            #vis.showFrame(self.cameraToLocalFusedTransforms[i], ('cloud frame ' + str(i)), visible=True, scale=0.2)
-            #vis.showPolyData(pd, ('stereo ' + str(i)) )
+        if self.lastCameraToLocalFused is not None:
+            cloudFrame = transformUtils.concatenateTransforms([self.lastCameraToLocalFused, self.fusedMapTransform])
+            vis.updateFrame(cloudFrame, 'cloud frame', visible=True, scale=0.2, parent='stereo')
 
     def cameraFusedCallback(self):
         #pd = cameraview.getStereoPointCloud(2,"CAMERA_FUSED")
@@ -756,16 +1092,8 @@ class KintinuousMapping(object):
         if (pd is None):
             return
 
-        self.pointClouds.append(pd)
-        self.cameraToLocalFusedTransforms.append( cameraToLocalFused )
-        self.cameraToLocalTransforms.append( cameraToLocal )
-
-        #pdCopy = vtk.vtkPolyData()
-        #pdCopy.DeepCopy(pd)
-        #cameraToLocalCopy = transformUtils.copyFrame(cameraToLocalFused)
-        #pdCopy = filterUtils.transformPolyData(pdCopy, cameraToLocalCopy)
-        #vis.showFrame(cameraToLocalCopy, 'cloud frame', visible=True, scale=0.2)
-        #vis.showPolyData(pdCopy,'stereo')
+        self.fusedMap.addCloud(pd, cameraToLocalFused)
+        self.lastCameraToLocalFused = cameraToLocalFused
 
         self.showFusedMaps()
 
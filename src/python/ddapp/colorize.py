@@ -1,8 +1,16 @@
 import ddapp.applogic as app
 import ddapp.objectmodel as om
 from ddapp import cameraview
-
+from ddapp import vtkNumpy
+from ddapp import transformUtils
+from ddapp.timercallback import TimerCallback
+import ddapp.vtkAll as vtk
+
+import numpy as np
+import threading
+import Queue
 import functools
+import traceback
 
 actionName = 'ActionColorizeLidar'
 
@@ -23,10 +31,299 @@ def setVisProperties(obj, colorModeEnabled):
     obj.setProperty('Point Size', pointSize)
 
 
-def colorizePoints(polyData):
-    cameras = ['CAMERACHEST_RIGHT', 'CAMERACHEST_LEFT', 'CAMERA_LEFT']
-    for camera in cameras:
-        cameraview.colorizePoints(polyData, camera)
+class WorkerError(object):
+    def __init__(self, message):
+        self.message = message
+
+
+class PointCloudColorizer(object):
+    '''
+    Colorizes point clouds from several cameras at once.
+
+    Points are identified by their position quantized to pointIdResolution,
+    and the color of each point is cached together with the utime of the
+    image that colored it.  On each pass only points that are not in the
+    cache, or that have not yet been seen by any camera, are recolored.
+    Those points are transformed into every camera frame with a single
+    batched product and culled against each camera frustum, so only points
+    inside a frustum are projected.  Cameras are applied in order, later
+    cameras overwrite earlier ones.
+
+    If useWorkerThread is True, the hashing, cache lookup and culling runs
+    on a worker thread and the projection and color update are completed on
+    the main thread.
+    '''
+
+    class CameraState(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    _keyOffset = 2**20
+
+    def __init__(self, imageManager, cameras=None, pointIdResolution=0.01, maxCacheSize=4000000, useWorkerThread=False):
+
+        self.imageManager = imageManager
+        self.cameras = cameras or ['CAMERACHEST_RIGHT', 'CAMERACHEST_LEFT', 'CAMERA_LEFT']
+        self.vignetteCameras = ['CAMERACHEST_LEFT', 'CAMERACHEST_RIGHT']
+        self.pointIdResolution = pointIdResolution
+        self.maxCacheSize = maxCacheSize
+
+        self.cacheKeys = np.zeros(0, dtype=np.int64)
+        self.cacheColors = np.zeros((0, 3), dtype=np.uint8)
+        self.cacheUtimes = np.zeros(0, dtype=np.int64)
+
+        self.useWorkerThread = useWorkerThread
+        self.pendingRequest = None
+        self.workerBusy = False
+        self.resultQueue = Queue.Queue()
+        self.timer = TimerCallback(targetFps=30)
+        self.timer.callback = self._checkWorkerResult
+
+    def clearCache(self):
+        self.cacheKeys = np.zeros(0, dtype=np.int64)
+        self.cacheColors = np.zeros((0, 3), dtype=np.uint8)
+        self.cacheUtimes = np.zeros(0, dtype=np.int64)
+
+    def _computePointIds(self, points):
+        ijk = np.floor(points / self.pointIdResolution).astype(np.int64) + self._keyOffset
+        return (ijk[:,0] << 42) | (ijk[:,1] << 21) | ijk[:,2]
+
+    def _getCameraState(self, cameraName):
+
+        imageManager = self.imageManager
+        if not imageManager.hasImage(cameraName):
+            imageManager.addImage(cameraName)
+
+        utime = imageManager.updateImage(cameraName, force=True)
+        image = imageManager.getImage(cameraName)
+        width, height, _ = image.GetDimensions()
+        if not utime or not width:
+            return None
+
+        rays = np.array(imageManager.queue.getCameraFrustumBounds(cameraName))
+        if not len(rays):
+            return None
+        rays = rays.reshape(4, 3)
+
+        cameraToLocal = vtk.vtkTransform()
+        imageManager.queue.getTransform(cameraName, 'local', utime, cameraToLocal)
+        localToCamera = np.linalg.inv(transformUtils.getNumpyFromTransform(cameraToLocal))
+
+        # inward facing normals of the four frustum side planes
+        normals = np.cross(rays, np.roll(rays, -1, axis=0))
+        center = rays.sum(axis=0)
+        normals *= np.sign(np.dot(normals, center))[:,np.newaxis]
+
+        pixels = vtkNumpy.numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+
+        return PointCloudColorizer.CameraState(
+            name=cameraName,
+            utime=utime,
+            width=width,
+            height=height,
+            localToCamera=localToCamera,
+            planeNormals=np.vstack([normals, center]),
+            pixels=pixels.reshape(height, width, -1).copy())
+
+    def _cullPoints(self, points, cameraStates):
+        '''
+        Transforms points into all camera frames at once.  Returns the camera
+        frame points as a (cameras, points, 3) array and a boolean
+        (cameras, points) array of frustum membership.
+        '''
+        rotations = np.array([state.localToCamera[:3,:3] for state in cameraStates])
+        translations = np.array([state.localToCamera[:3,3] for state in cameraStates])
+        planeNormals = np.array([state.planeNormals for state in cameraStates])
+
+        cameraPoints = np.einsum('cij,nj->cni', rotations, points) + translations[:,np.newaxis,:]
+        inside = (np.einsum('ckj,cnj->cnk', planeNormals, cameraPoints) > 0).all(axis=2)
+        return cameraPoints, inside
+
+    def _lookupCache(self, keys):
+        '''
+        Returns the cache index of each key, and a mask of keys found in
+        the cache.
+        '''
+        inds = np.searchsorted(self.cacheKeys, keys)
+        inds[inds == len(self.cacheKeys)] = 0
+        found = self.cacheKeys[inds] == keys if len(self.cacheKeys) else np.zeros(len(keys), dtype=bool)
+        return inds, found
+
+    def _computeUpdate(self, points, cameraStates):
+
+        keys = self._computePointIds(points)
+        cacheInds, found = self._lookupCache(keys)
+        cachedUtimes = np.where(found, self.cacheUtimes[cacheInds] if len(self.cacheKeys) else 0, 0)
+        pendingInds = np.flatnonzero(cachedUtimes == 0)
+
+        if len(pendingInds) and cameraStates:
+            cameraPoints, inside = self._cullPoints(points[pendingInds], cameraStates)
+        else:
+            cameraPoints, inside = None, None
+
+        return keys, cacheInds, found, pendingInds, cameraPoints, inside
+
+    def _projectPoints(self, state, cameraPoints):
+        '''
+        Projects camera frame points with the camera model (including lens
+        distortion) of the native image queue.  Returns pixel coordinates.
+        '''
+        polyData = vtk.vtkPolyData()
+        polyData.SetPoints(vtkNumpy.getVtkPointsFromNumpy(cameraPoints.copy()))
+        self.imageManager.queue.projectPoints(state.name, polyData)
+        return vtkNumpy.getNumpyFromVtk(polyData, 'Points')[:,:2].copy()
+
+    def _sampleColors(self, state, pixels):
+
+        px = pixels[:,0].astype(np.int64)
+        py = pixels[:,1].astype(np.int64)
+        valid = (px >= 0) & (px < state.width) & (py >= 0) & (py < state.height)
+
+        if state.name in self.vignetteCameras:
+            u = pixels[:,0] / (state.width - 1)
+            v = pixels[:,1] / (state.height - 1)
+            valid &= ((0.5 - u)**2 + (0.5 - v)**2) <= 0.2
+
+        colors = state.pixels[py[valid], px[valid], :3]
+        return valid, colors
+
+    def _applyUpdate(self, polyData, cameraStates, update):
+
+        keys, cacheInds, found, pendingInds, cameraPoints, inside = update
+
+        colors = np.empty((len(keys), 3), dtype=np.uint8)
+        colors.fill(255)
+        utimes = np.zeros(len(keys), dtype=np.int64)
+
+        if found.any():
+            colors[found] = self.cacheColors[cacheInds[found]]
+            utimes[found] = self.cacheUtimes[cacheInds[found]]
+
+        for cameraIndex, state in enumerate(cameraStates if cameraPoints is not None else []):
+            insideInds = np.flatnonzero(inside[cameraIndex])
+            if not len(insideInds):
+                continue
+
+            pixels = self._projectPoints(state, cameraPoints[cameraIndex, insideInds])
+            valid, cameraColors = self._sampleColors(state, pixels)
+            pointInds = pendingInds[insideInds[valid]]
+            colors[pointInds] = cameraColors
+            utimes[pointInds] = state.utime
+
+        self._updateCache(keys, colors, utimes, found, cacheInds)
+
+        polyData.GetPointData().RemoveArray('rgb')
+        vtkNumpy.addNumpyToVtk(polyData, colors, 'rgb')
+
+    def _updateCache(self, keys, colors, utimes, found, cacheInds):
+
+        updated = found & (utimes != 0)
+        self.cacheColors[cacheInds[updated]] = colors[updated]
+        self.cacheUtimes[cacheInds[updated]] = utimes[updated]
+
+        newKeys, newInds = np.unique(keys[~found], return_index=True)
+        newInds = np.flatnonzero(~found)[newInds]
+
+        if len(self.cacheKeys) + len(newKeys) > self.maxCacheSize:
+            # keep only the points of the current cloud
+            self.clearCache()
+            newKeys, newInds = np.unique(keys, return_index=True)
+
+        keys = np.hstack([self.cacheKeys, newKeys])
+        order = np.argsort(keys, kind='mergesort')
+        self.cacheKeys = keys[order]
+        self.cacheColors = np.vstack([self.cacheColors, colors[newInds]])[order]
+        self.cacheUtimes = np.hstack([self.cacheUtimes, utimes[newInds]])[order]
+
+    def _getCameraStates(self):
+        return [state for state in [self._getCameraState(name) for name in self.cameras] if state is not None]
+
+    def colorize(self, polyData, callback=None):
+        '''
+        Adds or updates the rgb array of polyData.  When useWorkerThread is
+        enabled the work is completed asynchronously and callback is called
+        on the main thread when the colors are ready.
+        '''
+        if not polyData.GetNumberOfPoints():
+            return
+
+        cameraStates = self._getCameraStates()
+        points = vtkNumpy.getNumpyFromVtk(polyData, 'Points')
+
+        if not self.useWorkerThread:
+            self._applyUpdate(polyData, cameraStates, self._computeUpdate(points, cameraStates))
+            if callback:
+                callback()
+            return
+
+        request = (polyData, cameraStates, points.copy(), callback)
+        if self.workerBusy:
+            self.pendingRequest = request
+        else:
+            self._startWorker(request)
+
+    def _startWorker(self, request):
+
+        polyData, cameraStates, points, callback = request
+        self.workerBusy = True
+
+        def work():
+            try:
+                update = self._computeUpdate(points, cameraStates)
+            except Exception:
+                update = WorkerError(traceback.format_exc())
+            self.resultQueue.put((request, update))
+
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def _checkWorkerResult(self):
+
+        try:
+            request, update = self.resultQueue.get_nowait()
+        except Queue.Empty:
+            return
+
+        self.workerBusy = False
+        polyData, cameraStates, points, callback = request
+
+        if isinstance(update, WorkerError):
+            # report and keep polling, an exception would stop the timer
+            print 'PointCloudColorizer worker failed:\n' + update.message
+        else:
+            # the cache may have been cleared while the worker was running
+            cacheInds, found = self._lookupCache(update[0])
+            update = (update[0], cacheInds, found) + update[3:]
+
+            self._applyUpdate(polyData, cameraStates, update)
+            if callback:
+                callback()
+
+        # the next worker reads the cache, so it starts after the update
+        if self.pendingRequest is not None:
+            self._startWorker(self.pendingRequest)
+            self.pendingRequest = None
+
+        if not self.workerBusy:
+            return False
+
+
+_colorizers = {}
+
+def getColorizer(name='default'):
+    colorizer = _colorizers.get(name)
+    if colorizer is None:
+        colorizer = _colorizers[name] = PointCloudColorizer(cameraview.imageManager)
+    return colorizer
+
+
+def colorizePoints(polyData, colorizer=None):
+    colorizer = colorizer or getColorizer()
+    colorizer.colorize(polyData)
 
 
 def colorizeSegmentationLidar(enabled):
@@ -47,9 +344,12 @@ _colorizeMapNames = ['HEIGHT_MAP_SCENE', 'SCANS_HALF_SWEEP']
 
 def colorizeMapCallback(obj):
     if obj and obj.getProperty('Name') in _colorizeMapNames:
-        colorizePoints(obj.polyData)
-        obj._updateColorByProperty()
-        obj.setProperty('Color By', 'rgb')
+
+        def onColorized():
+            obj._updateColorByProperty()
+            obj.setProperty('Color By', 'rgb')
+
+        getColorizer(obj.getProperty('Name')).colorize(obj.polyData, onColorized)
 
 
 def colorizeMaps(enabled):
@@ -93,7 +393,7 @@ def initColorizeCallbacks():
     assert(obj)
 
     def callback():
-        colorizePoints(obj.model.polyDataObj.polyData)
+        colorizePoints(obj.model.polyDataObj.polyData, getColorizer('Multisense'))
 
     obj.model.colorizeCallback = callback
 
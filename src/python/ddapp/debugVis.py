@@ -1,6 +1,7 @@
 import vtkAll as vtk
 from vtkNumpy import addNumpyToVtk
 from shallowCopy import shallowCopy
+import ioUtils
 import numpy as np
 
 class DebugData(object):
@@ -9,11 +10,16 @@ class DebugData(object):
         self.append = vtk.vtkAppendPolyData()
 
 
-    def write(self, filename):
-        writer = vtk.vtkXMLPolyDataWriter()
-        writer.SetInputConnection(self.append.GetOutputPort())
-        writer.SetFileName(filename)
-        writer.Update()
+    def write(self, filename, useWorkerThread=False):
+        '''
+        Write the debug data to a file, the format is chosen by the
+        extension as in ioUtils.writePolyData.  If useWorkerThread is True the
+        file is written on a worker thread.
+        '''
+        if useWorkerThread:
+            ioUtils.writePolyDataAsync(self.getPolyData(), filename)
+        else:
+            ioUtils.writePolyData(self.getPolyData(), filename)
 
 
     def addPolyData(self, polyData, color=[1,1,1], extraLabels=None):
@@ -5,6 +5,7 @@ import drc as lcmdrc
 import bot_core as lcmbotcore
 import vtkAll as vtk
 from ddapp import transformUtils
+from ddapp import transformArrays
 from ddapp import visualization as vis
 from ddapp import objectmodel as om
 from ddapp import lcmUtils
@@ -777,9 +778,8 @@ class DrivingPlanner(object):
         transform.RotateZ(self.trajectoryAngle + angle)
         transform.Translate([self.trajectoryX, self.trajectoryY, 0])
 
-        for p in drivingTraj:
-            transformedPoint = np.asarray(transform.TransformPoint(p))
-            transformedDrivingTraj.append(transformedPoint)
+        if len(drivingTraj):
+            transformedDrivingTraj = list(transformArrays.transformPoints(transformArrays.matrixFromTransform(transform), drivingTraj))
 
         return transformedDrivingTraj
 
@@ -2,6 +2,7 @@
 
 import ddapp.vtkAll as vtk
 import ddapp.vtkNumpy as vnp
+from ddapp import transformArrays
 from ddapp.shallowCopy import shallowCopy
 import numpy as np
 
@@ -16,7 +17,7 @@ def thresholdPoints(polyData, arrayName, thresholdRange):
     return shallowCopy(f.GetOutput())
 
 
-def transformPolyData(polyData, transform):
+def _transformPolyDataWithFilter(polyData, transform):
 
     t = vtk.vtkTransformPolyDataFilter()
     t.SetTransform(transform)
@@ -25,6 +26,146 @@ def transformPolyData(polyData, transform):
     return shallowCopy(t.GetOutput())
 
 
+def _getOutputArray(inputArray, outputArray):
+    '''
+    Returns outputArray resized to match inputArray, or a new array of the
+    same type as inputArray if outputArray is missing or incompatible.
+    '''
+    if (outputArray is None or outputArray is inputArray
+          or outputArray.GetDataType() != inputArray.GetDataType()
+          or outputArray.GetNumberOfComponents() != inputArray.GetNumberOfComponents()):
+        outputArray = inputArray.NewInstance()
+        outputArray.SetNumberOfComponents(inputArray.GetNumberOfComponents())
+    outputArray.SetNumberOfTuples(inputArray.GetNumberOfTuples())
+    outputArray.SetName(inputArray.GetName())
+    return outputArray
+
+
+def _transformArray(inputArray, outputArray, rotation, translation=None, normalize=False):
+    '''
+    Computes rows of inputArray times rotation transposed, plus translation,
+    and writes them into the memory of outputArray.
+    '''
+    values = vnp.numpy_support.vtk_to_numpy(inputArray)
+    if not len(values):
+        return
+
+    out = vnp.numpy_support.vtk_to_numpy(outputArray)
+    rotationT = rotation.T.astype(values.dtype)
+
+    if outputArray is inputArray or values.dtype not in (np.float32, np.float64):
+        out[:] = np.dot(values, rotationT)
+    else:
+        np.dot(values, rotationT, out=out)
+
+    if translation is not None:
+        out += translation.astype(out.dtype)
+
+    if normalize:
+        norms = np.sqrt((out*out).sum(axis=1))
+        norms[norms == 0] = 1.0
+        out /= norms[:,np.newaxis]
+
+    outputArray.Modified()
+
+
+def transformPolyData(polyData, transform, output=None, inPlace=False):
+    '''
+    Returns a shallow copy of polyData with the transform applied to its
+    points, and to its normals and vectors in point data and cell data,
+    like vtkTransformPolyDataFilter.
+
+    Linear transforms are applied with a single numpy matrix product that
+    writes directly into the memory of the output vtk arrays.  Other
+    transforms use vtkTransformPolyDataFilter.
+
+    output may be a polyData previously returned by this function.  Its
+    arrays are reused when their type and size allow, so repeated calls do
+    not allocate.  If inPlace is True the arrays of polyData itself are
+    overwritten and polyData is returned; only do this for data that is not
+    shared with anything else.
+
+    If the transformed data is only needed for display, prefer
+    visualization.updateTransformedPolyData, which sets the transform on the
+    actor and does not touch the points at all.
+    '''
+    if not isinstance(transform, vtk.vtkLinearTransform) or not polyData.GetPoints():
+        return _transformPolyDataWithFilter(polyData, transform)
+
+    mat = transformArrays.matrixFromTransform(transform)
+    rotation = mat[:3,:3]
+    translation = mat[:3,3]
+
+    # normals use the inverse transpose, which is just the rotation for rigid transforms
+    isRigid = np.allclose(np.dot(rotation, rotation.T), np.eye(3))
+    normalRotation = rotation if isRigid else np.linalg.inv(rotation).T
+
+    def getAttributeArrays(dataSet):
+        return [dataSet.GetPointData().GetNormals(), dataSet.GetPointData().GetVectors(),
+                dataSet.GetCellData().GetNormals(), dataSet.GetCellData().GetVectors()]
+
+    inputPoints = polyData.GetPoints()
+    inputArrays = getAttributeArrays(polyData)
+
+    if inPlace:
+        output = polyData
+        outputPoints = inputPoints
+        outputArrays = inputArrays
+    else:
+        if output is None or output is polyData:
+            output = vtk.vtkPolyData()
+
+        previousPoints = output.GetPoints()
+        previousArrays = getAttributeArrays(output)
+        output.ShallowCopy(polyData)
+
+        if previousPoints is None or previousPoints is inputPoints:
+            outputPoints = vtk.vtkPoints()
+            previousData = None
+        else:
+            outputPoints = previousPoints
+            previousData = previousPoints.GetData()
+
+        outputPoints.SetData(_getOutputArray(inputPoints.GetData(), previousData))
+        output.SetPoints(outputPoints)
+
+        outputArrays = [_getOutputArray(inputArray, previousArray) if inputArray else None
+                          for inputArray, previousArray in zip(inputArrays, previousArrays)]
+
+        # vectors that alias the normals share the transformed normals array
+        for normalsIndex, vectorsIndex in ((0, 1), (2, 3)):
+            if inputArrays[vectorsIndex] and inputArrays[vectorsIndex] is inputArrays[normalsIndex]:
+                outputArrays[vectorsIndex] = outputArrays[normalsIndex]
+
+        pointNormals, pointVectors, cellNormals, cellVectors = outputArrays
+        if pointNormals:
+            output.GetPointData().SetNormals(pointNormals)
+        if pointVectors:
+            output.GetPointData().SetVectors(pointVectors)
+        if cellNormals:
+            output.GetCellData().SetNormals(cellNormals)
+        if cellVectors:
+            output.GetCellData().SetVectors(cellVectors)
+
+    _transformArray(inputPoints.GetData(), outputPoints.GetData(), rotation, translation)
+
+    inputPointNormals, inputPointVectors, inputCellNormals, inputCellVectors = inputArrays
+    outputPointNormals, outputPointVectors, outputCellNormals, outputCellVectors = outputArrays
+
+    if inputPointNormals:
+        _transformArray(inputPointNormals, outputPointNormals, normalRotation, normalize=not isRigid)
+    if inputPointVectors and inputPointVectors is not inputPointNormals:
+        _transformArray(inputPointVectors, outputPointVectors, rotation)
+    if inputCellNormals:
+        _transformArray(inputCellNormals, outputCellNormals, normalRotation, normalize=not isRigid)
+    if inputCellVectors and inputCellVectors is not inputCellNormals:
+        _transformArray(inputCellVectors, outputCellVectors, rotation)
+
+    outputPoints.Modified()
+    output.Modified()
+    return output
+
+
 def computeDelaunay3D(polyData):
     f = vtk.vtkDelaunay3D()
     f.SetInput(polyData)
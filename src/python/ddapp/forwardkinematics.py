@@ -0,0 +1,215 @@
+'''
+Forward kinematics evaluated directly from the urdf with numpy.
+
+The robot model items compute link frames by pushing a pose into the
+shared drake model, which updates every visual and fires model changed
+callbacks.  ForwardKinematics parses the urdf once, caches the kinematic
+tree and evaluates link frames for one pose or for a batch of poses
+without touching any model.  Poses use the drake joint ordering given by
+the jointNames, including the base_x, base_y, base_z, base_roll,
+base_pitch and base_yaw floating base coordinates.
+'''
+
+import xml.etree.ElementTree as ET
+import numpy as np
+from ddapp import transformArrays
+
+
+floatingBaseJointNames = ['base_x', 'base_y', 'base_z', 'base_roll', 'base_pitch', 'base_yaw']
+
+
+def _parseVector(text, default):
+    if text is None:
+        return np.array(default, dtype=float)
+    return np.array([float(x) for x in text.split()])
+
+
+class _Joint(object):
+
+    def __init__(self, element):
+        self.name = element.get('name')
+        self.type = element.get('type')
+        self.parent = element.find('parent').get('link')
+        self.child = element.find('child').get('link')
+
+        origin = element.find('origin')
+        xyz = _parseVector(origin.get('xyz') if origin is not None else None, [0.0, 0.0, 0.0])
+        rpy = _parseVector(origin.get('rpy') if origin is not None else None, [0.0, 0.0, 0.0])
+        self.origin = transformArrays.transformFromPositionAndRPY(xyz, rpy)
+
+        axis = element.find('axis')
+        self.axis = _parseVector(axis.get('xyz') if axis is not None else None, [1.0, 0.0, 0.0])
+        self.axis /= np.linalg.norm(self.axis)
+
+        # index into the pose vector, assigned when the joint names are known
+        self.poseIndex = None
+
+
+class ForwardKinematics(object):
+
+    def __init__(self, urdfStrings, jointNames):
+        '''
+        urdfStrings is a urdf xml string or a list of them, jointNames is
+        the list of pose coordinate names, as returned by
+        ddDrakeModel.getJointNames().
+        '''
+        if isinstance(urdfStrings, basestring):
+            urdfStrings = [urdfStrings]
+
+        self.jointNames = list(jointNames)
+        self.joints = {}
+        self.parentJoint = {}
+        self.linkNames = []
+
+        for urdfString in urdfStrings:
+            root = ET.fromstring(urdfString)
+            self.linkNames.extend(link.get('name') for link in root.findall('link'))
+            for element in root.findall('joint'):
+                joint = _Joint(element)
+                self.joints[joint.name] = joint
+                self.parentJoint[joint.child] = joint
+
+        jointIndices = dict((name, i) for i, name in enumerate(self.jointNames))
+        for joint in self.joints.itervalues():
+            if joint.type not in ('fixed', 'floating'):
+                if joint.name not in jointIndices:
+                    raise KeyError('urdf joint %s is not in the pose joint names' % joint.name)
+                joint.poseIndex = jointIndices[joint.name]
+
+        self.floatingBaseIndices = None
+        if all(name in jointIndices for name in floatingBaseJointNames):
+            self.floatingBaseIndices = [jointIndices[name] for name in floatingBaseJointNames]
+
+        self._chains = {}
+
+    @staticmethod
+    def fromFile(filename, jointNames):
+        '''
+        Constructs from a urdf filename.  As with ddDrakeModel.loadFromFile,
+        several files can be separated by a colon.
+        '''
+        return ForwardKinematics([open(f).read() for f in filename.split(':')], jointNames)
+
+    def hasLink(self, linkName):
+        return linkName in self.parentJoint or linkName in self.linkNames
+
+    def _getChain(self, linkName):
+        '''
+        Returns the list of joints from the root link to the given link.
+        '''
+        chain = self._chains.get(linkName)
+        if chain is None:
+            if not self.hasLink(linkName):
+                raise KeyError('unknown link name: %s' % linkName)
+            chain = []
+            link = linkName
+            while link in self.parentJoint:
+                joint = self.parentJoint[link]
+                chain.append(joint)
+                link = joint.parent
+            chain.reverse()
+            self._chains[linkName] = chain
+        return chain
+
+    def _getJointTransforms(self, joint, poses):
+
+        if joint.poseIndex is None:
+            return joint.origin
+
+        q = poses[:,joint.poseIndex]
+        motion = transformArrays.identity(len(q))
+
+        if joint.type in ('revolute', 'continuous'):
+            # rodrigues rotation about the joint axis
+            x, y, z = joint.axis
+            k = np.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+            s = np.sin(q)[:,None,None]
+            c = np.cos(q)[:,None,None]
+            motion[:,:3,:3] += s*k + (1.0 - c)*np.dot(k, k)
+        elif joint.type == 'prismatic':
+            motion[:,:3,3] = q[:,None]*joint.axis
+        else:
+            raise ValueError('unsupported joint type %s for joint %s' % (joint.type, joint.name))
+
+        return transformArrays.compose(joint.origin, motion)
+
+    def _getBaseTransforms(self, poses):
+
+        if self.floatingBaseIndices is None:
+            return transformArrays.identity(len(poses))
+
+        base = poses[:,self.floatingBaseIndices]
+        return transformArrays.transformFromPositionAndRPY(base[:,:3], base[:,3:])
+
+    def computeLinkFrames(self, poses, linkNames):
+        '''
+        Given an MxN array of poses returns a dict of linkName -> Mx4x4
+        array of link to world transforms.  Shared parts of the kinematic
+        chains are evaluated once.
+        '''
+        poses = np.atleast_2d(np.asarray(poses, dtype=float))
+        base = self._getBaseTransforms(poses)
+
+        jointFrames = {}
+        def getFrame(chain, end):
+            if end == 0:
+                return base
+            joint = chain[end-1]
+            frame = jointFrames.get(joint.name)
+            if frame is None:
+                frame = transformArrays.compose(getFrame(chain, end-1), self._getJointTransforms(joint, poses))
+                jointFrames[joint.name] = frame
+            return frame
+
+        result = {}
+        for linkName in linkNames:
+            chain = self._getChain(linkName)
+            result[linkName] = getFrame(chain, len(chain))
+        return result
+
+    def getLinkFrames(self, pose, linkNames=None):
+        '''
+        Returns a dict of linkName -> 4x4 link to world transform for a
+        single pose.  If linkNames is None all links are returned.
+        '''
+        if linkNames is None:
+            linkNames = self.linkNames
+        frames = self.computeLinkFrames(pose, linkNames)
+        return dict((name, frame[0]) for name, frame in frames.iteritems())
+
+    def getLinkFrameForPoses(self, linkName, poses):
+        '''
+        Returns an Mx4x4 array of link to world transforms of one link
+        for an MxN array of poses.
+        '''
+        return self.computeLinkFrames(poses, [linkName])[linkName]
+
+    def getLinkFrame(self, linkName, pose):
+        '''
+        Returns the link to world transform as a vtkTransform.
+        '''
+        return transformArrays.transformFromMatrix(self.getLinkFrameForPoses(linkName, pose)[0])
+
+
+_forwardKinematicsCache = {}
+
+def getForwardKinematics(robotModel):
+    '''
+    Returns a cached ForwardKinematics for a RobotModelItem or ddDrakeModel
+    that was loaded from a file.  Returns None for models loaded from an
+    xml string, or whose urdf joints do not match the model joint names.
+    '''
+    model = getattr(robotModel, 'model', robotModel)
+    filename = model.filename()
+    if not filename or filename == '<xml string>':
+        return None
+
+    jointNames = tuple(model.getJointNames())
+    key = (filename, jointNames)
+    if key not in _forwardKinematicsCache:
+        try:
+            _forwardKinematicsCache[key] = ForwardKinematics.fromFile(filename, jointNames)
+        except KeyError as e:
+            print 'forward kinematics not available for %s: %s' % (filename, e)
+            _forwardKinematicsCache[key] = None
+    return _forwardKinematicsCache[key]
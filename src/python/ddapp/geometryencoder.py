@@ -2,6 +2,15 @@ from ddapp import vtkAll as vtk
 from ddapp import vtkNumpy as vnp
 from ddapp.shallowCopy import shallowCopy
 import numpy as np
+import json
+import random
+import struct
+import zlib
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
 
 def encodePolyData(polyData):
     '''Given a vtkPolyData, returns a numpy int8 array that contains
@@ -24,7 +33,11 @@ def encodePolyData(polyData):
 
 def decodePolyData(data):
     '''Given a numpy int8 array, deserializes the data to construct a new
-    vtkPolyData object and returns the result.'''
+    vtkPolyData object and returns the result.  Data produced by
+    encodePolyDataCompressed is also accepted.'''
+
+    if isCompressedEncoding(data):
+        return decodePolyDataCompressed(data)
 
     if not hasattr(vtk, 'vtkCommunicator'):
         r = vtk.vtkPolyDataReader()
@@ -38,3 +51,354 @@ def decodePolyData(data):
     polyData = vtk.vtkPolyData()
     vtk.vtkCommunicator.UnMarshalDataObject(charArray, polyData)
     return polyData
+
+
+# Compressed codec
+#
+# A compressed encoding is laid out as:
+#
+#   'DDGC' | uint32 header length | json header | compressed payload
+#
+# The payload is the concatenation of the sections listed in the header:
+# quantized point positions, point data arrays, and for each cell type the
+# cell sizes and the delta encoded point ids.
+
+COMPRESSED_MAGIC = 'DDGC'
+STREAM_MAGIC = 'DDGS'
+CODEC_VERSION = 1
+
+_cellTypes = ('verts', 'lines', 'polys', 'strips')
+_attributeTypes = ('Normals', 'TCoords', 'Scalars', 'Vectors')
+
+_headerFormat = '<4sI'
+_chunkHeaderFormat = '<4sIII'
+
+
+def getCompressionMethods():
+    '''Returns the names of the compression methods available for
+    encodePolyDataCompressed.'''
+    methods = ['none', 'zlib']
+    if lz4frame is not None:
+        methods.append('lz4')
+    return methods
+
+
+def _compress(data, compression, level):
+    if compression == 'zlib':
+        return zlib.compress(data, level)
+    elif compression == 'lz4':
+        if lz4frame is None:
+            raise ValueError('lz4 compression requested but the lz4 module is not available')
+        return lz4frame.compress(data, compression_level=level)
+    elif compression == 'none':
+        return data
+    raise ValueError('unknown compression: %s' % compression)
+
+
+def _decompress(data, compression):
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    elif compression == 'lz4':
+        if lz4frame is None:
+            raise ValueError('data is lz4 compressed but the lz4 module is not available')
+        return lz4frame.decompress(data)
+    elif compression == 'none':
+        return data
+    raise ValueError('unknown compression: %s' % compression)
+
+
+def _smallestIntegerType(values):
+    if not len(values):
+        return np.int8
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _encodePositions(points, positionEncoding):
+
+    if positionEncoding == 'int16':
+        low = points.min(axis=0) if len(points) else np.zeros(3)
+        high = points.max(axis=0) if len(points) else np.zeros(3)
+        scale = (high - low) / 65535.0
+        scale[scale == 0] = 1.0
+        quantized = np.round((points - low) / scale) - 32768
+        data = np.clip(quantized, -32768, 32767).astype(np.int16)
+        return data, dict(encoding='int16', offset=low.tolist(), scale=scale.tolist())
+
+    elif positionEncoding == 'float16':
+        center = (points.min(axis=0) + points.max(axis=0)) / 2.0 if len(points) else np.zeros(3)
+        data = (points - center).astype(np.float16)
+        return data, dict(encoding='float16', offset=center.tolist())
+
+    elif positionEncoding == 'float32':
+        return points.astype(np.float32), dict(encoding='float32')
+
+    raise ValueError('unknown position encoding: %s' % positionEncoding)
+
+
+def _decodePositions(data, desc):
+
+    encoding = desc['encoding']
+    if encoding == 'int16':
+        points = (data.astype(np.float32) + 32768) * np.array(desc['scale'], dtype=np.float32)
+        return points + np.array(desc['offset'], dtype=np.float32)
+    elif encoding == 'float16':
+        return data.astype(np.float32) + np.array(desc['offset'], dtype=np.float32)
+    elif encoding == 'float32':
+        return data.astype(np.float32)
+
+    raise ValueError('unknown position encoding: %s' % encoding)
+
+
+def _splitLegacyCells(legacyIds, numberOfCells):
+    '''Splits a legacy vtkCellArray id array [n0, id, id, ..., n1, id, ...]
+    into arrays of cell sizes and point ids.'''
+
+    if not numberOfCells:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # fast path when every cell has the same number of points
+    pointsPerCell = legacyIds[0]
+    if len(legacyIds) == numberOfCells * (pointsPerCell + 1):
+        table = legacyIds.reshape(numberOfCells, pointsPerCell + 1)
+        if (table[:,0] == pointsPerCell).all():
+            return table[:,0].copy(), table[:,1:].ravel()
+
+    sizes = np.empty(numberOfCells, dtype=np.int64)
+    mask = np.ones(len(legacyIds), dtype=bool)
+    location = 0
+    for i in xrange(numberOfCells):
+        sizes[i] = legacyIds[location]
+        mask[location] = False
+        location += sizes[i] + 1
+    return sizes, legacyIds[mask]
+
+
+def _joinLegacyCells(sizes, ids):
+
+    legacyIds = np.empty(len(sizes) + len(ids), dtype=vnp.numpy_support.ID_TYPE_CODE)
+    starts = np.cumsum(sizes + 1) - (sizes + 1)
+    mask = np.ones(len(legacyIds), dtype=bool)
+    mask[starts] = False
+    legacyIds[starts] = sizes
+    legacyIds[mask] = ids
+    return legacyIds
+
+
+def _getCellArrayFromLegacyIds(legacyIds, numberOfCells):
+
+    cells = vtk.vtkCellArray()
+    cells.SetCells(numberOfCells, vnp.getVtkIdTypeArrayFromNumpy(legacyIds))
+    return cells
+
+
+def encodePolyDataCompressed(polyData, positionEncoding='int16', compression='zlib', level=6):
+    '''Given a vtkPolyData, returns a numpy int8 array containing a compact
+    serialization of the points, point data arrays and cells.
+
+    positionEncoding selects how point positions are stored: 'int16'
+    quantizes each axis relative to the bounds of the points, 'float16'
+    stores offsets from the center of the bounds at half precision and
+    'float32' is lossless for float32 input.  Point ids are delta encoded
+    and stored with the smallest integer type that fits.  compression is
+    one of getCompressionMethods() and level is the compression level.
+    Point data arrays stored as float64 are reduced to float32.  The
+    active normals, tcoords, scalars and vectors are restored on decode;
+    an unnamed active array is stored under its attribute name.  Cell data
+    is not encoded.
+
+    The result can be passed to decodePolyData.'''
+
+    sections = []
+    header = dict(version=CODEC_VERSION, compression=compression)
+
+    def addSection(array):
+        array = np.ascontiguousarray(array)
+        sections.append(array)
+        return dict(dtype=array.dtype.str, shape=array.shape)
+
+    numberOfPoints = polyData.GetNumberOfPoints()
+    header['numberOfPoints'] = numberOfPoints
+    points = vnp.getNumpyFromVtk(polyData, 'Points') if numberOfPoints else np.zeros((0, 3))
+    positions, positionDesc = _encodePositions(points, positionEncoding)
+    positionDesc['section'] = addSection(positions)
+    header['positions'] = positionDesc
+
+    header['pointData'] = []
+    pointData = polyData.GetPointData()
+    activeArrays = [(attributeType, getattr(pointData, 'Get' + attributeType)()) for attributeType in _attributeTypes]
+    for i in xrange(pointData.GetNumberOfArrays()):
+        vtkArray = pointData.GetArray(i)
+        if vtkArray is None:
+            continue
+        attributes = [attributeType for attributeType, activeArray in activeArrays if activeArray is vtkArray]
+        name = vtkArray.GetName() or (attributes[0] if attributes else None)
+        if not name:
+            continue
+        array = vnp.numpy_support.vtk_to_numpy(vtkArray)
+        if array.dtype == np.float64:
+            array = array.astype(np.float32)
+        arrayDesc = dict(name=name, section=addSection(array))
+        if attributes:
+            arrayDesc['attributes'] = attributes
+        header['pointData'].append(arrayDesc)
+
+    header['cells'] = {}
+    for cellType in _cellTypes:
+        cellArray = getattr(polyData, 'Get' + cellType.capitalize())()
+        numberOfCells = cellArray.GetNumberOfCells() if cellArray else 0
+        if not numberOfCells:
+            continue
+
+        legacyIds = vnp.numpy_support.vtk_to_numpy(cellArray.GetData()).astype(np.int64)
+        sizes, ids = _splitLegacyCells(legacyIds, numberOfCells)
+        deltas = np.diff(np.concatenate([[0], ids]))
+
+        cellDesc = dict(numberOfCells=numberOfCells)
+        if (sizes == sizes[0]).all():
+            cellDesc['pointsPerCell'] = int(sizes[0])
+        else:
+            cellDesc['sizes'] = addSection(sizes.astype(_smallestIntegerType(sizes)))
+        cellDesc['deltas'] = addSection(deltas.astype(_smallestIntegerType(deltas)))
+        header['cells'][cellType] = cellDesc
+
+    payload = ''.join(section.tostring() for section in sections)
+    header['payloadSize'] = len(payload)
+    payload = _compress(payload, compression, level)
+
+    headerString = json.dumps(header)
+    data = struct.pack(_headerFormat, COMPRESSED_MAGIC, len(headerString)) + headerString + payload
+    return np.frombuffer(data, dtype=np.int8)
+
+
+def isCompressedEncoding(data):
+    '''Returns True if the given numpy array was produced by
+    encodePolyDataCompressed.'''
+    return len(data) >= 4 and data[:4].tostring() == COMPRESSED_MAGIC
+
+
+def decodePolyDataCompressed(data):
+    '''Given a numpy int8 array produced by encodePolyDataCompressed,
+    constructs a new vtkPolyData and returns the result.'''
+
+    data = np.asarray(data).view(np.int8).tostring()
+    headerSize = struct.calcsize(_headerFormat)
+    magic, headerLength = struct.unpack(_headerFormat, data[:headerSize])
+    if magic != COMPRESSED_MAGIC:
+        raise ValueError('data is not a compressed geometry encoding')
+
+    header = json.loads(data[headerSize:headerSize+headerLength])
+    if header['version'] > CODEC_VERSION:
+        raise ValueError('unsupported geometry encoding version: %d' % header['version'])
+
+    payload = _decompress(data[headerSize+headerLength:], header['compression'])
+    assert len(payload) == header['payloadSize']
+
+    offset = [0]
+    def readSection(desc):
+        dtype = np.dtype(str(desc['dtype']))
+        count = int(np.prod(desc['shape']))
+        if not count:
+            return np.zeros(desc['shape'], dtype=dtype)
+        array = np.frombuffer(payload, dtype=dtype, count=count, offset=offset[0])
+        offset[0] += count*dtype.itemsize
+        return array.reshape(desc['shape'])
+
+    positionDesc = header['positions']
+    points = _decodePositions(readSection(positionDesc['section']), positionDesc)
+    polyData = vnp.numpyToPolyData(points, copy=False)
+
+    pointData = polyData.GetPointData()
+    for arrayDesc in header['pointData']:
+        array = readSection(arrayDesc['section']).copy()
+        name = str(arrayDesc['name'])
+        vnp.addNumpyToVtk(polyData, array, name)
+        for attributeType in arrayDesc.get('attributes', []):
+            getattr(pointData, 'Set' + str(attributeType))(pointData.GetArray(name))
+
+    for cellType in _cellTypes:
+        cellDesc = header['cells'].get(cellType)
+        if cellDesc is None:
+            continue
+
+        numberOfCells = cellDesc['numberOfCells']
+        if 'sizes' in cellDesc:
+            sizes = readSection(cellDesc['sizes']).astype(np.int64)
+        else:
+            sizes = np.empty(numberOfCells, dtype=np.int64)
+            sizes.fill(cellDesc['pointsPerCell'])
+
+        ids = np.cumsum(readSection(cellDesc['deltas']), dtype=np.int64)
+        cells = _getCellArrayFromLegacyIds(_joinLegacyCells(sizes, ids), numberOfCells)
+        getattr(polyData, 'Set' + cellType.capitalize())(cells)
+
+    return polyData
+
+
+def encodePolyDataChunks(polyData, chunkSize=256*1024, callback=None, **kwargs):
+    '''Encodes the polyData with encodePolyDataCompressed and yields the
+    result as a sequence of numpy int8 chunks of at most chunkSize payload
+    bytes each.  Every chunk carries a stream id, its index and the total
+    number of chunks, so the chunks can be published separately and
+    reassembled with PolyDataStreamDecoder.  If given, callback is called
+    as callback(chunksDone, chunksTotal) after each chunk.  Additional
+    keyword arguments are passed to encodePolyDataCompressed.'''
+
+    data = encodePolyDataCompressed(polyData, **kwargs).tostring()
+    streamId = random.getrandbits(32)
+    numberOfChunks = max(1, (len(data) + chunkSize - 1) // chunkSize)
+
+    for i in xrange(numberOfChunks):
+        chunkHeader = struct.pack(_chunkHeaderFormat, STREAM_MAGIC, streamId, i, numberOfChunks)
+        yield np.frombuffer(chunkHeader + data[i*chunkSize:(i+1)*chunkSize], dtype=np.int8)
+        if callback:
+            callback(i + 1, numberOfChunks)
+
+
+class PolyDataStreamDecoder(object):
+    '''Reassembles chunks produced by encodePolyDataChunks.  Chunks from
+    several streams may be interleaved and may arrive out of order.'''
+
+    def __init__(self, callback=None):
+        '''If given, callback is called as callback(streamId, chunksReceived, chunksTotal)
+        each time a new chunk is added.'''
+        self.callback = callback
+        self.streams = {}
+
+    def addChunk(self, chunk):
+        '''Adds a chunk.  Returns the decoded vtkPolyData when the chunk
+        completes its stream, otherwise returns None.'''
+
+        chunk = np.asarray(chunk).view(np.int8).tostring()
+        chunkHeaderSize = struct.calcsize(_chunkHeaderFormat)
+        magic, streamId, index, numberOfChunks = struct.unpack(_chunkHeaderFormat, chunk[:chunkHeaderSize])
+        if magic != STREAM_MAGIC:
+            raise ValueError('data is not a geometry stream chunk')
+
+        chunks = self.streams.setdefault(streamId, {})
+        chunks[index] = chunk[chunkHeaderSize:]
+
+        if self.callback:
+            self.callback(streamId, len(chunks), numberOfChunks)
+
+        if len(chunks) < numberOfChunks:
+            return None
+
+        del self.streams[streamId]
+        data = ''.join(chunks[i] for i in xrange(numberOfChunks))
+        return decodePolyDataCompressed(np.frombuffer(data, dtype=np.int8))
+
+    def getPendingStreams(self):
+        return self.streams.keys()
+
+    def reset(self, streamId=None):
+        '''Discards the partially received chunks of the given stream, or
+        of all streams if streamId is None.'''
+        if streamId is None:
+            self.streams.clear()
+        else:
+            self.streams.pop(streamId, None)
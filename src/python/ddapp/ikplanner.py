@@ -26,6 +26,7 @@ from ddapp import drcargs
 from ddapp import ik
 from ddapp.ikparameters import IkParameters
 from ddapp import ikconstraintencoder
+from ddapp import forwardkinematics
 
 import drc as lcmdrc
 import json
@@ -745,12 +746,59 @@ class IKPlanner(object):
 
 
     def getLinkFrameAtPose(self, linkName, pose):
+        '''
+        Returns the link to world transform of the link at the given pose,
+        which is a pose vector or the name of a jointController pose.
+        The frame is computed with forward kinematics when possible, which
+        leaves the ik robot model untouched.
+        '''
         if isinstance(pose, str):
-            self.jointController.setPose(pose)
-        else:
-            self.jointController.setPose('user_pose', pose)
+            pose = self.jointController.getPose(pose)
+
+        fk = forwardkinematics.getForwardKinematics(self.robotModel)
+        if fk is not None and fk.hasLink(linkName):
+            return fk.getLinkFrame(linkName, pose)
+
+        self.jointController.setPose('user_pose', pose)
         return self.robotModel.getLinkFrame(linkName)
 
+    def getLinkFramesAtPose(self, linkNames, pose):
+        '''
+        Returns a dict of linkName -> 4x4 numpy link to world transform.
+        If linkNames is None all links are returned.  Like
+        getLinkFrameAtPose this falls back to the ik robot model when
+        forward kinematics is not available.
+        '''
+        if isinstance(pose, str):
+            pose = self.jointController.getPose(pose)
+
+        fk = forwardkinematics.getForwardKinematics(self.robotModel)
+        if fk is not None and (linkNames is None or all(fk.hasLink(name) for name in linkNames)):
+            return fk.getLinkFrames(pose, linkNames)
+
+        if linkNames is None:
+            linkNames = self.robotModel.model.getLinkNames()
+
+        self.jointController.setPose('user_pose', pose)
+        return dict((name, transformUtils.getNumpyFromTransform(self.robotModel.getLinkFrame(name))) for name in linkNames)
+
+    def getLinkFrameAtPoses(self, linkName, poses):
+        '''
+        Returns an Mx4x4 numpy array of link to world transforms for an MxN
+        array of poses, such as the poses of a plan.  Falls back to setting
+        each pose on the ik robot model when forward kinematics is not
+        available.
+        '''
+        fk = forwardkinematics.getForwardKinematics(self.robotModel)
+        if fk is not None and fk.hasLink(linkName):
+            return fk.getLinkFrameForPoses(linkName, poses)
+
+        frames = []
+        for pose in np.atleast_2d(poses):
+            self.jointController.setPose('user_pose', pose)
+            frames.append(transformUtils.getNumpyFromTransform(self.robotModel.getLinkFrame(linkName)))
+        return np.array(frames).reshape(-1, 4, 4)
+
 
     def getRobotModelAtPose(self, pose):
         self.jointController.setPose('user_pose', pose)
@@ -1,11 +1,23 @@
 import os
+import json
+import struct
+import threading
+import traceback
+import Queue
+import numpy as np
 import vtkAll as vtk
-from shallowCopy import shallowCopy
+import vtkNumpy as vnp
+from shallowCopy import shallowCopy, deepCopy
+from timercallback import TimerCallback
 
 def readPolyData(filename, computeNormals=False):
 
     ext = os.path.splitext(filename)[1].lower()
 
+    if ext == '.npd':
+        polyData = readNumpyPolyData(filename)
+        return _computeNormals(polyData) if computeNormals else polyData
+
     readers = {
             '.vtp' : vtk.vtkXMLPolyDataReader,
             '.vtk' : vtk.vtkPolyDataReader,
@@ -52,10 +64,20 @@ def readImage(filename):
     return image
 
 
-def writePolyData(polyData, filename):
+def writePolyData(polyData, filename, binary=True):
+    '''
+    Writes the polyData to the given filename.  The format is chosen by the
+    file extension.  PLY and STL files are written in binary unless binary
+    is False.  The .npd extension selects the raw numpy format written by
+    writeNumpyPolyData.
+    '''
 
     ext = os.path.splitext(filename)[1].lower()
 
+    if ext == '.npd':
+        writeNumpyPolyData(polyData, filename)
+        return
+
     writers = {
             '.vtp' : vtk.vtkXMLPolyDataWriter,
             '.ply' : vtk.vtkPLYWriter,
@@ -69,7 +91,10 @@ def writePolyData(polyData, filename):
 
     if ext in ('.ply', '.stl'):
         polyData = _triangulate(polyData)
-        writer.SetFileTypeToASCII()
+        if binary:
+            writer.SetFileTypeToBinary()
+        else:
+            writer.SetFileTypeToASCII()
 
     writer.SetFileName(filename)
     writer.SetInput(polyData)
@@ -97,6 +122,224 @@ def writeImage(image, filename):
     writer.Write()
 
 
+# The .npd format stores a vtkPolyData as raw arrays so that it can be
+# memory mapped on load:
+#
+#   'DDPD' | uint32 header length | json header | padding | aligned array buffers
+#
+# The header lists every array with its role, dtype, shape and byte offset
+# from the start of the data section.
+
+_npdMagic = 'DDPD'
+_npdHeaderFormat = '<4sI'
+_npdAlignment = 64
+_cellTypes = ('verts', 'lines', 'polys', 'strips')
+
+
+def _alignOffset(offset):
+    return (offset + _npdAlignment - 1) // _npdAlignment * _npdAlignment
+
+
+def writeNumpyPolyData(polyData, filename):
+    '''
+    Writes the points, point data, cell data and cells of the polyData to
+    a file in the raw .npd format.  See readNumpyPolyData.
+    '''
+
+    arrays = []
+
+    def addArray(array, **desc):
+        desc['array'] = np.ascontiguousarray(array)
+        arrays.append(desc)
+
+    if polyData.GetNumberOfPoints():
+        addArray(vnp.getNumpyFromVtk(polyData, 'Points'), role='points')
+
+    for role, attributes in (('pointData', polyData.GetPointData()), ('cellData', polyData.GetCellData())):
+        for i in xrange(attributes.GetNumberOfArrays()):
+            vtkArray = attributes.GetArray(i)
+            if vtkArray is None or not vtkArray.GetName():
+                continue
+            addArray(vnp.numpy_support.vtk_to_numpy(vtkArray), role=role, name=vtkArray.GetName())
+
+    for cellType in _cellTypes:
+        cells = getattr(polyData, 'Get' + cellType.capitalize())()
+        if cells and cells.GetNumberOfCells():
+            addArray(vnp.numpy_support.vtk_to_numpy(cells.GetData()), role='cells',
+                     name=cellType, numberOfCells=cells.GetNumberOfCells())
+
+    offset = 0
+    for desc in arrays:
+        array = desc['array']
+        desc.update(dtype=array.dtype.str, shape=array.shape, offset=offset)
+        offset = _alignOffset(offset + array.nbytes)
+
+    header = json.dumps(dict(version=1, numberOfPoints=polyData.GetNumberOfPoints(),
+                             arrays=[dict((k, v) for k, v in desc.iteritems() if k != 'array') for desc in arrays]))
+
+    headerSize = struct.calcsize(_npdHeaderFormat) + len(header)
+    dataStart = _alignOffset(headerSize)
+
+    with open(filename, 'wb') as f:
+        f.write(struct.pack(_npdHeaderFormat, _npdMagic, len(header)))
+        f.write(header)
+        for desc in arrays:
+            f.seek(dataStart + desc['offset'])
+            desc['array'].tofile(f)
+        f.truncate(dataStart + offset)
+
+
+def readNumpyPolyData(filename, mmap=True):
+    '''
+    Reads a file written by writeNumpyPolyData and returns a vtkPolyData.
+    If mmap is True the arrays are memory mapped copy-on-write instead of
+    being read into memory, so loading is independent of the file size
+    and pages are read on first access.
+    '''
+
+    with open(filename, 'rb') as f:
+        magic, headerLength = struct.unpack(_npdHeaderFormat, f.read(struct.calcsize(_npdHeaderFormat)))
+        if magic != _npdMagic:
+            raise Exception('Not an npd file: %s' % filename)
+        header = json.loads(f.read(headerLength))
+
+    dataStart = _alignOffset(struct.calcsize(_npdHeaderFormat) + headerLength)
+
+    def loadArray(desc):
+        dtype = np.dtype(str(desc['dtype']))
+        shape = tuple(desc['shape'])
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        if mmap:
+            return np.memmap(filename, dtype=dtype, mode='c', offset=dataStart + desc['offset'], shape=shape)
+        with open(filename, 'rb') as f:
+            f.seek(dataStart + desc['offset'])
+            return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vtk.vtkPoints())
+
+    for desc in header['arrays']:
+        role = desc['role']
+        array = loadArray(desc)
+
+        if role == 'points':
+            polyData.GetPoints().SetData(vnp.getVtkFromNumpy(array))
+
+        elif role in ('pointData', 'cellData'):
+            vtkArray = vnp.getVtkFromNumpy(array)
+            vtkArray.SetName(str(desc['name']))
+            getattr(polyData, 'Get' + role[0].upper() + role[1:])().AddArray(vtkArray)
+
+        elif role == 'cells':
+            cells = vtk.vtkCellArray()
+            cells.SetCells(desc['numberOfCells'], vnp.getVtkIdTypeArrayFromNumpy(array))
+            getattr(polyData, 'Set' + str(desc['name']).capitalize())(cells)
+
+    return polyData
+
+
+class AsyncIOQueue(object):
+    '''
+    Runs read and write requests on a worker thread and delivers the
+    results to callbacks on the main thread.  Note that the vtk readers
+    and writers hold the python interpreter lock, so the .npd format gives
+    the most responsive background io.
+    '''
+
+    def __init__(self):
+        self.requests = Queue.Queue()
+        self.results = Queue.Queue()
+        self.numberOfPendingRequests = 0
+        self.thread = None
+        self.timer = TimerCallback(targetFps=30)
+        self.timer.callback = self._processResults
+        self.timerRunning = False
+
+    def submit(self, func, args, callback=None, errorCallback=None):
+        '''
+        Calls func(*args) on the worker thread.  On the main thread,
+        callback(result) is called on completion, or errorCallback(exception)
+        if func raised.  Exceptions without an errorCallback are printed.
+        '''
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+        self.numberOfPendingRequests += 1
+        self.requests.put((func, args, callback, errorCallback))
+
+        if not self.timerRunning:
+            self.timerRunning = True
+            self.timer.start()
+
+    def _run(self):
+        while True:
+            func, args, callback, errorCallback = self.requests.get()
+            try:
+                result = func(*args)
+                error = None
+            except Exception as error:
+                result = None
+                traceback.print_exc()
+            self.results.put((result, error, callback, errorCallback))
+
+    def _processResults(self):
+
+        while True:
+            try:
+                result, error, callback, errorCallback = self.results.get_nowait()
+            except Queue.Empty:
+                break
+
+            self.numberOfPendingRequests -= 1
+            if error is None:
+                if callback:
+                    callback(result)
+            elif errorCallback:
+                errorCallback(error)
+
+        if not self.numberOfPendingRequests:
+            self.timerRunning = False
+            return False
+
+
+_asyncIOQueue = None
+
+def _getAsyncIOQueue():
+    global _asyncIOQueue
+    if _asyncIOQueue is None:
+        _asyncIOQueue = AsyncIOQueue()
+    return _asyncIOQueue
+
+
+def _writePolyDataAtomic(polyData, filename, binary):
+    base, ext = os.path.splitext(filename)
+    tempFilename = base + '.tmp' + ext
+    writePolyData(polyData, tempFilename, binary)
+    os.rename(tempFilename, filename)
+    return filename
+
+
+def writePolyDataAsync(polyData, filename, callback=None, errorCallback=None, binary=True):
+    '''
+    Writes the polyData on a worker thread.  The polyData is deep copied
+    first so it may be modified after this call returns.  The file is
+    written to a temporary name and renamed on completion, then
+    callback(filename) is called on the main thread.
+    '''
+    _getAsyncIOQueue().submit(_writePolyDataAtomic, (deepCopy(polyData), filename, binary), callback, errorCallback)
+
+
+def readPolyDataAsync(filename, callback, errorCallback=None, computeNormals=False):
+    '''
+    Reads the polyData on a worker thread and calls callback(polyData)
+    on the main thread.
+    '''
+    _getAsyncIOQueue().submit(readPolyData, (filename, computeNormals), callback, errorCallback)
+
+
 def _computeNormals(polyData):
     normals = vtk.vtkPolyDataNormals()
     normals.SetFeatureAngle(45)
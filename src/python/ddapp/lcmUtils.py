@@ -1,6 +1,6 @@
 import lcm
-import PythonQt
 import datetime
+import time
 import pickle
 import atexit
 import socket
@@ -10,11 +10,23 @@ import tempfile
 import imp
 import sys
 import re
+import glob
+import shutil
+import threading
+import multiprocessing
+import numpy as np
+
+try:
+    import PythonQt
+except ImportError:
+    # the historical lcm type build runs lcmUtils in a plain python subprocess
+    PythonQt = None
 
 class GlobalLCM(object):
 
   _handle = None
   _lcmThread = None
+  _trafficMonitor = None
 
   @classmethod
   def get(cls):
@@ -22,16 +34,39 @@ class GlobalLCM(object):
           cls._handle = lcm.LCM()
       return cls._handle
 
+  # Channels handled by worker threads instead of the lcm receive thread,
+  # group name -> (queue capacity, channel patterns).  Each group has its own
+  # thread and drops its oldest message when the queue is full.  Images are
+  # only useful when recent, while every lidar scan line is accumulated into
+  # a sweep, so the lidar queue is large enough to ride out a slow handler.
+  # Everything else, including EST_ROBOT_STATE, is handled inline by the
+  # receive thread.
+  dispatchGroups = {
+      'images' : (4, ['CAMERA.*', 'KINECT_.*']),
+      'lidar' : (64, ['VELODYNE', 'MULTISENSE_SCAN', 'SCAN']),
+      }
+
   @classmethod
   def getThread(cls):
       if cls._lcmThread == None:
           cls._lcmThread = PythonQt.dd.ddLCMThread()
+          for groupName, (queueCapacity, channelPatterns) in cls.dispatchGroups.iteritems():
+              cls._lcmThread.addGroup(groupName, queueCapacity)
+              for channelPattern in channelPatterns:
+                  cls._lcmThread.addChannelToGroup(channelPattern, groupName)
           atexit.register(cls.finalize)
           cls._lcmThread.start()
       return cls._lcmThread
 
+  @classmethod
+  def getTrafficMonitor(cls):
+      if cls._trafficMonitor == None:
+          cls._trafficMonitor = cls.getThread().trafficMonitor()
+      return cls._trafficMonitor
+
   @classmethod
   def finalize(cls):
+      cls._trafficMonitor = None
       if cls._lcmThread:
           cls._lcmThread.delete()
           cls._lcmThread = None
@@ -45,6 +80,15 @@ def getGlobalLCMThread():
     return GlobalLCM.getThread()
 
 
+def getTrafficMonitor():
+    '''
+    Returns the ddLCMTrafficMonitor of the global LCM thread.  The monitor
+    starts collecting statistics for all channels on first use.  See
+    lcmspy.getTrafficStatistics() for a python friendly query interface.
+    '''
+    return GlobalLCM.getTrafficMonitor()
+
+
 def captureMessage(channel, messageClass, lcmHandle=None):
 
     lcmHandle = lcmHandle or getGlobalLCM()
@@ -100,18 +144,24 @@ def addSubscriber(channel, messageClass=None, callback=None, historicalLoader=No
     lcmThread = getGlobalLCMThread()
     subscriber = PythonQt.dd.ddLCMSubscriber(channel, lcmThread)
 
-    def handleMessage(messageData):
+    def handleMessage(messageData, channelName):
         loadSuccessful = False
+        startTime = time.time()
         try:
             msg = messageClass.decode(messageData.data())
             loadSuccessful = True
         except ValueError:
             if historicalLoader is not None:
-                # try:
+                try:
                     msg = historicalLoader.decode(messageClass.__module__.split('.')[-1], messageData.data())
                     loadSuccessful = True
-                # except ValueError:
-                #     pass
+                except ValueError:
+                    pass
+
+        trafficMonitor = GlobalLCM._trafficMonitor
+        if trafficMonitor is not None:
+            trafficMonitor.recordDecodeTime(channelName, time.time() - startTime)
+
         if loadSuccessful:
             callback(msg)
         else:
@@ -129,6 +179,65 @@ def addSubscriber(channel, messageClass=None, callback=None, historicalLoader=No
     return subscriber
 
 
+def addBufferedSubscriber(channel, capacity=100, callback=None):
+    '''
+    Returns a subscriber that keeps up to capacity of the most recent
+    messages in a ring buffer instead of notifying the main thread for every
+    message.  Drain it with takeMessages() or takePackedMessages().  If
+    callback is given it is called as callback(subscriber) once each time
+    the buffer becomes non-empty.
+    '''
+    lcmThread = getGlobalLCMThread()
+    subscriber = PythonQt.dd.ddLCMSubscriber(channel, lcmThread)
+    subscriber.setBufferCapacity(capacity)
+
+    if callback is not None:
+        subscriber.connect('messagesAvailable(const QString&)', lambda channelName: callback(subscriber))
+
+    lcmThread.addSubscriber(subscriber)
+    return subscriber
+
+
+def unpackMessages(packedData):
+    '''
+    Given the byte string returned by ddLCMSubscriber.takePackedMessages(),
+    returns a tuple (utimes, messages) where utimes is a numpy array of
+    receive times and messages is a list of message byte strings.
+    '''
+    header = np.frombuffer(packedData, dtype=np.int64, count=1)
+    count = int(header[0]) if len(header) else 0
+    if not count:
+        return np.zeros(0, dtype=np.int64), []
+
+    values = np.frombuffer(packedData, dtype=np.int64, count=2*count + 2)
+    utimes = values[1:count+1]
+    offsets = values[count+1:] + values.nbytes
+    messages = [packedData[offsets[i]:offsets[i+1]] for i in xrange(count)]
+    return utimes, messages
+
+
+def takePackedMessages(subscriber):
+    '''
+    Drains a buffered subscriber in a single call and returns a tuple
+    (utimes, messages), see unpackMessages().
+    '''
+    return unpackMessages(subscriber.takePackedMessages().data())
+
+
+def takeMessages(subscriber, messageClass):
+    '''
+    Drains a buffered subscriber and returns the list of decoded messages,
+    oldest first.  Messages that fail to decode are skipped.
+    '''
+    messages = []
+    for messageData in takePackedMessages(subscriber)[1]:
+        try:
+            messages.append(messageClass.decode(messageData))
+        except ValueError:
+            print 'error decoding message on channel:', subscriber.channel()
+    return messages
+
+
 def removeSubscriber(subscriber):
     lcmThread = getGlobalLCMThread()
     lcmThread.removeSubscriber(subscriber)
@@ -250,16 +359,48 @@ class LogPlayerCommander(object):
 class TypeNotFoundError(Exception):
     pass
 
+def _buildHistoricalRevisionArgs(args):
+    return _buildHistoricalRevision(*args)
+
+
+def _buildHistoricalRevision(package_name, lcmtypes_path, repo_path, sha):
+    """
+    Process pool entry point for HistoricalLCMLoader.buildRevision.
+    """
+    loader = HistoricalLCMLoader(package_name, lcmtypes_path, repo_path)
+    try:
+        return sha, loader.buildRevision(sha)
+    except (subprocess.CalledProcessError, TypeNotFoundError, ImportError, SyntaxError):
+        return sha, {}
+
+
+def _getPythonExecutable():
+    """
+    Returns the python interpreter for build subprocesses.  In the embedded interpreter of the application sys.executable may be the application itself.
+    """
+    if sys.executable and os.path.basename(sys.executable).startswith('python'):
+        return sys.executable
+    return 'python'
+
+
 class HistoricalLCMLoader(object):
     """
     A helper class which can be added to a call to addSubscriber in order to allow the subscriber to decode messages which were generated with an older version of the LCM type definitions.
+
+    Every historical revision of the package is compiled once into the build directory, and the packed fingerprint of each type is recorded in an on-disk registry.  Decoding an old message is then a lookup of its first 8 bytes, the same way lcmspy.getMessageClass works.  The registry can be prebuilt offline with buildRegistry (see scripts/buildHistoricalLCMTypes.py).  Revisions that are missing when an unknown message arrives are built by buildRegistry in a background python process, and the message is rejected until the build finishes and the registry is reloaded.
     """
-    def __init__(self, package_name, lcmtypes_path, repo_path):
+    def __init__(self, package_name, lcmtypes_path, repo_path, processes=4):
         self.package_name = package_name
         self.lcmtypes_path = lcmtypes_path
         self.repo_path = repo_path
+        self.processes = processes
         self.type_cache = {}
-        self._mru_shas_cache = {}
+        self._registry = None
+        self._registry_lock = threading.Lock()
+        self._build_process = None
+        self._tried_shas = set()
+        self._package_shas = None
+        self._unknown_fingerprints = set()
         self._initialized = False
         self._build_dir = None
         self._tmpdir = None
@@ -289,12 +430,160 @@ class HistoricalLCMLoader(object):
                 os.mkdir(self._tmpdir)
         return self._tmpdir
 
+    def makeDirectories(self):
+        """
+        Create the source and build directories. This must happen before worker processes are started so they do not race to create them.
+        """
+        return self.source_dir, self.build_dir
+
+    @property
+    def registry_file(self):
+        return os.path.join(self.build_dir, self.package_name + '_registry.pickle')
+
+    @property
+    def registry(self):
+        """
+        A dict with keys 'shas', the set of revisions already built, and 'types', a map from packed fingerprint to (type_name, sha).
+        """
+        if self._registry is None:
+            try:
+                self._registry = pickle.load(open(self.registry_file, 'rb'))
+            except (IOError, EOFError, pickle.UnpicklingError):
+                self._registry = {'shas': set(), 'types': {}}
+        return self._registry
+
+    def saveRegistry(self):
+        with self._registry_lock:
+            tmp_file = self.registry_file + '.tmp'
+            pickle.dump(self.registry, open(tmp_file, 'wb'), pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, self.registry_file)
+
+    def addToRegistry(self, sha, fingerprints):
+        with self._registry_lock:
+            registry = self.registry
+            registry['shas'].add(sha)
+            for fingerprint, type_name in fingerprints.iteritems():
+                registry['types'].setdefault(fingerprint, (type_name, sha))
+
+    def getPackageSHAs(self):
+        """
+        Find the git SHAs for all revisions to the lcmtypes directory
+        """
+        cdata = subprocess.check_output("git --no-pager -C {0:s} log --pretty=format:%H -- {1:s}".format(
+            self.repo_path, self.lcmtypes_path), shell=True)
+        return [c[:40] for c in cdata.split('\n') if len(c) >= 40]
+
+    @property
+    def package_shas(self):
+        """
+        The result of getPackageSHAs, computed on first use.
+        """
+        if self._package_shas is None:
+            self._package_shas = self.getPackageSHAs()
+        return self._package_shas
+
+    def getMissingSHAs(self):
+        return [sha for sha in self.package_shas if sha not in self.registry['shas']]
+
+    def buildRevision(self, sha):
+        """
+        Build the python modules for every type of the package at the given revision. Returns a dict mapping packed fingerprint to type name.
+        """
+        sha_source_dir = os.path.join(self.source_dir, sha)
+        if not os.path.exists(sha_source_dir):
+            os.makedirs(sha_source_dir)
+
+        archive_dir = tempfile.mkdtemp(dir=self.tmpdir)
+        try:
+            subprocess.check_call("git -C {base:s} archive {sha:s} {typepath:s} | tar -x -C {dest:s}".format(
+                                    base=self.repo_path, sha=sha, typepath=self.lcmtypes_path, dest=archive_dir),
+                                  shell=True)
+
+            lcm_files = glob.glob(os.path.join(archive_dir, self.lcmtypes_path, self.package_name + '_*.lcm'))
+            if not lcm_files:
+                raise TypeNotFoundError("No LCM types found at this revision")
+
+            for lcm_file in lcm_files:
+                shutil.copy(lcm_file, sha_source_dir)
+        finally:
+            shutil.rmtree(archive_dir)
+
+        self.buildTypeAtSHA(None, sha)
+
+        fingerprints = {}
+        final_pkg_dir = os.path.join(self.build_dir, sha, self.package_name + str(sha))
+        for f in os.listdir(final_pkg_dir):
+            if f.endswith('.py') and f != '__init__.py':
+                type_name = f.replace('.py', '')
+                msg_class = self.getTypeAtSHA(type_name, sha)
+                fingerprints[msg_class._get_packed_fingerprint()] = type_name
+        return fingerprints
+
+    def buildRegistry(self, processes=None, callback=None):
+        """
+        Build every revision which is not yet in the registry using a process pool, and save the registry.  This is the offline build step.  callback, if given, is called with (sha, number_done, number_total) after each revision.
+        """
+        self.makeDirectories()
+        shas = self.getMissingSHAs()
+        pool = multiprocessing.Pool(processes or self.processes)
+        args = [(self.package_name, self.lcmtypes_path, self.repo_path, sha) for sha in shas]
+        try:
+            for i, (sha, fingerprints) in enumerate(pool.imap_unordered(_buildHistoricalRevisionArgs, args)):
+                self.addToRegistry(sha, fingerprints)
+                if callback:
+                    callback(sha, i + 1, len(shas))
+        finally:
+            pool.close()
+            pool.join()
+        self.saveRegistry()
+
+    def buildMissingRevisionsAsync(self):
+        """
+        Start a python process that runs buildRegistry for the revisions that have not been tried yet, without blocking the caller.  The process builds with its own process pool, so nothing is forked from the application.  See pollBuild.
+        """
+        if self._build_process is not None:
+            return
+
+        shas = [sha for sha in self.getMissingSHAs() if sha not in self._tried_shas]
+        if not shas:
+            return
+
+        self.makeDirectories()
+        self._tried_shas.update(shas)
+
+        command = 'from ddapp import lcmUtils; lcmUtils.HistoricalLCMLoader(%r, %r, %r).buildRegistry(processes=%d)' % (
+                    self.package_name, self.lcmtypes_path, self.repo_path, self.processes)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        self._build_process = subprocess.Popen([_getPythonExecutable(), '-c', command], env=env)
+
+    def pollBuild(self):
+        """
+        Returns True while the build process is running.  When it has finished the registry is reloaded from disk on next use.
+        """
+        if self._build_process is None:
+            return False
+        if self._build_process.poll() is None:
+            return True
+
+        if self._build_process.returncode != 0:
+            print "Warning: failed to build historical LCM types, exit code %d" % self._build_process.returncode
+        self._build_process = None
+        self._registry = None
+        return False
+
+    def isBuildComplete(self):
+        """
+        Returns True when no build is running and every revision of the package has been built or tried.
+        """
+        return not self.pollBuild() and all(sha in self._tried_shas or sha in self.registry['shas'] for sha in self.package_shas)
+
     def buildTypeAtSHA(self, type_name, sha):
         """
-        Build the python source files for the given type and revision. We rename the python module from its default (which is just the LCM package name) to [packagename][sha] to prevent namespace conflicts.
+        Build the python source files for the given type and revision. We rename the python module from its default (which is just the LCM package name) to [packagename][sha] to prevent namespace conflicts.  If type_name is None, all source files already present for the revision are built.
         """
-        source_files = self.getOrCreateSourceFiles(type_name, sha, recursive=True)
-        sha_source_dir = os.path.dirname(source_files[0])
+        if type_name is not None:
+            self.getOrCreateSourceFiles(type_name, sha, recursive=True)
+        sha_source_dir = os.path.join(self.source_dir, sha)
         sha_build_dir = os.path.join(self.build_dir, sha)
         if not os.path.exists(sha_build_dir):
             os.makedirs(sha_build_dir)
@@ -413,29 +702,37 @@ class HistoricalLCMLoader(object):
 
         return self.type_cache[(type_name, sha)]
 
+    def getRegisteredClass(self, msg_data):
+        """
+        Returns the historical python class registered for the packed fingerprint at the start of msg_data, or None.
+        """
+        entry = self.registry['types'].get(msg_data[:8])
+        if entry is None:
+            return None
+        type_name, sha = entry
+        return self.getTypeAtSHA(type_name, sha)
+
     def decode(self, type_name, msg_data):
         """
-        Try to decode an LCM message using its historical definitions. Uses a MRU (most recently used) queue of commit SHAs to try to ensure that repeated calls for messages of the same type are fast
+        Try to decode an LCM message using its historical definitions. The message class is looked up in the registry by fingerprint.  If it is not registered, the missing revisions are built in the background and a ValueError is raised.  Fingerprints that are still unknown after every revision has been tried are remembered and rejected without further work.
         """
+        building = self.pollBuild()
+        msg_class = self.getRegisteredClass(msg_data)
+        if msg_class is not None:
+            return msg_class.decode(msg_data)
+
+        fingerprint = msg_data[:8]
+        if fingerprint in self._unknown_fingerprints or building:
+            raise ValueError("Unable to decode message data with any available type definitions.")
+
+        if self.isBuildComplete():
+            self._unknown_fingerprints.add(fingerprint)
+            raise ValueError("Unable to decode message data with any available type definitions.")
+
         if not self._initialized:
-            print "Warning: Possible out-of-date LCM message received. I will now try to decode the message using older versions of the type definition. This will be slow the first time it happens."
+            print "Warning: Possible out-of-date LCM message received for type %s. Building historical LCM type definitions in the background, messages of this type will be dropped until the build completes." % type_name
             self._initialized = True
-        i = 0
-        if not type_name in self._mru_shas_cache:
-            self._mru_shas_cache[type_name] = list(self.getSHAsForTypeAndChildren(type_name))
-        for i, sha in enumerate(self._mru_shas_cache[type_name]):
-            try:
-                msg_class = self.getTypeAtSHA(type_name, sha)
-            except TypeNotFoundError:
-                continue
-            try:
-                # print "Trying to decode using definition of type from commit {sha:s}".format(sha=sha[:8])
-                msg_obj = msg_class.decode(msg_data)
-            except ValueError as e:
-                continue
-            self._mru_shas_cache[type_name].pop(i)
-            self._mru_shas_cache[type_name].insert(0, sha)
-            return msg_obj
+        self.buildMissingRevisionsAsync()
         raise ValueError("Unable to decode message data with any available type definitions.")
 
 
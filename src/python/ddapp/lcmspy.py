@@ -174,6 +174,98 @@ def printLogFileDescription(filename):
     printLCMCatalog()
 
 
+trafficStatisticsFields = ['message_count', 'total_bytes', 'message_rate', 'bandwidth', 'mean_interval',
+                           'jitter', 'age', 'last_message_size', 'decode_time']
+
+
+def getTrafficMonitor():
+    from ddapp import lcmUtils
+    return lcmUtils.getTrafficMonitor()
+
+
+def getChannelStatistics(channel, monitor=None):
+    '''
+    Returns a dict of traffic statistics for the channel, keyed by the names
+    in trafficStatisticsFields, or None if no message has been received on
+    the channel.  Rates are per second over the monitor window, times are
+    in seconds and sizes are in bytes.
+    '''
+    monitor = monitor or getTrafficMonitor()
+    values = monitor.channelStatistics(channel)
+    if not values:
+        return None
+    return dict(zip(trafficStatisticsFields, values))
+
+
+def getTrafficStatistics(monitor=None):
+    '''
+    Returns a dict of channel name to channel statistics dict for every
+    channel seen by the traffic monitor.
+    '''
+    monitor = monitor or getTrafficMonitor()
+    statistics = {}
+    for channel in monitor.channels():
+        channelStatistics = getChannelStatistics(channel, monitor)
+        if channelStatistics:
+            statistics[channel] = channelStatistics
+    return statistics
+
+
+def getIntervalHistogram(channel, monitor=None):
+    '''
+    Returns a list of (minInterval, count) pairs for the inter-arrival times
+    received on the channel.  The bins are powers of two microseconds, so a
+    bin holds intervals in [minInterval, 2*minInterval) seconds.
+    '''
+    monitor = monitor or getTrafficMonitor()
+    counts = monitor.intervalHistogram(channel)
+    return [((2**i)*1e-6 if i else 0.0, int(count)) for i, count in enumerate(counts)]
+
+
+def formatTrafficSummary(statistics, maxChannels=None):
+    '''
+    Formats the result of getTrafficStatistics() as text with one line per
+    channel, sorted by decreasing bandwidth.
+    '''
+    channels = sorted(statistics.keys(), key=lambda channel: statistics[channel]['bandwidth'], reverse=True)
+    totalBandwidth = sum(channelStatistics['bandwidth'] for channelStatistics in statistics.values())
+
+    lines = ['total: %.1f kB/s on %d channels' % (totalBandwidth/1024.0, len(channels))]
+    for channel in channels[:maxChannels]:
+        s = statistics[channel]
+        lines.append('%s: %.1f Hz  %.1f kB/s  jitter %.1f ms  age %.1f s' % (channel, s['message_rate'],
+                      s['bandwidth']/1024.0, s['jitter']*1e3, s['age']))
+    return '\n'.join(lines)
+
+
+def printTrafficStatistics(maxChannels=None):
+    print formatTrafficSummary(getTrafficStatistics(), maxChannels)
+
+
+dispatchGroupStatisticsFields = ['queue_length', 'queue_capacity', 'message_count', 'dropped_count',
+                                 'mean_latency', 'max_latency', 'mean_handler_time', 'max_handler_time']
+
+
+def getDispatchGroupStatistics():
+    '''
+    Returns a dict of dispatch group name to a dict of statistics keyed by
+    the names in dispatchGroupStatisticsFields.  Latency is measured from
+    lcm receive time to the start of the message handler, times are in
+    seconds.
+    '''
+    from ddapp import lcmUtils
+    lcmThread = lcmUtils.getGlobalLCMThread()
+    return dict((group, dict(zip(dispatchGroupStatisticsFields, lcmThread.groupStatistics(group))))
+                for group in lcmThread.groups())
+
+
+def printDispatchGroupStatistics():
+    for group, s in sorted(getDispatchGroupStatistics().iteritems()):
+        print '%s: %d msgs  %d dropped  queue %d/%d  latency %.1f ms (max %.1f)  handler %.1f ms (max %.1f)' % (
+               group, s['message_count'], s['dropped_count'], s['queue_length'], s['queue_capacity'],
+               s['mean_latency']*1e3, s['max_latency']*1e3, s['mean_handler_time']*1e3, s['max_handler_time']*1e3)
+
+
 def spyLCMTraffic():
 
     lc = lcm.LCM()
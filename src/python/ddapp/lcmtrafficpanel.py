@@ -0,0 +1,125 @@
+from PythonQt import QtCore, QtGui
+from ddapp import applogic as app
+from ddapp import lcmUtils
+from ddapp import lcmspy
+from ddapp.timercallback import TimerCallback
+from ddapp.utime import getUtime
+
+import drc as lcmdrc
+
+
+class LCMTrafficPanel(object):
+    '''
+    A table of live per channel LCM traffic statistics.  The statistics are
+    collected on the LCM thread by the traffic monitor, this panel only polls
+    them while it is visible.
+    '''
+
+    columns = ['channel', 'rate (Hz)', 'bandwidth (kB/s)', 'jitter (ms)', 'age (s)', 'size (kB)', 'decode (ms)']
+
+    def __init__(self, monitor):
+
+        self.monitor = monitor
+        self.items = {}
+
+        self.widget = QtGui.QWidget()
+        self.widget.setWindowTitle('LCM Traffic')
+
+        self.totalLabel = QtGui.QLabel('')
+        self.table = QtGui.QTableWidget()
+        self.table.setColumnCount(len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+
+        resetButton = QtGui.QPushButton('Reset')
+        resetButton.connect('clicked()', self.monitor.reset)
+
+        l = QtGui.QVBoxLayout(self.widget)
+        l.addWidget(self.totalLabel)
+        l.addWidget(self.table)
+        l.addWidget(resetButton)
+
+        self.timer = TimerCallback(targetFps=2)
+        self.timer.callback = self.updatePanel
+        self.timer.start()
+
+    def item(self, row, column):
+        rowItems = self.items.setdefault(row, {})
+        try:
+            return rowItems[column]
+        except KeyError:
+            item = QtGui.QTableWidgetItem('')
+            self.table.setItem(row, column, item)
+            rowItems[column] = item
+            return item
+
+    def updatePanel(self):
+
+        if not self.widget.visible:
+            return
+
+        statistics = lcmspy.getTrafficStatistics(self.monitor)
+        channels = sorted(statistics.keys(), key=lambda channel: statistics[channel]['bandwidth'], reverse=True)
+
+        totalBandwidth = sum(s['bandwidth'] for s in statistics.values())
+        self.totalLabel.text = 'total: %.1f kB/s on %d channels' % (totalBandwidth/1024.0, len(channels))
+
+        self.table.setRowCount(len(channels))
+        for row, channel in enumerate(channels):
+            s = statistics[channel]
+            values = [channel,
+                      '%.1f' % s['message_rate'],
+                      '%.2f' % (s['bandwidth']/1024.0),
+                      '%.2f' % (s['jitter']*1e3),
+                      '%.1f' % s['age'],
+                      '%.2f' % (s['last_message_size']/1024.0),
+                      '%.3f' % (s['decode_time']*1e3)]
+            for column, value in enumerate(values):
+                self.item(row, column).setText(value)
+
+
+class TrafficSummaryPublisher(object):
+    '''
+    Periodically publishes a text summary of the LCM traffic statistics as a
+    system_status_t message, so the traffic seen by this process can be
+    monitored from other machines and recorded in logs.
+    '''
+
+    def __init__(self, monitor, channel='LCM_TRAFFIC_SUMMARY', period=5.0, maxChannels=20):
+        self.monitor = monitor
+        self.channel = channel
+        self.maxChannels = maxChannels
+        self.timer = TimerCallback(targetFps=1.0/period)
+        self.timer.callback = self.publish
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def publish(self):
+        msg = lcmdrc.system_status_t()
+        msg.utime = getUtime()
+        msg.value = lcmspy.formatTrafficSummary(lcmspy.getTrafficStatistics(self.monitor), self.maxChannels)
+        lcmUtils.publish(self.channel, msg)
+
+
+def init(publishSummary=False):
+
+    global panel
+    global dock
+    global summaryPublisher
+
+    monitor = lcmUtils.getTrafficMonitor()
+
+    panel = LCMTrafficPanel(monitor)
+    dock = app.addWidgetToDock(panel.widget, action=None)
+    dock.hide()
+
+    summaryPublisher = TrafficSummaryPublisher(monitor)
+    if publishSummary:
+        summaryPublisher.start()
+
+    return panel
@@ -11,6 +11,7 @@ class MeshManager(object):
         self.meshes = {}
         self.cacheDirectory = '/tmp'
         self.cacheDataType = 'stl'
+        self.encodeOptions = dict(positionEncoding='float32', compression='zlib', level=6)
         self.collection = lcmobjectcollection.LCMObjectCollection(channel='MESH_COLLECTION_COMMAND')
         self.collection.connectDescriptionUpdated(self._onDescriptionUpdated)
 
@@ -18,9 +19,14 @@ class MeshManager(object):
         meshId = newUUID()
         self.meshes[meshId] = polyData
         if publish:
-            self.collection.updateDescription(dict(uuid=meshId, data=geometryencoder.encodePolyData(polyData)), notify=False)
+            self.collection.updateDescription(dict(uuid=meshId, data=self.encodePolyData(polyData)), notify=False)
         return meshId
 
+    def encodePolyData(self, polyData):
+        if self.encodeOptions is None:
+            return geometryencoder.encodePolyData(polyData)
+        return geometryencoder.encodePolyDataCompressed(polyData, **self.encodeOptions)
+
     def get(self, meshId):
         return self.meshes.get(meshId)
 
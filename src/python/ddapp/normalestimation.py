@@ -0,0 +1,169 @@
+'''
+Point cloud normal and curvature estimation with numpy.
+
+Normals are the eigenvector of the smallest eigenvalue of the covariance of
+the neighbors within the search radius, oriented towards the view point,
+as in pcl::NormalEstimation.  One kd-tree is built for the search cloud and
+shared by worker threads that each process a chunk of the query points.
+Besides 'normals' the output has a 'curvature' array, the surface variation
+l0 / (l0 + l1 + l2), and an 'eigenvalues' array with the three covariance
+eigenvalues in ascending order.  Points with fewer than three neighbors get
+NaN values.
+
+Results are memoized per (cloud, search radius, search cloud), so repeated
+fits on the same snapshot reuse them.  The cache is keyed on the polydata
+modified time, see voxelgrid.getPolyDataCacheKey.
+
+Neighbors are found with scipy's cKDTree.  Without scipy estimateNormals
+falls back to vtkPCLNormalEstimation, without the extra arrays.
+'''
+
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+import numpy as np
+
+from ddapp import vtkAll as vtk
+from ddapp import vtkNumpy as vnp
+from ddapp import voxelgrid
+from ddapp.shallowCopy import shallowCopy
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+_threadPool = None
+_resultCache = OrderedDict()
+_resultCacheSize = 8
+
+
+def _getThreadPool():
+    global _threadPool
+    if _threadPool is None:
+        _threadPool = ThreadPool(multiprocessing.cpu_count())
+    return _threadPool
+
+
+def _estimateChunk(tree, searchPoints, points, searchRadius, maxNeighbors, viewPoint):
+
+    distances, indices = tree.query(points, k=maxNeighbors, distance_upper_bound=searchRadius)
+
+    valid = np.isfinite(distances)
+    counts = valid.sum(axis=1)
+    indices[~valid] = 0
+
+    weights = valid[:,:,None].astype(np.float64)
+    divisor = np.maximum(counts, 1).astype(np.float64)
+
+    neighbors = searchPoints[indices]
+    means = (neighbors*weights).sum(axis=1) / divisor[:,None]
+    centered = (neighbors - means[:,None,:])*weights
+    covariances = np.einsum('nki,nkj->nij', centered, centered) / divisor[:,None,None]
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariances)
+    normals = eigenvectors[:,:,0]
+
+    flip = np.einsum('ni,ni->n', viewPoint - points, normals) < 0
+    normals[flip] *= -1
+
+    eigenvalueSums = eigenvalues.sum(axis=1)
+    curvature = eigenvalues[:,0] / np.where(eigenvalueSums > 0, eigenvalueSums, 1.0)
+
+    invalid = counts < 3
+    normals[invalid] = np.nan
+    curvature[invalid] = np.nan
+    eigenvalues[invalid] = np.nan
+
+    return normals, curvature, eigenvalues
+
+
+def computeNormals(points, searchPoints=None, searchRadius=0.05, maxNeighbors=50, viewPoint=(0.0, 0.0, 0.0), chunkSize=10000):
+    '''
+    Given an Nx3 array of points returns a tuple (normals, curvature,
+    eigenvalues) with N rows each.  The neighbors of each point are
+    searched in searchPoints, or in points if searchPoints is None, and at
+    most maxNeighbors nearest neighbors within searchRadius are used.
+    Requires scipy.
+    '''
+    assert cKDTree is not None
+    assert maxNeighbors >= 3
+
+    points = np.asarray(points, dtype=np.float64)
+    searchPoints = points if searchPoints is None else np.asarray(searchPoints, dtype=np.float64)
+    viewPoint = np.asarray(viewPoint, dtype=np.float64)
+
+    if not len(points) or not len(searchPoints):
+        return np.zeros((len(points), 3)) * np.nan, np.zeros(len(points)) * np.nan, np.zeros((len(points), 3)) * np.nan
+
+    tree = cKDTree(searchPoints)
+
+    chunks = [points[i:i+chunkSize] for i in xrange(0, len(points), chunkSize)]
+    estimate = lambda chunk: _estimateChunk(tree, searchPoints, chunk, searchRadius, maxNeighbors, viewPoint)
+
+    if len(chunks) == 1:
+        results = [estimate(chunks[0])]
+    else:
+        results = _getThreadPool().map(estimate, chunks)
+
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def _estimateNormalsPCL(polyData, searchCloud, searchRadius):
+
+    f = vtk.vtkPCLNormalEstimation()
+    f.SetSearchRadius(searchRadius)
+    f.SetInput(polyData)
+    if searchCloud:
+        f.SetInput(1, searchCloud)
+    f.Update()
+    return shallowCopy(f.GetOutput())
+
+
+def estimateNormals(polyData, searchCloud=None, searchRadius=0.05, searchCloudKey=None, maxNeighbors=50):
+    '''
+    Returns a shallow copy of polyData with 'normals', 'curvature' and
+    'eigenvalues' point data arrays.  The neighbors are searched in
+    searchCloud, or in polyData if searchCloud is None.  Results are
+    memoized, searchCloudKey can replace the identity of the search cloud
+    in the cache key when it is derived from polyData, for example a voxel
+    grid that is recomputed on each call.
+    '''
+    if not polyData.GetNumberOfPoints():
+        return shallowCopy(polyData)
+
+    if cKDTree is None:
+        polyData = _estimateNormalsPCL(polyData, searchCloud, searchRadius)
+        polyData.GetPointData().SetNormals(polyData.GetPointData().GetArray('normals'))
+        return polyData
+
+    if searchCloudKey is None and searchCloud is not None:
+        searchCloudKey = voxelgrid.getPolyDataCacheKey(searchCloud)
+
+    key = (voxelgrid.getPolyDataCacheKey(polyData), round(searchRadius, 9), searchCloudKey, maxNeighbors)
+
+    result = _resultCache.pop(key, None)
+    if result is None:
+        points = vnp.getNumpyFromVtk(polyData, 'Points')
+        searchPoints = None
+        if searchCloud is not None:
+            searchPoints = vnp.getNumpyFromVtk(searchCloud, 'Points') if searchCloud.GetNumberOfPoints() else np.zeros((0, 3))
+        result = computeNormals(points, searchPoints, searchRadius, maxNeighbors)
+    _resultCache[key] = result
+
+    while len(_resultCache) > _resultCacheSize:
+        _resultCache.popitem(last=False)
+
+    normals, curvature, eigenvalues = result
+
+    polyData = shallowCopy(polyData)
+    vnp.addNumpyToVtk(polyData, normals.astype(np.float32), 'normals')
+    vnp.addNumpyToVtk(polyData, curvature.astype(np.float32), 'curvature')
+    vnp.addNumpyToVtk(polyData, eigenvalues.astype(np.float32), 'eigenvalues')
+    polyData.GetPointData().SetNormals(polyData.GetPointData().GetArray('normals'))
+    return polyData
+
+
+def clearCache():
+    _resultCache.clear()
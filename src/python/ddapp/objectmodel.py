@@ -1,5 +1,6 @@
 import os
 import PythonQt
+from collections import OrderedDict
 from PythonQt import QtCore, QtGui
 from ddapp.propertyset import PropertySet, PropertyAttributes, PropertyPanelHelper
 from ddapp import callbacks
@@ -79,6 +80,9 @@ class ObjectModelItem(object):
     def setProperty(self, propertyName, propertyValue):
         self.properties.setProperty(propertyName, propertyValue)
 
+    def setProperties(self, properties=None, **kwargs):
+        self.properties.setProperties(properties, **kwargs)
+
     def getPropertyAttribute(self, propertyName, propertyAttribute):
         return self.properties.getPropertyAttribute(propertyName, propertyAttribute)
 
@@ -98,6 +102,9 @@ class ObjectModelItem(object):
     def hasDataSet(self, dataSet):
         return False
 
+    def hasActor(self, actor):
+        return False
+
     def getActionNames(self):
         actions = ['Rename']
         return actions
@@ -175,6 +182,12 @@ class ObjectModelTree(object):
         self._treeWidget = None
         self._propertiesPanel = None
         self._objects = {}
+        self._itemsByObject = {}
+        self._parents = {}
+        self._children = {None : OrderedDict()}
+        self._names = {}
+        self._objectsByName = {}
+        self._bulkUpdateDepth = 0
         self._blockSignals = False
         self.actions = []
         self.callbacks = callbacks.CallbackRegistry([self.ACTION_SELECTED])
@@ -186,17 +199,13 @@ class ObjectModelTree(object):
         return self._propertiesPanel
 
     def getObjectParent(self, obj):
-        item = self._getItemForObject(obj)
-        if item.parent():
-            return self._getObjectForItem(item.parent())
+        return self._parents[obj]
 
     def getObjectChildren(self, obj):
-        item = self._getItemForObject(obj)
-        return [self._getObjectForItem(item.child(i)) for i in xrange(item.childCount())]
+        return self._children[obj].keys()
 
     def getTopLevelObjects(self):
-        return [self._getObjectForItem(self._treeWidget.topLevelItem(i))
-                  for i in xrange(self._treeWidget.topLevelItemCount)]
+        return self._children[None].keys()
 
     def getActiveObject(self):
         item = self._getSelectedItem()
@@ -217,29 +226,46 @@ class ObjectModelTree(object):
     def getObjects(self):
         return self._objects.values()
 
+    def containsObject(self, obj):
+        return obj in self._itemsByObject
+
     def _getSelectedItem(self):
         items = self.getTreeWidget().selectedItems()
         return items[0] if len(items) == 1 else None
 
     def _getItemForObject(self, obj):
-        for item, itemObj in self._objects.iteritems():
-            if itemObj == obj:
-                return item
+        return self._itemsByObject.get(obj)
 
     def _getObjectForItem(self, item):
         return self._objects[item]
 
+    def _addToNameIndex(self, obj, name):
+        self._names[obj] = name
+        self._objectsByName.setdefault(name, OrderedDict())[obj] = None
+
+    def _removeFromNameIndex(self, obj):
+        name = self._names.pop(obj)
+        objs = self._objectsByName[name]
+        del objs[obj]
+        if not objs:
+            del self._objectsByName[name]
+
+    def findObjectsByName(self, name):
+        '''
+        Returns all objects with the given name, in the order they were added.
+        '''
+        return self._objectsByName.get(name, {}).keys()
+
     def findObjectByName(self, name, parent=None):
         if parent:
             return self.findChildByName(parent, name)
-        for obj in self._objects.values():
-            if obj.getProperty('Name') == name:
-                return obj
+        for obj in self._objectsByName.get(name, ()):
+            return obj
 
     def findChildByName(self, parent, name):
-        for child in self.getObjectChildren(parent):
-            if child.getProperty('Name') == name:
-                return child
+        for obj in self._objectsByName.get(name, ()):
+            if self._parents[obj] is parent:
+                return obj
 
     def onPropertyChanged(self, prop):
 
@@ -281,8 +307,11 @@ class ObjectModelTree(object):
         item.setIcon(0, Icons.getIcon(obj.getProperty('Icon')))
 
     def updateObjectName(self, obj):
+        name = obj.getProperty('Name')
         item = self._getItemForObject(obj)
-        item.setText(0, obj.getProperty('Name'))
+        item.setText(0, name)
+        self._removeFromNameIndex(obj)
+        self._addToNameIndex(obj, name)
 
     def _onPropertyValueChanged(self, obj, propertyName):
 
@@ -327,6 +356,10 @@ class ObjectModelTree(object):
             tree.takeTopLevelItem(tree.indexOfTopLevelItem(item))
 
         del self._objects[item]
+        del self._itemsByObject[obj]
+        del self._children[self._parents.pop(obj)][obj]
+        del self._children[obj]
+        self._removeFromNameIndex(obj)
 
 
     def removeFromObjectModel(self, obj):
@@ -342,6 +375,8 @@ class ObjectModelTree(object):
         assert obj._tree is None
 
         parentItem = self._getItemForObject(parentObj)
+        if parentItem is None:
+            parentObj = None
         objName = obj.getProperty('Name')
 
         item = QtGui.QTreeWidgetItem(parentItem, [objName])
@@ -350,6 +385,11 @@ class ObjectModelTree(object):
         obj._tree = self
 
         self._objects[item] = obj
+        self._itemsByObject[obj] = item
+        self._parents[obj] = parentObj
+        self._children[parentObj][obj] = None
+        self._children[obj] = OrderedDict()
+        self._addToNameIndex(obj, objName)
         self.updateVisIcon(obj)
 
         if parentItem is None:
@@ -357,6 +397,40 @@ class ObjectModelTree(object):
             tree.addTopLevelItem(item)
             tree.expandItem(item)
 
+    def beginBulkUpdate(self):
+        '''
+        Suspends repainting of the tree widget until the matching call to
+        endBulkUpdate().  Calls may be nested.
+        '''
+        self._bulkUpdateDepth += 1
+        if self._bulkUpdateDepth == 1 and self._treeWidget is not None:
+            self._treeWidget.setUpdatesEnabled(False)
+            self._treeWidget.blockSignals(True)
+
+    def endBulkUpdate(self):
+        assert self._bulkUpdateDepth > 0
+        self._bulkUpdateDepth -= 1
+        if self._bulkUpdateDepth == 0 and self._treeWidget is not None:
+            self._treeWidget.blockSignals(False)
+            self._treeWidget.setUpdatesEnabled(True)
+            self._onTreeSelectionChanged()
+
+    def addObjectsToObjectModel(self, objs, parentObj=None):
+        self.beginBulkUpdate()
+        try:
+            for obj in objs:
+                self.addToObjectModel(obj, parentObj)
+        finally:
+            self.endBulkUpdate()
+
+    def removeObjectsFromObjectModel(self, objs):
+        self.beginBulkUpdate()
+        try:
+            for obj in objs:
+                self.removeFromObjectModel(obj)
+        finally:
+            self.endBulkUpdate()
+
 
     def collapse(self, obj):
         item = self._getItemForObject(obj)
@@ -442,10 +516,9 @@ class ObjectModelTree(object):
 
 
     def removeSelectedItems(self):
-        for item in self.getTreeWidget().selectedItems():
-            obj = self._getObjectForItem(item)
-            if (not obj.hasProperty('Deletable')) or obj.getProperty('Deletable'):
-                self._removeItemFromObjectModel(item)
+        objs = [self._getObjectForItem(item) for item in self.getTreeWidget().selectedItems()]
+        objs = [obj for obj in objs if (not obj.hasProperty('Deletable')) or obj.getProperty('Deletable')]
+        self.removeObjectsFromObjectModel(objs)
 
 
     def _filterEvent(self, obj, event):
@@ -501,15 +574,33 @@ def clearSelection():
 def getObjects():
     return _t.getObjects()
 
+def containsObject(obj):
+    return _t.containsObject(obj)
+
 def findObjectByName(name, parent=None):
     return _t.findObjectByName(name, parent)
 
+def findObjectsByName(name):
+    return _t.findObjectsByName(name)
+
 def removeFromObjectModel(obj):
     _t.removeFromObjectModel(obj)
 
 def addToObjectModel(obj, parentObj=None):
     _t.addToObjectModel(obj, parentObj)
 
+def removeObjectsFromObjectModel(objs):
+    _t.removeObjectsFromObjectModel(objs)
+
+def addObjectsToObjectModel(objs, parentObj=None):
+    _t.addObjectsToObjectModel(objs, parentObj)
+
+def beginBulkUpdate():
+    _t.beginBulkUpdate()
+
+def endBulkUpdate():
+    _t.endBulkUpdate()
+
 def collapse(obj):
     _t.collapse(obj)
 
@@ -467,7 +467,7 @@ class MapServerSource(TimerCallback):
     def updatePolyData(self, viewId, polyData):
 
         obj = self.polyDataObjects.get(viewId)
-        if obj not in om.getObjects():
+        if not om.containsObject(obj):
             obj = None
         if not obj:
             hiddenMapIds = [9999]
@@ -35,6 +35,8 @@ class PointCloudItem(om.ObjectModelItem):
         self.addProperty('Updates Enabled', True)
         self.addProperty('Framerate', model.targetFps,
                          attributes=om.PropertyAttributes(decimals=0, minimum=1.0, maximum=30.0, singleStep=1, hidden=False))
+        self.addProperty('Accumulate Frames', model.numberOfFrames,
+                         attributes=om.PropertyAttributes(decimals=0, minimum=1, maximum=model.PointCloudQueue.historyLength(), singleStep=1, hidden=False))
         self.addProperty('Visible', model.visible)
         
     def _onPropertyChanged(self, propertySet, propertyName):
@@ -52,6 +54,9 @@ class PointCloudItem(om.ObjectModelItem):
         elif propertyName == 'Framerate':
             self.model.setFPS(self.getProperty('Framerate'))
 
+        elif propertyName == 'Accumulate Frames':
+            self.model.setNumberOfFrames(self.getProperty('Accumulate Frames'))
+
         elif propertyName == 'Color By':
             self._updateColorBy()
 
@@ -78,18 +83,19 @@ class PointCloudSource(TimerCallback):
         self.PointCloudQueue = _PointCloudQueue
 
         self.visible = True
-        
+        self.numberOfFrames = 1
+        self.lastUtime = 0
+
+        # the native queue transforms the points to local at decode time and
+        # copies frames into the arrays of this polydata, reusing them
         self.p = vtk.vtkPolyData()
-        utime = PointCloudQueue.getPointCloudFromPointCloud(self.p)
-        self.polyDataObj = vis.PolyDataItem('pointcloud source', shallowCopy(self.p), view)
+        self.PointCloudQueue.getLatestFrame(self.p)
+        self.polyDataObj = vis.PolyDataItem('pointcloud source', self.p, view)
         self.polyDataObj.actor.SetPickable(1)
         self.polyDataObj.initialized = False
 
         om.addToObjectModel(self.polyDataObj)
 
-        self.queue = PythonQt.dd.ddBotImageQueue(lcmUtils.getGlobalLCMThread())
-        self.queue.init(lcmUtils.getGlobalLCMThread(), drcargs.args().config_file)
-
         self.targetFps = 30
         self.timerCallback = TimerCallback(targetFps=self.targetFps)
         self.timerCallback.callback = self._updateSource
@@ -110,17 +116,37 @@ class PointCloudSource(TimerCallback):
     def setVisible(self, visible):
         self.polyDataObj.setProperty('Visible', visible)
 
+    def setNumberOfFrames(self, numberOfFrames):
+        self.numberOfFrames = int(numberOfFrames)
+        self.lastUtime = 0
+
+    def getMergedPointCloud(self, startUtime, endUtime):
+        '''
+        Returns a new polydata with all frames received between startUtime
+        and endUtime, in the local frame.
+        '''
+        polyData = vtk.vtkPolyData()
+        self.PointCloudQueue.getMergedFrames(startUtime, endUtime, polyData)
+        return polyData
+
     def _updateSource(self):
-        p = vtk.vtkPolyData()
-        utime = self.PointCloudQueue.getPointCloudFromPointCloud(p)
 
-        if not p.GetNumberOfPoints():
+        utimes = [int(utime) for utime in self.PointCloudQueue.frameUtimes()]
+        if not utimes or utimes[-1] == self.lastUtime:
+            return
+
+        if self.numberOfFrames > 1:
+            startUtime = utimes[-min(self.numberOfFrames, len(utimes))]
+            self.PointCloudQueue.getMergedFrames(startUtime, utimes[-1], self.p)
+        else:
+            self.PointCloudQueue.getLatestFrame(self.p)
+
+        self.lastUtime = utimes[-1]
+
+        if not self.p.GetNumberOfPoints():
             return
 
-        sensorToLocalFused = vtk.vtkTransform()
-        self.queue.getTransform('VELODYNE', 'local', utime, sensorToLocalFused)
-        p = filterUtils.transformPolyData(p,sensorToLocalFused)
-        self.polyDataObj.setPolyData(p)
+        self.polyDataObj.setPolyData(self.p)
 
         if not self.polyDataObj.initialized:
             self.polyDataObj.initialized = True
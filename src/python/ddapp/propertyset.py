@@ -48,12 +48,63 @@ def toQProperty(propertyName, propertyValue):
         return propertyValue
 
 
+def _isUnchangedValue(oldValue, newValue):
+    '''
+    Returns True if setting newValue in place of oldValue would not change the
+    property.  A mutable value that is the same object as the stored value may
+    have been modified in place, so it is always treated as a change.
+    '''
+    if isinstance(newValue, (list, dict, np.ndarray)) and newValue is oldValue:
+        return False
+    if type(oldValue) is not type(newValue):
+        return False
+    if isinstance(newValue, np.ndarray):
+        return newValue.shape == oldValue.shape and bool((newValue == oldValue).all())
+    try:
+        return bool(oldValue == newValue)
+    except (ValueError, TypeError):
+        return False
+
+
+class _PropertyDescriptor(object):
+    '''
+    Provides attribute style access to a property using its alternate name,
+    for example properties.point_size for the property 'Point Size'.
+    '''
+    __slots__ = ('propertyName',)
+
+    def __init__(self, propertyName):
+        self.propertyName = propertyName
+
+    def __get__(self, obj, objType=None):
+        if obj is None:
+            return self
+        return obj._properties[self.propertyName]
+
+    def __set__(self, obj, value):
+        obj.setProperty(self.propertyName, value)
+
+
 class PropertySet(object):
+    '''
+    An ordered set of named properties with attributes and change callbacks.
+
+    Every property is also readable as an attribute using its alternate name,
+    see cleanPropertyName().  The attributes are implemented with descriptors
+    on a generated subclass, one per distinct set of property names.  The
+    generated class is swapped in when properties are added or removed, and
+    is shared by all property sets with the same schema.
+    '''
+
+    __slots__ = ('callbacks', '_properties', '_attributes', '_alternateNames', 'oldPropertyValue', '__weakref__')
 
     PROPERTY_CHANGED_SIGNAL = 'PROPERTY_CHANGED_SIGNAL'
+    PROPERTIES_CHANGED_SIGNAL = 'PROPERTIES_CHANGED_SIGNAL'
     PROPERTY_ADDED_SIGNAL = 'PROPERTY_ADDED_SIGNAL'
     PROPERTY_ATTRIBUTE_CHANGED_SIGNAL = 'PROPERTY_ATTRIBUTE_CHANGED_SIGNAL'
 
+    _schemaClasses = {}
+
     def __getstate__(self):
         d = dict(_properties=self._properties, _attributes=self._attributes)
         return d
@@ -64,16 +115,37 @@ class PropertySet(object):
         for propName, propValue in state['_properties'].iteritems():
             self.addProperty(propName, propValue, attributes=attrs.get(propName))
 
+    def __reduce__(self):
+        # generated schema classes are not importable, so always pickle as the base class
+        return (self._schemaBase, (), self.__getstate__())
 
     def __init__(self):
 
         self.callbacks = callbacks.CallbackRegistry([self.PROPERTY_CHANGED_SIGNAL,
+                                                     self.PROPERTIES_CHANGED_SIGNAL,
                                                      self.PROPERTY_ADDED_SIGNAL,
                                                      self.PROPERTY_ATTRIBUTE_CHANGED_SIGNAL])
 
         self._properties = OrderedDict()
         self._attributes = {}
         self._alternateNames = {}
+        self.oldPropertyValue = None
+        self._updateSchemaClass()
+
+    def _updateSchemaClass(self):
+        baseClass = self._schemaBase
+        key = (baseClass, frozenset(self._alternateNames.iteritems()))
+        schemaClass = PropertySet._schemaClasses.get(key)
+        if schemaClass is None:
+            descriptors = dict(__slots__=())
+            for alternateName, propertyName in self._alternateNames.iteritems():
+                # never shadow a method or slot of the property set itself
+                if not hasattr(baseClass, alternateName):
+                    descriptors[alternateName] = _PropertyDescriptor(propertyName)
+            schemaClass = type(baseClass.__name__, (baseClass,), descriptors)
+            schemaClass._schemaBase = baseClass
+            PropertySet._schemaClasses[key] = schemaClass
+        self.__class__ = schemaClass
 
     def propertyNames(self):
         return self._properties.keys()
@@ -90,6 +162,12 @@ class PropertySet(object):
     def disconnectPropertyChanged(self, callbackId):
         self.callbacks.disconnect(callbackId)
 
+    def connectPropertiesChanged(self, func):
+        return self.callbacks.connect(self.PROPERTIES_CHANGED_SIGNAL, func)
+
+    def disconnectPropertiesChanged(self, callbackId):
+        self.callbacks.disconnect(callbackId)
+
     def connectPropertyAdded(self, func):
         return self.callbacks.connect(self.PROPERTY_ADDED_SIGNAL, func)
 
@@ -103,8 +181,10 @@ class PropertySet(object):
         self.callbacks.disconnect(callbackId)
 
     def getProperty(self, propertyName):
-        self.assertProperty(propertyName)
-        return self._properties[propertyName]
+        try:
+            return self._properties[propertyName]
+        except KeyError:
+            self.assertProperty(propertyName)
 
     def getPropertyEnumValue(self, propertyName):
         self.assertProperty(propertyName)
@@ -116,6 +196,7 @@ class PropertySet(object):
         del self._alternateNames[alternateName]
         del self._properties[propertyName]
         del self._attributes[propertyName]
+        self._updateSchemaClass()
 
     def addProperty(self, propertyName, propertyValue, attributes=None):
         alternateName = cleanPropertyName(propertyName)
@@ -124,9 +205,12 @@ class PropertySet(object):
 
         propertyValue = fromQColor(propertyName, propertyValue)
 
+        isNewName = alternateName not in self._alternateNames
         self._alternateNames[alternateName] = propertyName
         self._properties[propertyName] = propertyValue
         self._attributes[propertyName] = attributes or PropertyAttributes()
+        if isNewName:
+            self._updateSchemaClass()
 
         self.callbacks.process(self.PROPERTY_ADDED_SIGNAL, self, propertyName)
 
@@ -139,18 +223,54 @@ class PropertySet(object):
         items = self._properties.items()
         self._properties = OrderedDict([items[i] for i in inds])
 
-    def setProperty(self, propertyName, propertyValue):
-        self.assertProperty(propertyName)
+    def _storePropertyValue(self, propertyName, propertyValue):
+        '''
+        Stores the new value and returns True, or returns False without
+        storing anything if the value is unchanged.
+        '''
+        try:
+            oldValue = self._properties[propertyName]
+        except KeyError:
+            self.assertProperty(propertyName)
+
         propertyValue = fromQColor(propertyName, propertyValue)
 
-        names = self.getPropertyAttribute(propertyName, 'enumNames')
+        names = self._attributes[propertyName].enumNames
         if names and type(propertyValue) != int:
             propertyValue = names.index(propertyValue)
 
-        self.oldPropertyValue = (propertyName, self.getProperty(propertyName))
+        if _isUnchangedValue(oldValue, propertyValue):
+            return False
+
         self._properties[propertyName] = propertyValue
-        self.oldPropertyValue = None
-        self.callbacks.process(self.PROPERTY_CHANGED_SIGNAL, self, propertyName)
+        return True
+
+    def setProperty(self, propertyName, propertyValue):
+        if self._storePropertyValue(propertyName, propertyValue):
+            self.callbacks.process(self.PROPERTY_CHANGED_SIGNAL, self, propertyName)
+
+    def setProperties(self, properties=None, **kwargs):
+        '''
+        Sets several properties at once.  Properties may be given as a dict
+        of property names to values, or as keyword arguments using alternate
+        names.  All values are stored before any callback is called, then
+        PROPERTY_CHANGED_SIGNAL is emitted for each property that changed and
+        PROPERTIES_CHANGED_SIGNAL is emitted once with the list of changed
+        property names.
+        '''
+        values = list(properties.items()) if properties else []
+        for alternateName, propertyValue in kwargs.iteritems():
+            if alternateName not in self._alternateNames:
+                raise KeyError('Missing property with alternate name: {:s}'.format(alternateName))
+            values.append((self._alternateNames[alternateName], propertyValue))
+
+        changedNames = [propertyName for propertyName, propertyValue in values
+                          if self._storePropertyValue(propertyName, propertyValue)]
+
+        if changedNames:
+            for propertyName in changedNames:
+                self.callbacks.process(self.PROPERTY_CHANGED_SIGNAL, self, propertyName)
+            self.callbacks.process(self.PROPERTIES_CHANGED_SIGNAL, self, changedNames)
 
     def getPropertyAttribute(self, propertyName, propertyAttribute):
         self.assertProperty(propertyName)
@@ -163,15 +283,8 @@ class PropertySet(object):
         setattr(attributes, propertyAttribute, value)
         self.callbacks.process(self.PROPERTY_ATTRIBUTE_CHANGED_SIGNAL, self, propertyName, propertyAttribute)
 
-    def __getattribute__(self, name):
-        try:
-            alternateNames = object.__getattribute__(self, '_alternateNames')
-            if name in alternateNames:
-                return object.__getattribute__(self, 'getProperty')(alternateNames[name])
-            else:
-                raise AttributeError()
-        except AttributeError:
-            return object.__getattribute__(self, name)
+
+PropertySet._schemaBase = PropertySet
 
 
 class PropertyPanelHelper(object):
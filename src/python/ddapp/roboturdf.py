@@ -86,6 +86,9 @@ class RobotModelItem(om.ObjectModelItem):
     def hasDataSet(self, dataSet):
         return len(self.model.getLinkNameForMesh(dataSet)) != 0
 
+    def hasActor(self, actor):
+        return len(self.model.getLinkNameForActor(actor)) != 0
+
     def connectModelChanged(self, func):
         return self.callbacks.connect(self.MODEL_CHANGED_SIGNAL, func)
 
@@ -25,6 +25,8 @@ from ddapp.filterUtils import *
 from ddapp.fieldcontainer import FieldContainer
 from ddapp.segmentationroutines import *
 from ddapp import cameraview
+from ddapp import normalestimation
+from ddapp import segmentationcache
 
 import numpy as np
 import vtkNumpy
@@ -75,6 +77,7 @@ def initAffordanceManager(view):
     affordanceManager = affordancemanager.AffordanceObjectModelManager(view)
 
 
+@segmentationcache.cachedStage
 def cropToLineSegment(polyData, point1, point2):
 
     line = np.array(point2) - np.array(point1)
@@ -365,7 +368,7 @@ def orientToMajorPlane(polyData, pickedPoint):
     midCloudHeight = np.mean(zvalues)
     if (midCloudHeight < 0):
       flipTransform = transformUtils.frameFromPositionAndRPY([0,0,0], [0,180,0])
-      polyData = transformPolyData(polyData, flipTransform )
+      polyData = transformPolyData(polyData, flipTransform, inPlace=True)
 
     return polyData, planeFrame
 
@@ -390,8 +393,13 @@ def getMajorPlanes(polyData, useVoxelGrid=True):
         f.Update()
         polyData = shallowCopy(f.GetOutput())
 
-        outliers = thresholdPoints(polyData, 'ransac_labels', [0, 0])
-        inliers = thresholdPoints(polyData, 'ransac_labels', [1, 1])
+        # split inliers and outliers in a single pass
+        split = splitPolyDataByLabel(polyData, 'ransac_labels', [0, 1])
+        outliers = split.get(0)
+        inliers = split.get(1)
+        if inliers is None:
+            break
+
         largestCluster = extractLargestCluster(inliers)
 
         #i = len(polyDataList)
@@ -401,6 +409,8 @@ def getMajorPlanes(polyData, useVoxelGrid=True):
 
         if largestCluster.GetNumberOfPoints() > minClusterSize:
             polyDataList.append(largestCluster)
+            if outliers is None:
+                break
             polyData = outliers
         else:
             break
@@ -457,11 +467,13 @@ def cropToBounds(polyData, transform, bounds):
     return polyData
 
 
+@segmentationcache.cachedStage
 def cropToSphere(polyData, origin, radius):
     polyData = labelDistanceToPoint(polyData, origin)
     return thresholdPoints(polyData, 'distance_to_point', [0, radius])
 
 
+@segmentationcache.cachedStage(randomized=True)
 def applyPlaneFit(polyData, distanceThreshold=0.02, expectedNormal=None, perpendicularAxis=None, angleEpsilon=0.2, returnOrigin=False, searchOrigin=None, searchRadius=None):
 
     expectedNormal = expectedNormal if expectedNormal is not None else [-1,0,0]
@@ -506,19 +518,16 @@ def flipNormalsWithViewDirection(polyData, viewDirection):
 
 
 def normalEstimation(dataObj, searchCloud=None, searchRadius=0.05, useVoxelGrid=False, voxelGridLeafSize=0.05):
+    '''
+    Returns a copy of dataObj with normals, curvature and eigenvalues point
+    data arrays.  Results are cached, see normalestimation.py.
+    '''
+    searchCloudKey = None
+    if not searchCloud and useVoxelGrid:
+        searchCloud = applyVoxelGrid(dataObj, voxelGridLeafSize)
+        searchCloudKey = ('voxel grid', voxelGridLeafSize)
 
-    f = vtk.vtkPCLNormalEstimation()
-    f.SetSearchRadius(searchRadius)
-    f.SetInput(dataObj)
-    if searchCloud:
-        f.SetInput(1, searchCloud)
-    elif useVoxelGrid:
-        f.SetInput(1, applyVoxelGrid(dataObj, voxelGridLeafSize))
-    f.Update()
-    dataObj = shallowCopy(f.GetOutput())
-    dataObj.GetPointData().SetNormals(dataObj.GetPointData().GetArray('normals'))
-
-    return dataObj
+    return normalestimation.estimateNormals(dataObj, searchCloud, searchRadius, searchCloudKey=searchCloudKey)
 
 
 def addCoordArraysToPolyData(polyData):
@@ -553,7 +562,15 @@ def getDebugRevolutionData():
 
     filename = os.path.expanduser('~/Desktop/scans/debris-scan.vtp')
 
-    return addCoordArraysToPolyData(ioUtils.readPolyData(filename))
+    # cache the scan in the .npd format so later loads are memory mapped
+    cacheFilename = os.path.splitext(filename)[0] + '.npd'
+    if os.path.isfile(cacheFilename) and os.path.getmtime(cacheFilename) >= os.path.getmtime(filename):
+        polyData = ioUtils.readPolyData(cacheFilename)
+    else:
+        polyData = ioUtils.readPolyData(filename)
+        ioUtils.writePolyData(polyData, cacheFilename)
+
+    return addCoordArraysToPolyData(polyData)
 
 
 def getCurrentScanBundle():
@@ -671,7 +688,12 @@ def extractCircle(polyData, distanceThreshold=0.04, radiusLimit=None):
     return polyData, circleFit
 
 
+@segmentationcache.cachedStage(randomized=True)
 def removeMajorPlane(polyData, distanceThreshold=0.02):
+    '''
+    Returns a tuple (polyData, (origin, normal)) of the points that are not
+    inliers of the largest plane, and the plane parameters.
+    '''
 
     # perform plane segmentation
     f = planeSegmentationFilter()
@@ -680,7 +702,7 @@ def removeMajorPlane(polyData, distanceThreshold=0.02):
     f.Update()
 
     polyData = thresholdPoints(f.GetOutput(), 'ransac_labels', [0.0, 0.0])
-    return polyData, f
+    return polyData, (np.array(f.GetPlaneOrigin()), np.array(f.GetPlaneNormal()))
 
 
 def removeGroundSimple(polyData, groundThickness=0.02, sceneHeightFromGround=0.05):
@@ -2718,14 +2740,7 @@ def findHorizontalSurfaces(polyData, removeGroundFirst=False, normalEstimationSe
     if not scenePoints.GetNumberOfPoints():
         return
 
-    f = vtk.vtkPCLNormalEstimation()
-    f.SetSearchRadius(normalEstimationSearchRadius)
-    f.SetInput(scenePoints)
-    f.SetInput(1, applyVoxelGrid(scenePoints, voxelGridLeafSize))
-
-    # Duration 0.2 sec for V1 log:
-    f.Update()
-    scenePoints = shallowCopy(f.GetOutput())
+    scenePoints = normalEstimation(scenePoints, searchRadius=normalEstimationSearchRadius, useVoxelGrid=True, voxelGridLeafSize=voxelGridLeafSize)
 
     normals = vtkNumpy.getNumpyFromVtk(scenePoints, 'normals')
     normalsDotUp = np.abs(np.dot(normals, [0,0,1]))
@@ -2858,11 +2873,7 @@ def findAndFitDrillBarrel(polyData=None):
 
     normalEstimationSearchRadius = 0.10
 
-    f = vtk.vtkPCLNormalEstimation()
-    f.SetSearchRadius(normalEstimationSearchRadius)
-    f.SetInput(scenePoints)
-    f.Update()
-    scenePoints = shallowCopy(f.GetOutput())
+    scenePoints = normalEstimation(scenePoints, searchRadius=normalEstimationSearchRadius)
 
     normals = vtkNumpy.getNumpyFromVtk(scenePoints, 'normals')
     normalsDotUp = np.abs(np.dot(normals, [0,0,1]))
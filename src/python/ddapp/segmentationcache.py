@@ -0,0 +1,293 @@
+'''
+Memoization of segmentation stages.
+
+A stage is a function without side effects that maps point clouds and
+parameters to new point clouds and values, for example a crop, a plane fit
+or a clustering.  Decorating it with cachedStage stores its outputs keyed
+by a fingerprint of the arguments, so an interactive retry on the same
+snapshot skips every stage whose inputs did not change.
+
+Polydata arguments are fingerprinted by their modified time, or by a hash
+of their point and point data arrays when fingerprintMode is 'content'.
+Polydata returned by a stage are copies that remember the stage that
+produced them, so they fingerprint to the same key on every retry and the
+stages downstream of them are cache hits too.  Their points and point data
+arrays are copied so callers may write into them; the cells are shared.
+Changing point arrays in place with numpy is not detected in 'mtime' mode
+unless Modified() is called.
+
+Only stages whose inputs are typically a snapshot or the output of another
+cached stage are worth decorating; a stage that is always given freshly
+built polydata can never hit and only fills the cache.
+
+Stages that sample randomly, like the ransac plane fits, are decorated with
+randomized=True.  They return the same fit for the same input until
+resample() is called, which lets a user ask for a different fit.
+
+Outputs are kept until the estimated memory of all entries exceeds the
+memory budget, then the least recently used entries are dropped.  Outputs
+other than data objects, arrays, sequences and plain values are not cached.
+printStatistics() shows the hit rate and the time saved per stage.
+'''
+
+import time
+import hashlib
+import inspect
+import functools
+from collections import OrderedDict
+
+import numpy as np
+
+from ddapp import vtkAll as vtk
+from ddapp import vtkNumpy as vnp
+from ddapp import voxelgrid
+from ddapp.shallowCopy import shallowCopy
+
+
+class UncacheableArgument(Exception):
+    pass
+
+
+class StageStatistics(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.computeTime = 0.0
+        self.savedTime = 0.0
+
+    def getHitRate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+
+class SegmentationCache(object):
+
+    def __init__(self, memoryBudget=64*1024*1024, fingerprintMode='mtime'):
+        assert fingerprintMode in ('mtime', 'content')
+        self.enabled = True
+        self.memoryBudget = memoryBudget
+        self.fingerprintMode = fingerprintMode
+        self.entries = OrderedDict()
+        self.memorySize = 0
+        self.lineage = OrderedDict()
+        self.maxLineageSize = 5000
+        self.statistics = OrderedDict()
+        self.resampleCount = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.lineage.clear()
+        self.memorySize = 0
+
+    def resample(self):
+        '''
+        Drops the outputs of randomized stages, so that their next call
+        draws a new sample.
+        '''
+        self.resampleCount += 1
+        for key in [key for key in self.entries if key[1] is not None]:
+            _, size, _ = self.entries.pop(key)
+            self.memorySize -= size
+
+    def resetStatistics(self):
+        self.statistics.clear()
+
+    def getStageStatistics(self, stageName):
+        return self.statistics.setdefault(stageName, StageStatistics())
+
+    def _getPolyDataFingerprint(self, polyData):
+
+        lineageKey = self.lineage.get(voxelgrid.getPolyDataCacheKey(polyData))
+        if lineageKey is not None:
+            return lineageKey
+
+        if self.fingerprintMode == 'mtime':
+            return ('polydata',) + voxelgrid.getPolyDataCacheKey(polyData)
+
+        h = hashlib.sha1()
+        if polyData.GetNumberOfPoints():
+            h.update(np.ascontiguousarray(vnp.getNumpyFromVtk(polyData, 'Points')))
+        pointData = polyData.GetPointData()
+        for i in xrange(pointData.GetNumberOfArrays()):
+            array = pointData.GetArray(i)
+            if array is not None and array.GetName():
+                h.update(array.GetName())
+                h.update(np.ascontiguousarray(vnp.getNumpyFromVtk(polyData, array.GetName())))
+        return ('polydata', h.hexdigest())
+
+    def getFingerprint(self, value):
+        '''
+        Returns a hashable fingerprint of a stage argument.  Raises
+        UncacheableArgument for values that cannot be fingerprinted.
+        '''
+        if value is None or isinstance(value, (bool, int, long, float, basestring)):
+            return value
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return ('array', value.shape, value.dtype.str, hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+        if isinstance(value, (list, tuple)):
+            return (type(value).__name__,) + tuple(self.getFingerprint(v) for v in value)
+        if isinstance(value, dict):
+            return ('dict',) + tuple(sorted((k, self.getFingerprint(v)) for k, v in value.iteritems()))
+        if isinstance(value, vtk.vtkPolyData):
+            return self._getPolyDataFingerprint(value)
+        if isinstance(value, vtk.vtkLinearTransform):
+            matrix = value.GetMatrix()
+            return ('transform',) + tuple(matrix.GetElement(i, j) for i in xrange(4) for j in xrange(4))
+        raise UncacheableArgument(type(value).__name__)
+
+    def _estimateSize(self, value):
+        '''
+        Returns the estimated memory of an output in bytes, or None if the
+        output is not cacheable.
+        '''
+        if isinstance(value, vtk.vtkDataObject):
+            return value.GetActualMemorySize()*1024
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (list, tuple)):
+            sizes = [self._estimateSize(v) for v in value]
+            return None if None in sizes else 64 + sum(sizes)
+        if value is None or isinstance(value, (bool, int, long, float, basestring, np.generic)):
+            return 64
+        return None
+
+    def _addLineage(self, polyData, lineageKey):
+        self.lineage[voxelgrid.getPolyDataCacheKey(polyData)] = lineageKey
+        while len(self.lineage) > self.maxLineageSize:
+            self.lineage.popitem(last=False)
+
+    def _copyOutput(self, value, lineageKey):
+        '''
+        Returns a copy of a cached output.  Polydata get copies of their
+        points and point data arrays and share the cell arrays.
+        '''
+        if isinstance(value, vtk.vtkPolyData):
+            polyData = shallowCopy(value)
+            if value.GetPoints():
+                points = vtk.vtkPoints()
+                points.DeepCopy(value.GetPoints())
+                polyData.SetPoints(points)
+            polyData.GetPointData().DeepCopy(value.GetPointData())
+            self._addLineage(polyData, lineageKey)
+            return polyData
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        if isinstance(value, (list, tuple)):
+            values = [self._copyOutput(v, lineageKey + (i,)) for i, v in enumerate(value)]
+            return values if isinstance(value, list) else tuple(values)
+        return value
+
+    def _addEntry(self, key, outputs, computeTime):
+        size = self._estimateSize(outputs)
+        if size is None or size > self.memoryBudget:
+            return
+        self.entries[key] = (outputs, size, computeTime)
+        self.memorySize += size
+        while self.memorySize > self.memoryBudget:
+            _, (_, evictedSize, _) = self.entries.popitem(last=False)
+            self.memorySize -= evictedSize
+
+    def call(self, stageName, func, args, kwargs, randomized=False):
+
+        stats = self.getStageStatistics(stageName)
+
+        key = None
+        if self.enabled:
+            try:
+                callArgs = inspect.getcallargs(func, *args, **kwargs)
+                key = (stageName, self.resampleCount if randomized else None, self.getFingerprint(callArgs))
+            except UncacheableArgument:
+                key = None
+
+        if key is None:
+            stats.uncached += 1
+            return func(*args, **kwargs)
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry
+            outputs, _, computeTime = entry
+            stats.hits += 1
+            stats.savedTime += computeTime
+            return self._copyOutput(outputs, key)
+
+        startTime = time.time()
+        outputs = func(*args, **kwargs)
+        computeTime = time.time() - startTime
+
+        stats.misses += 1
+        stats.computeTime += computeTime
+        self._addEntry(key, outputs, computeTime)
+        return self._copyOutput(outputs, key)
+
+    def printStatistics(self):
+        print '%-28s %6s %6s %8s %10s %10s' % ('stage', 'hits', 'misses', 'hit rate', 'compute s', 'saved s')
+        for stageName, stats in self.statistics.iteritems():
+            print '%-28s %6d %6d %7.0f%% %10.3f %10.3f' % (stageName, stats.hits, stats.misses,
+                    100*stats.getHitRate(), stats.computeTime, stats.savedTime)
+        print 'cached entries: %d, memory: %.1f MB of %.1f MB' % (len(self.entries),
+                self.memorySize / 1048576.0, self.memoryBudget / 1048576.0)
+
+
+_cache = SegmentationCache()
+
+
+def getCache():
+    return _cache
+
+
+def setEnabled(enabled):
+    _cache.enabled = enabled
+    if not enabled:
+        _cache.clear()
+
+
+def setMemoryBudget(memoryBudget):
+    _cache.memoryBudget = memoryBudget
+
+
+def setFingerprintMode(fingerprintMode):
+    assert fingerprintMode in ('mtime', 'content')
+    _cache.fingerprintMode = fingerprintMode
+    _cache.clear()
+
+
+def clear():
+    _cache.clear()
+
+
+def resample():
+    _cache.resample()
+
+
+def getStatistics():
+    '''
+    Returns a dict of stageName -> StageStatistics.
+    '''
+    return dict(_cache.statistics)
+
+
+def printStatistics():
+    _cache.printStatistics()
+
+
+def cachedStage(func=None, randomized=False, cache=None):
+    '''
+    Decorator that memoizes a segmentation stage, in the global cache unless
+    a cache is given.  Use as @cachedStage, or as
+    @cachedStage(randomized=True) for stages that sample randomly.
+    '''
+    if func is None:
+        return functools.partial(cachedStage, randomized=randomized, cache=cache)
+
+    stageName = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return (cache or _cache).call(stageName, func, args, kwargs, randomized)
+
+    return wrapper
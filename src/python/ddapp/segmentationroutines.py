@@ -17,7 +17,9 @@ from ddapp import vtkAll as vtk
 from ddapp.footstepsdriver import FootstepsDriver
 
 import vtkNumpy
+from ddapp import voxelgrid
 import numpy as np
+from collections import OrderedDict
 from shallowCopy import shallowCopy
 from debugVis import DebugData
 
@@ -222,7 +224,21 @@ def labelPointDistanceAlongAxis(polyData, axis, origin=None, resultArrayName='di
     return newData
 
 
-def applyEuclideanClustering(dataObj, clusterTolerance=0.05, minClusterSize=100, maxClusterSize=1e6):
+def applyEuclideanClustering(dataObj, clusterTolerance=0.05, minClusterSize=100, maxClusterSize=1e6, projectionAxis=None):
+    '''
+    Labels the points of dataObj with their euclidean cluster id in the
+    cluster_labels array.  Labels start at 1 for the largest cluster,
+    points that do not belong to a cluster are labeled 0.  If
+    projectionAxis is given, points are clustered by their projection
+    onto the plane perpendicular to that axis, e.g. [0,0,1] clusters in XY.
+    '''
+
+    if projectionAxis is not None:
+        clusterLabels = computeClusterLabels(vtkNumpy.getNumpyFromVtk(dataObj, 'Points'), clusterTolerance,
+                                             minClusterSize, maxClusterSize, projectionAxis)
+        dataObj = shallowCopy(dataObj)
+        vtkNumpy.addNumpyToVtk(dataObj, clusterLabels, 'cluster_labels')
+        return dataObj
 
     f = vtk.vtkPCLEuclideanClusterExtraction()
     f.SetInput(dataObj)
@@ -233,6 +249,78 @@ def applyEuclideanClustering(dataObj, clusterTolerance=0.05, minClusterSize=100,
     return shallowCopy(f.GetOutput())
 
 
+def computeClusterLabels(points, clusterTolerance=0.05, minClusterSize=100, maxClusterSize=1e6, projectionAxis=None):
+    '''
+    Returns the euclidean cluster labels of an Nx3 array of points, as
+    assigned by applyEuclideanClustering.  Only a points array is passed to
+    the clustering filter, the points are never copied along with their
+    attribute arrays.
+    '''
+
+    if not len(points):
+        return np.zeros(0, dtype=np.int32)
+
+    if projectionAxis is not None:
+        axis = np.asarray(projectionAxis, dtype=np.float64)
+        axis = axis / np.linalg.norm(axis)
+        points = points - np.outer(np.dot(points, axis), axis)
+
+    f = vtk.vtkPCLEuclideanClusterExtraction()
+    f.SetInput(vtkNumpy.getVtkPolyDataFromNumpyPoints(np.asarray(points, dtype=np.float32)))
+    f.SetClusterTolerance(clusterTolerance)
+    f.SetMinClusterSize(int(minClusterSize))
+    f.SetMaxClusterSize(int(maxClusterSize))
+    f.Update()
+    return vtkNumpy.getNumpyFromVtk(f.GetOutput(), 'cluster_labels').copy()
+
+
+def splitPolyDataByLabel(polyData, arrayName, labels=None):
+    '''
+    Splits polyData into one vtkPolyData per distinct value of the named
+    point data array and returns an OrderedDict of label -> polyData in
+    increasing label order.  If labels is given only those labels are
+    returned.  The points are sorted by label once, every output shares
+    memory with a contiguous slice of the sorted arrays and has one vertex
+    cell per point, like the output of thresholdPoints.
+    '''
+
+    labelArray = vtkNumpy.getNumpyFromVtk(polyData, arrayName)
+    order = np.argsort(labelArray, kind='mergesort')
+    sortedLabels = labelArray[order]
+
+    uniqueLabels, starts = np.unique(sortedLabels, return_index=True)
+    ends = np.append(starts[1:], len(sortedLabels))
+
+    if labels is not None:
+        keep = np.in1d(uniqueLabels, labels)
+        uniqueLabels, starts, ends = uniqueLabels[keep], starts[keep], ends[keep]
+
+    points = vtkNumpy.getNumpyFromVtk(polyData, 'Points')[order]
+    pointData = polyData.GetPointData()
+    arrays = {}
+    for i in xrange(pointData.GetNumberOfArrays()):
+        name = pointData.GetArrayName(i)
+        if name:
+            arrays[name] = vtkNumpy.getNumpyFromVtk(polyData, name)[order]
+
+    result = OrderedDict()
+    for label, start, end in zip(uniqueLabels, starts, ends):
+        split = vtkNumpy.numpyToPolyData(points[start:end],
+                    dict((name, array[start:end]) for name, array in arrays.iteritems()), copy=False)
+        split.SetVerts(vtkNumpy.getVtkCellArrayFromNumpy(np.arange(end - start)))
+        result[label.item()] = split
+
+    return result
+
+
+def splitClusters(polyData, arrayName='cluster_labels'):
+    '''
+    Returns a list with one vtkPolyData per nonzero cluster label, in label
+    order, using a single pass over polyData.  See splitPolyDataByLabel.
+    '''
+    return [cluster for label, cluster in splitPolyDataByLabel(polyData, arrayName).iteritems() if label != 0]
+
+
 def extractClusters(polyData, clusterInXY=False, **kwargs):
     ''' Segment a single point cloud into smaller clusters
         using Euclidean Clustering
@@ -241,36 +329,90 @@ def extractClusters(polyData, clusterInXY=False, **kwargs):
     if not polyData.GetNumberOfPoints():
         return []
 
-    if (clusterInXY == True):
-        ''' If Points are seperated in X&Y, then cluster outside this '''
-        polyDataXY = vtk.vtkPolyData()
-        polyDataXY.DeepCopy(polyData)
-        points=vtkNumpy.getNumpyFromVtk(polyDataXY , 'Points') # shared memory
-        points[:,2] = 0.0
-        #showPolyData(polyDataXY, 'polyDataXY', visible=False, parent=getDebugFolder())
-        polyDataXY = applyEuclideanClustering(polyDataXY, **kwargs)
-        clusterLabels = vtkNumpy.getNumpyFromVtk(polyDataXY, 'cluster_labels')
-        vtkNumpy.addNumpyToVtk(polyData, clusterLabels, 'cluster_labels')
+    # If Points are seperated in X&Y, then cluster on the XY projection
+    projectionAxis = [0.0, 0.0, 1.0] if clusterInXY else None
+    polyData = applyEuclideanClustering(polyData, projectionAxis=projectionAxis, **kwargs)
+    return splitClusters(polyData)
 
-    else:
-        polyData = applyEuclideanClustering(polyData, **kwargs)
-        clusterLabels = vtkNumpy.getNumpyFromVtk(polyData, 'cluster_labels')
 
+class IncrementalClusterer(object):
+    '''
+    Maintains euclidean cluster labels for a point cloud that grows by
+    sweeps.  When new points are added only the region they touch is
+    reclustered: the new points, existing points within clusterTolerance
+    of their bounds, and every cluster with a point in that region.
+    Clusters outside the region keep their labels.
+    '''
 
-    clusters = []
-    for i in xrange(1, clusterLabels.max() + 1):
-        cluster = thresholdPoints(polyData, 'cluster_labels', [i, i])
-        clusters.append(cluster)
-    return clusters
+    def __init__(self, clusterTolerance=0.05, minClusterSize=100, maxClusterSize=1e6, projectionAxis=None):
+        self.clusterTolerance = clusterTolerance
+        self.minClusterSize = minClusterSize
+        self.maxClusterSize = maxClusterSize
+        self.projectionAxis = projectionAxis
+        self.reset()
+
+    def reset(self):
+        self.points = np.zeros((0, 3))
+        self.labels = np.zeros(0, dtype=np.int32)
+        self.nextLabel = 1
+
+    def addPoints(self, newPoints):
+        '''
+        Adds an Nx3 array of points, reclusters the touched region and
+        returns the labels that were created or replaced.
+        '''
+        newPoints = np.asarray(newPoints)
+        if not len(newPoints):
+            return np.zeros(0, dtype=np.int32)
+
+        low = newPoints.min(axis=0) - self.clusterTolerance
+        high = newPoints.max(axis=0) + self.clusterTolerance
+        if self.projectionAxis is not None:
+            # the region is unbounded along the projection axis
+            unbounded = np.abs(np.asarray(self.projectionAxis)) > 0
+            low[unbounded], high[unbounded] = -np.inf, np.inf
+
+        inRegion = np.all((self.points >= low) & (self.points <= high), axis=1)
+        touchedLabels = np.unique(self.labels[inRegion])
+        touchedLabels = touchedLabels[touchedLabels != 0]
+        affected = inRegion | np.in1d(self.labels, touchedLabels)
+
+        keptPoints = self.points[~affected]
+        keptLabels = self.labels[~affected]
+        reclusterPoints = np.vstack([self.points[affected], newPoints])
+
+        labels = computeClusterLabels(reclusterPoints, self.clusterTolerance, self.minClusterSize,
+                                      self.maxClusterSize, self.projectionAxis).astype(np.int32)
+        clustered = labels != 0
+        labels[clustered] += self.nextLabel - 1
+        if clustered.any():
+            self.nextLabel = labels.max() + 1
+
+        self.points = np.vstack([keptPoints, reclusterPoints])
+        self.labels = np.hstack([keptLabels, labels])
+        return np.union1d(touchedLabels, np.unique(labels[clustered]))
+
+    def getPolyData(self):
+        polyData = vtkNumpy.getVtkPolyDataFromNumpyPoints(self.points)
+        vtkNumpy.addNumpyToVtk(polyData, self.labels, 'cluster_labels')
+        return polyData
+
+    def getClusters(self, labels=None):
+        '''
+        Returns an OrderedDict of label -> vtkPolyData for the current
+        clusters, or only for the given labels.
+        '''
+        clusters = splitPolyDataByLabel(self.getPolyData(), 'cluster_labels', labels)
+        clusters.pop(0, None)
+        return clusters
 
 
 def applyVoxelGrid(polyData, leafSize=0.01):
-
-    v = vtk.vtkPCLVoxelGrid()
-    v.SetLeafSize(leafSize, leafSize, leafSize)
-    v.SetInput(polyData)
-    v.Update()
-    return shallowCopy(v.GetOutput())
+    '''
+    Returns a copy of the polydata with one point per occupied voxel, at
+    the voxel centroid.  Point data arrays are kept, see voxelgrid.py.
+    '''
+    return voxelgrid.applyVoxelGrid(polyData, leafSize)
 
 
 def labelOutliers(dataObj, searchRadius=0.03, neighborsInSearchRadius=10):
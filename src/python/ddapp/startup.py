@@ -76,6 +76,7 @@ from ddapp import handdriver
 from ddapp import planplayback
 from ddapp import playbackpanel
 from ddapp import screengrabberpanel
+from ddapp import lcmtrafficpanel
 from ddapp import splinewidget
 from ddapp import teleoppanel
 from ddapp import vtkNumpy as vnp
@@ -84,6 +85,7 @@ from ddapp import visualization as vis
 from ddapp import actionhandlers
 from ddapp.timercallback import TimerCallback
 from ddapp.pointpicker import PointPicker, ImagePointPicker
+from ddapp import segmentationcache
 from ddapp import segmentationpanel
 from ddapp import lcmUtils
 from ddapp.utime import getUtime
@@ -741,6 +743,7 @@ showImageOverlay = imageOverlayManager.show
 hideImageOverlay = imageOverlayManager.hide
 
 screengrabberpanel.init(view)
+lcmtrafficpanel.init()
 framevisualization.init(view)
 affordancePanel = affordancepanel.init(view, affordanceManager, ikServer, robotStateJointController, raycastDriver)
 
@@ -922,10 +925,15 @@ class AffordanceTextureUpdater(object):
 
     def __init__(self, affordanceManager):
         self.affordanceManager = affordanceManager
+        self.imageConsumer = cameraview.imageManager.createConsumer('CAMERA_LEFT', isActive=self.hasTexturedAffordances, targetFps=10)
         self.timer = TimerCallback(targetFps=10)
         self.timer.callback = self.updateTextures
         self.timer.start()
 
+    def hasTexturedAffordances(self):
+        return any(aff.getProperty('Camera Texture Enabled') and aff.getProperty('Visible')
+                   for aff in self.affordanceManager.getAffordances())
+
     def updateTexture(self, obj):
         if obj.getProperty('Camera Texture Enabled'):
             cameraview.applyCameraTexture(obj, cameraview.imageManager)
@@ -935,6 +943,7 @@ class AffordanceTextureUpdater(object):
 
     def updateTextures(self):
 
+        self.imageConsumer.update()
         for aff in affordanceManager.getAffordances():
             self.updateTexture(aff)
 
@@ -1012,6 +1021,12 @@ class IgnoreOldStateMessagesSelector(object):
 IgnoreOldStateMessagesSelector(robotStateJointController)
 
 
+segmentationCacheAction = app.addMenuAction('Tools', 'Print Segmentation Cache Statistics')
+segmentationCacheAction.connect('triggered()', segmentationcache.printStatistics)
+segmentationResampleAction = app.addMenuAction('Tools', 'Resample Segmentation Fits')
+segmentationResampleAction.connect('triggered()', segmentationcache.resample)
+
+
 class RandomWalk(object):
     def __init__(self, max_distance_per_plan=2):
         self.subs = []
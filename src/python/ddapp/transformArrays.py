@@ -0,0 +1,320 @@
+'''
+Batched rigid transform operations on numpy arrays.
+
+This is a companion to ddapp.transformUtils for code that works with many
+transforms at once.  Transforms are (N,4,4) homogeneous matrices, poses are
+(N,7) arrays of [x, y, z, qw, qx, qy, qz] and quaternions use the same w
+first convention as botpy and transformUtils.  Roll, pitch, yaw angles are
+in radians and use the static xyz convention of
+transformUtils.rollPitchYawToQuaternion.
+
+Functions accept a single transform, pose, quaternion or rpy as well as a
+stack of them, and return a result with the matching leading dimensions.
+Use the vtk adapters at the edges of batch code instead of creating a
+vtkTransform per element.
+'''
+
+import ddapp.vtkAll as vtk
+import numpy as np
+
+
+def identity(n=None):
+    '''
+    Returns a 4x4 identity matrix, or an (n,4,4) stack of them.
+    '''
+    if n is None:
+        return np.eye(4)
+    return np.tile(np.eye(4), (n, 1, 1))
+
+
+def compose(a, b):
+    '''
+    Returns the matrix product a*b of two transforms or stacks of transforms.
+    A single transform is broadcast against a stack.  The result maps points
+    through b and then a, the same as concatenating b then a with
+    transformUtils.concatenateTransforms.
+    '''
+    return np.einsum('...ij,...jk->...ik', a, b)
+
+
+def composeAll(transforms):
+    '''
+    Given a sequence of transforms, returns the product t[0]*t[1]*...*t[n-1].
+    '''
+    result = np.eye(4)
+    for t in transforms:
+        result = np.dot(result, t)
+    return result
+
+
+def invert(mats):
+    '''
+    Inverts rigid transforms using the transpose of the rotation block.
+    '''
+    mats = np.asarray(mats, dtype=float)
+    rotationT = np.swapaxes(mats[...,:3,:3], -1, -2)
+    result = np.zeros(mats.shape)
+    result[...,:3,:3] = rotationT
+    result[...,:3,3] = -np.einsum('...ij,...j->...i', rotationT, mats[...,:3,3])
+    result[...,3,3] = 1.0
+    return result
+
+
+def transformPoints(mats, points):
+    '''
+    Transforms (M,3) points.  If mats is a single 4x4 matrix then all points
+    are transformed by it.  If mats is an (M,4,4) stack then each point is
+    transformed by its own matrix.
+    '''
+    mats = np.asarray(mats, dtype=float)
+    points = np.asarray(points, dtype=float)
+    if mats.ndim == 2:
+        return np.dot(points, mats[:3,:3].T) + mats[:3,3]
+    return np.einsum('...ij,...j->...i', mats[...,:3,:3], points) + mats[...,:3,3]
+
+
+def transformVectors(mats, vectors):
+    '''
+    Same as transformPoints but ignores the translation.
+    '''
+    mats = np.asarray(mats, dtype=float)
+    vectors = np.asarray(vectors, dtype=float)
+    if mats.ndim == 2:
+        return np.dot(vectors, mats[:3,:3].T)
+    return np.einsum('...ij,...j->...i', mats[...,:3,:3], vectors)
+
+
+def getAxes(mats):
+    '''
+    Returns the x, y and z axes of the transforms, each with shape (...,3).
+    '''
+    mats = np.asarray(mats, dtype=float)
+    return mats[...,:3,0], mats[...,:3,1], mats[...,:3,2]
+
+
+def quaternionToMatrix(quats):
+    '''
+    Converts (...,4) wxyz quaternions to (...,3,3) rotation matrices.
+    '''
+    q = np.asarray(quats, dtype=float)
+    q = q / np.sqrt((q*q).sum(axis=-1))[...,np.newaxis]
+    w, x, y, z = q[...,0], q[...,1], q[...,2], q[...,3]
+
+    mats = np.empty(q.shape[:-1] + (3, 3))
+    mats[...,0,0] = 1.0 - 2.0*(y*y + z*z)
+    mats[...,0,1] = 2.0*(x*y - z*w)
+    mats[...,0,2] = 2.0*(x*z + y*w)
+    mats[...,1,0] = 2.0*(x*y + z*w)
+    mats[...,1,1] = 1.0 - 2.0*(x*x + z*z)
+    mats[...,1,2] = 2.0*(y*z - x*w)
+    mats[...,2,0] = 2.0*(x*z - y*w)
+    mats[...,2,1] = 2.0*(y*z + x*w)
+    mats[...,2,2] = 1.0 - 2.0*(x*x + y*y)
+    return mats
+
+
+def matrixToQuaternion(mats):
+    '''
+    Converts (...,3,3) rotation matrices or (...,4,4) transforms to (...,4)
+    wxyz quaternions with a non-negative w component.
+    '''
+    m = np.asarray(mats, dtype=float)[...,:3,:3]
+    leadingShape = m.shape[:-2]
+    m = m.reshape(-1, 3, 3)
+    m00, m11, m22 = m[...,0,0], m[...,1,1], m[...,2,2]
+
+    # Use the largest of the four candidate denominators for each matrix,
+    # which keeps the conversion stable for rotations near 180 degrees.
+    candidates = np.array([1.0 + m00 + m11 + m22,
+                           1.0 + m00 - m11 - m22,
+                           1.0 - m00 + m11 - m22,
+                           1.0 - m00 - m11 + m22])
+    choice = candidates.argmax(axis=0)
+    s = np.sqrt(np.maximum(candidates.max(axis=0), 1e-12)) * 2.0
+
+    quats = np.empty((m.shape[0], 4))
+
+    c = choice == 0
+    quats[c,0] = 0.25 * s[c]
+    quats[c,1] = (m[c,2,1] - m[c,1,2]) / s[c]
+    quats[c,2] = (m[c,0,2] - m[c,2,0]) / s[c]
+    quats[c,3] = (m[c,1,0] - m[c,0,1]) / s[c]
+
+    c = choice == 1
+    quats[c,0] = (m[c,2,1] - m[c,1,2]) / s[c]
+    quats[c,1] = 0.25 * s[c]
+    quats[c,2] = (m[c,0,1] + m[c,1,0]) / s[c]
+    quats[c,3] = (m[c,0,2] + m[c,2,0]) / s[c]
+
+    c = choice == 2
+    quats[c,0] = (m[c,0,2] - m[c,2,0]) / s[c]
+    quats[c,1] = (m[c,0,1] + m[c,1,0]) / s[c]
+    quats[c,2] = 0.25 * s[c]
+    quats[c,3] = (m[c,1,2] + m[c,2,1]) / s[c]
+
+    c = choice == 3
+    quats[c,0] = (m[c,1,0] - m[c,0,1]) / s[c]
+    quats[c,1] = (m[c,0,2] + m[c,2,0]) / s[c]
+    quats[c,2] = (m[c,1,2] + m[c,2,1]) / s[c]
+    quats[c,3] = 0.25 * s[c]
+
+    quats *= np.where(quats[:,0] < 0, -1.0, 1.0)[:,np.newaxis]
+    return quats.reshape(leadingShape + (4,))
+
+
+def rollPitchYawToQuaternion(rpy):
+    '''
+    Converts (...,3) roll, pitch, yaw angles in radians to (...,4) wxyz quaternions.
+    '''
+    rpy = np.asarray(rpy, dtype=float)
+    halfRoll, halfPitch, halfYaw = rpy[...,0]/2.0, rpy[...,1]/2.0, rpy[...,2]/2.0
+    cr, sr = np.cos(halfRoll), np.sin(halfRoll)
+    cp, sp = np.cos(halfPitch), np.sin(halfPitch)
+    cy, sy = np.cos(halfYaw), np.sin(halfYaw)
+
+    quats = np.empty(rpy.shape[:-1] + (4,))
+    quats[...,0] = cr*cp*cy + sr*sp*sy
+    quats[...,1] = sr*cp*cy - cr*sp*sy
+    quats[...,2] = cr*sp*cy + sr*cp*sy
+    quats[...,3] = cr*cp*sy - sr*sp*cy
+    return quats
+
+
+def quaternionToRollPitchYaw(quats):
+    '''
+    Converts (...,4) wxyz quaternions to (...,3) roll, pitch, yaw angles in radians.
+    '''
+    q = np.asarray(quats, dtype=float)
+    w, x, y, z = q[...,0], q[...,1], q[...,2], q[...,3]
+
+    rpy = np.empty(q.shape[:-1] + (3,))
+    rpy[...,0] = np.arctan2(2.0*(w*x + y*z), 1.0 - 2.0*(x*x + y*y))
+    rpy[...,1] = np.arcsin(np.clip(2.0*(w*y - z*x), -1.0, 1.0))
+    rpy[...,2] = np.arctan2(2.0*(w*z + x*y), 1.0 - 2.0*(y*y + z*z))
+    return rpy
+
+
+def rollPitchYawToMatrix(rpy):
+    '''
+    Converts (...,3) roll, pitch, yaw angles in radians to (...,3,3) rotation matrices.
+    '''
+    return quaternionToMatrix(rollPitchYawToQuaternion(rpy))
+
+
+def matrixToRollPitchYaw(mats):
+    '''
+    Converts (...,3,3) rotation matrices or (...,4,4) transforms to (...,3)
+    roll, pitch, yaw angles in radians.
+    '''
+    return quaternionToRollPitchYaw(matrixToQuaternion(mats))
+
+
+def transformFromPositionAndRotation(positions, rotations):
+    '''
+    Builds (...,4,4) transforms from (...,3) positions and (...,3,3) rotation matrices.
+    '''
+    positions = np.asarray(positions, dtype=float)
+    mats = np.zeros(positions.shape[:-1] + (4, 4))
+    mats[...,:3,:3] = rotations
+    mats[...,:3,3] = positions
+    mats[...,3,3] = 1.0
+    return mats
+
+
+def transformFromPositionAndRPY(positions, rpy):
+    '''
+    Vectorized transformUtils.frameFromPositionAndRPY, except that rpy is in
+    radians.
+    '''
+    return transformFromPositionAndRotation(positions, rollPitchYawToMatrix(rpy))
+
+
+def poseToTransform(poses):
+    '''
+    Converts (...,7) [x, y, z, qw, qx, qy, qz] poses to (...,4,4) transforms.
+    '''
+    poses = np.asarray(poses, dtype=float)
+    return transformFromPositionAndRotation(poses[...,:3], quaternionToMatrix(poses[...,3:]))
+
+
+def transformToPose(mats):
+    '''
+    Converts (...,4,4) transforms to (...,7) [x, y, z, qw, qx, qy, qz] poses.
+    '''
+    mats = np.asarray(mats, dtype=float)
+    return np.concatenate([mats[...,:3,3], matrixToQuaternion(mats)], axis=-1)
+
+
+def slerp(quatsA, quatsB, weights):
+    '''
+    Spherical linear interpolation between (...,4) quaternions.  weights is
+    a scalar or an array that broadcasts with the leading dimensions, 0
+    returns quatsA and 1 returns quatsB.  Takes the shortest path.
+    '''
+    qa = np.asarray(quatsA, dtype=float)
+    qb = np.asarray(quatsB, dtype=float)
+    weights = np.asarray(weights, dtype=float)[...,np.newaxis]
+
+    dot = (qa*qb).sum(axis=-1)[...,np.newaxis]
+    qb = np.where(dot < 0, -qb, qb)
+    dot = np.abs(dot)
+
+    angle = np.arccos(np.clip(dot, -1.0, 1.0))
+    sinAngle = np.sin(angle)
+    useLinear = sinAngle < 1e-6
+    safeSin = np.where(useLinear, 1.0, sinAngle)
+
+    wa = np.where(useLinear, 1.0 - weights, np.sin((1.0 - weights)*angle) / safeSin)
+    wb = np.where(useLinear, weights, np.sin(weights*angle) / safeSin)
+
+    result = wa*qa + wb*qb
+    return result / np.sqrt((result*result).sum(axis=-1))[...,np.newaxis]
+
+
+def interpolatePoses(posesA, posesB, weights):
+    '''
+    Vectorized transformUtils.frameInterpolate on (...,7) poses.  Positions
+    are interpolated linearly and orientations with slerp.
+    '''
+    posesA = np.asarray(posesA, dtype=float)
+    posesB = np.asarray(posesB, dtype=float)
+    w = np.asarray(weights, dtype=float)[...,np.newaxis]
+    positions = posesA[...,:3]*(1.0 - w) + posesB[...,:3]*w
+    return np.concatenate([positions, slerp(posesA[...,3:], posesB[...,3:], weights)], axis=-1)
+
+
+def matrixFromTransform(transform):
+    '''
+    Returns the 4x4 matrix of a vtkTransform.  This copies the 16 elements
+    in one call instead of one call per element.
+    '''
+    elements = [0.0]*16
+    vtk.vtkMatrix4x4.DeepCopy(elements, transform.GetMatrix())
+    return np.array(elements).reshape(4, 4)
+
+
+def matricesFromTransforms(transforms):
+    '''
+    Returns an (N,4,4) array from a sequence of vtkTransforms.
+    '''
+    return np.array([matrixFromTransform(t) for t in transforms]).reshape(-1, 4, 4)
+
+
+def transformFromMatrix(mat, transform=None):
+    '''
+    Returns a vtkTransform with the given 4x4 matrix.  If transform is given
+    then its matrix is set and it is returned, so callers can reuse a
+    vtkTransform instead of allocating a new one.
+    '''
+    if transform is None:
+        transform = vtk.vtkTransform()
+        transform.PostMultiply()
+    transform.SetMatrix(np.asarray(mat, dtype=float).ravel().tolist())
+    return transform
+
+
+def transformsFromMatrices(mats):
+    '''
+    Returns a list of vtkTransforms from an (N,4,4) array.
+    '''
+    return [transformFromMatrix(mat) for mat in mats]
@@ -263,9 +263,9 @@ class RobotLinkSelector(object):
 
         model = robotModel.model
 
-        pickedPoint, _, polyData = vis.pickProp(displayPoint, view)
+        pickedPoint, pickedProp, _ = vis.pickProp(displayPoint, view)
 
-        linkName = model.getLinkNameForMesh(polyData)
+        linkName = model.getLinkNameForActor(pickedProp)
         if not linkName:
             return False
 
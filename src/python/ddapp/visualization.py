@@ -593,6 +593,17 @@ class FrameTraceVisualizer(object):
 
 
 class FrameSync(object):
+    '''
+    Keeps a group of frames moving together.  When any frame is modified the
+    others are moved by the same relative motion.  A frame added with
+    ignoreIncoming=True follows the others, but moving it does not move them,
+    it just changes its offset within the group.
+
+    Base transforms are stored as numpy 4x4 matrices.  A modification is
+    propagated to all followers with one batched matrix product, and the
+    results are written through a vtkTransform kept for each follower, so no
+    vtk objects are allocated per update.
+    '''
 
     class FrameData(object):
         def __init__(self, **kwargs):
@@ -600,8 +611,12 @@ class FrameSync(object):
 
     def __init__(self):
         self.frames = {}
+        self._frameIds = {}
         self._blockCallbacks = False
         self._ids = itertools.count()
+        self._stackedIds = None
+        self._stackedRows = None
+        self._stackedBases = None
 
     def addFrame(self, frame, ignoreIncoming=False):
 
@@ -616,10 +631,15 @@ class FrameSync(object):
 
         self.frames[frameId] = FrameSync.FrameData(
             ref=weakref.ref(frame),
+            key=id(frame),
             baseTransform=self._computeBaseTransform(frame),
+            outputTransform=vtk.vtkTransform(),
             callbackId=callbackId,
             ignoreIncoming=ignoreIncoming)
 
+        self._frameIds[id(frame)] = frameId
+        self._stackedIds = None
+
     def removeFrame(self, frame):
 
         frameId = self._findFrameId(frame)
@@ -631,48 +651,41 @@ class FrameSync(object):
 
     def _computeBaseTransform(self, frame):
 
-        currentDelta = None
+        frameMatrix = transformUtils.getNumpyFromTransform(frame.transform)
+
         for frameId, frameData in self.frames.items():
 
-            if frameData.ref() is None:
+            otherFrame = frameData.ref()
+            if otherFrame is None:
                 self._removeFrameId(frameId)
-            elif frameData.ref() is frame:
-                continue
-            else:
-                currentDelta = transformUtils.copyFrame(frameData.baseTransform.GetLinearInverse())
-                currentDelta.Concatenate(transformUtils.copyFrame(frameData.ref().transform))
-                break
-
-        t = transformUtils.copyFrame(frame.transform)
-        t.PostMultiply()
-        if currentDelta:
-            t.Concatenate(currentDelta.GetLinearInverse())
+            elif otherFrame is not frame:
+                otherMatrix = transformUtils.getNumpyFromTransform(otherFrame.transform)
+                return np.dot(frameData.baseTransform, np.dot(np.linalg.inv(otherMatrix), frameMatrix))
 
-        return t
+        return frameMatrix
 
     def _removeFrameId(self, frameId):
-        del self.frames[frameId]
+        frameData = self.frames.pop(frameId)
+        if self._frameIds.get(frameData.key) == frameId:
+            del self._frameIds[frameData.key]
+        self._stackedIds = None
 
     def _findFrameId(self, frame):
 
-        for frameId, frameData in self.frames.items():
-
-            if frameData.ref() is None:
-                self._removeFrameId(frameId)
-            elif frameData.ref() is frame:
-                return frameId
-
-    def _moveFrame(self, frameId, modifiedFrameId):
+        frameId = self._frameIds.get(id(frame))
+        if frameId is None:
+            return None
 
         frameData = self.frames[frameId]
-        modifiedFrameData = self.frames[modifiedFrameId]
+        if frameData.ref() is None:
+            self._removeFrameId(frameId)
+        elif frameData.ref() is frame:
+            return frameId
 
-        t = vtk.vtkTransform()
-        t.PostMultiply()
-        t.Concatenate(frameData.baseTransform)
-        t.Concatenate(modifiedFrameData.baseTransform.GetLinearInverse())
-        t.Concatenate(modifiedFrameData.ref().transform)
-        frameData.ref().copyFrame(t)
+    def _updateStackedBases(self):
+        self._stackedIds = sorted(self.frames.keys())
+        self._stackedRows = dict((frameId, row) for row, frameId in enumerate(self._stackedIds))
+        self._stackedBases = np.array([self.frames[frameId].baseTransform for frameId in self._stackedIds]).reshape(-1, 4, 4)
 
     def _onFrameModified(self, frame):
 
@@ -682,21 +695,38 @@ class FrameSync(object):
         modifiedFrameId = self._findFrameId(frame)
         assert modifiedFrameId is not None
 
-        #print self, 'onFrameModified:', self.frames[modifiedFrameId].ref().getProperty('Name')
+        if self._stackedIds is None:
+            self._updateStackedBases()
 
-        if self.frames[modifiedFrameId].ignoreIncoming:
-            self.frames[modifiedFrameId].baseTransform = self._computeBaseTransform(frame)
+        modifiedFrameData = self.frames[modifiedFrameId]
+
+        if modifiedFrameData.ignoreIncoming:
+            modifiedFrameData.baseTransform = self._computeBaseTransform(frame)
+            if self._stackedIds is not None:
+                self._stackedBases[self._stackedRows[modifiedFrameId]] = modifiedFrameData.baseTransform
             return
 
+        # every follower moves by: modified transform * inverse(modified base)
+        delta = np.dot(transformUtils.getNumpyFromTransform(frame.transform), np.linalg.inv(modifiedFrameData.baseTransform))
+        matrices = np.einsum('ij,njk->nik', delta, self._stackedBases)
+
         self._blockCallbacks = True
 
-        for frameId, frameData in self.frames.items():
-            if frameData.ref() is None:
-                self._removeFrameId(frameId)
-            elif frameId != modifiedFrameId:
+        for frameId, matrix in zip(self._stackedIds, matrices):
+
+            if frameId == modifiedFrameId:
+                continue
+
+            frameData = self.frames.get(frameId)
+            if frameData is None:
+                continue
 
-                #print '  ', self, 'moving:', self.frames[frameId].ref().getProperty('Name')
-                self._moveFrame(frameId, modifiedFrameId)
+            follower = frameData.ref()
+            if follower is None:
+                self._removeFrameId(frameId)
+            else:
+                frameData.outputTransform.SetMatrix(matrix.ravel().tolist())
+                follower.copyFrame(frameData.outputTransform)
 
         self._blockCallbacks = False
 
@@ -836,6 +866,19 @@ def updatePolyData(polyData, name, **kwargs):
     return obj
 
 
+def updateTransformedPolyData(polyData, transform, name, **kwargs):
+    '''
+    Displays polyData as if it had been transformed by transform, without
+    transforming any points.  The transform is set as the user transform of
+    the actor and applied at render time.  Use this instead of
+    filterUtils.transformPolyData when the transformed points are only
+    needed for display.  Note that obj.polyData stays in the original frame.
+    '''
+    obj = updatePolyData(polyData, name, **kwargs)
+    obj.actor.SetUserTransform(transform)
+    return obj
+
+
 def updateFrame(frame, name, **kwargs):
 
     obj = om.findObjectByName(name)
@@ -1165,6 +1208,10 @@ def getObjectByProp(prop):
         if isinstance(obj, FrameItem) and obj.widget.GetRepresentation() == prop:
             return obj
     if isinstance(prop, vtk.vtkActor):
+        # robot models share link geometry, so they are matched by actor
+        for obj in om.getObjects():
+            if obj.hasActor(prop):
+                return obj
         return getObjectByDataSet(prop.GetMapper().GetInput())
 
 
@@ -0,0 +1,290 @@
+'''
+Voxel grid downsampling with numpy.
+
+Points are hashed into integer voxel keys floor(point / leafSize) and each
+occupied voxel is reduced to the centroid of its points, like the pcl voxel
+grid filter.  Unlike vtkPCLVoxelGrid all numeric point data arrays are kept,
+aggregated per voxel with one of the modes:
+
+    mean   - the mean value of the points in the voxel
+    max    - the component wise maximum
+    first  - the value of the first point, in input order, in the voxel
+
+A VoxelPyramid caches the voxel levels computed for one cloud.  A leaf size
+that is an integer multiple of a cached level is computed from that level by
+merging its voxels, which gives the same result as a pass over the raw
+points but only touches one entry per fine voxel.  applyVoxelGrid keeps a
+small cache of pyramids, so calls at several leaf sizes on the same
+polydata reuse each other.  The cache is keyed on the polydata modified
+time, call Modified() after changing point arrays in place with numpy.
+'''
+
+import numpy as np
+from collections import OrderedDict
+from ddapp import vtkNumpy as vnp
+from ddapp import vtkAll as vtk
+
+
+aggregationModes = ('mean', 'max', 'first')
+
+
+def getVoxelKeys(points, leafSize):
+    '''
+    Returns an Nx3 int64 array of voxel indices for an Nx3 array of points.
+    '''
+    return np.floor(np.asarray(points, dtype=np.float64) / leafSize).astype(np.int64)
+
+
+def groupVoxelKeys(keys):
+    '''
+    Given an Nx3 array of voxel keys returns a tuple (uniqueKeys, inverse)
+    where uniqueKeys is the Mx3 array of occupied voxels and inverse maps
+    each of the N keys to its row in uniqueKeys.
+    '''
+    minKey = keys.min(axis=0)
+    extent = keys.max(axis=0) - minKey + 1
+    offsets = keys - minKey
+    linear = (offsets[:,0]*extent[1] + offsets[:,1])*extent[2] + offsets[:,2]
+    _, index, inverse = np.unique(linear, return_index=True, return_inverse=True)
+    return keys[index], inverse
+
+
+def _groupSums(values, inverse, numberOfGroups):
+    if values.ndim == 1:
+        return np.bincount(inverse, weights=values, minlength=numberOfGroups)
+    return np.column_stack([np.bincount(inverse, weights=values[:,i], minlength=numberOfGroups) for i in xrange(values.shape[1])])
+
+
+def _groupStarts(inverse, counts):
+    order = np.argsort(inverse, kind='mergesort')
+    starts = np.zeros(len(counts), dtype=np.int64)
+    starts[1:] = np.cumsum(counts)[:-1]
+    return order, starts
+
+
+class VoxelLevel(object):
+    '''
+    Per voxel aggregates of one leaf size.  sums and maxima are dicts of
+    arrayName -> array with one row per voxel, firstIndices holds the index
+    of the first input point of each voxel.  The 'Points' entry of sums
+    holds the coordinate sums used for the centroids.
+    '''
+
+    def __init__(self, leafSize, keys, counts, firstIndices, sums, maxima):
+        self.leafSize = leafSize
+        self.keys = keys
+        self.counts = counts
+        self.firstIndices = firstIndices
+        self.sums = sums
+        self.maxima = maxima
+
+    def getNumberOfVoxels(self):
+        return len(self.keys)
+
+    def getCentroids(self):
+        return self.sums['Points'] / self.counts[:,None]
+
+    def getMeans(self, arrayName):
+        sums = self.sums[arrayName]
+        return sums / (self.counts[:,None] if sums.ndim == 2 else self.counts)
+
+    @staticmethod
+    def fromPoints(points, arrays, leafSize):
+        '''
+        Computes a level from an Nx3 array of points and a dict of point
+        data arrays with N rows each.
+        '''
+        keys, inverse = groupVoxelKeys(getVoxelKeys(points, leafSize))
+        numberOfVoxels = len(keys)
+        counts = np.bincount(inverse, minlength=numberOfVoxels)
+        order, starts = _groupStarts(inverse, counts)
+
+        sums = {'Points' : _groupSums(points, inverse, numberOfVoxels)}
+        maxima = {}
+        for name, values in arrays.iteritems():
+            sums[name] = _groupSums(values, inverse, numberOfVoxels)
+            maxima[name] = np.maximum.reduceat(values[order], starts)
+
+        return VoxelLevel(leafSize, keys, counts, order[starts], sums, maxima)
+
+    def coarsen(self, factor):
+        '''
+        Returns the level with factor times the leaf size, computed by
+        merging the voxels of this level.
+        '''
+        keys, inverse = groupVoxelKeys(self.keys // factor)
+        numberOfVoxels = len(keys)
+        counts = np.bincount(inverse, weights=self.counts, minlength=numberOfVoxels).astype(np.int64)
+        order, starts = _groupStarts(inverse, np.bincount(inverse, minlength=numberOfVoxels))
+
+        sums = dict((name, _groupSums(values, inverse, numberOfVoxels)) for name, values in self.sums.iteritems())
+        maxima = dict((name, np.maximum.reduceat(values[order], starts)) for name, values in self.maxima.iteritems())
+        firstIndices = np.minimum.reduceat(self.firstIndices[order], starts)
+
+        return VoxelLevel(self.leafSize*factor, keys, counts, firstIndices, sums, maxima)
+
+
+class VoxelPyramid(object):
+    '''
+    Caches voxel levels of one point cloud at several leaf sizes.
+    '''
+
+    def __init__(self, points, arrays=None):
+        self.points = np.asarray(points)
+        self.arrays = OrderedDict(arrays or {})
+        self.levels = {}
+
+    @staticmethod
+    def fromPolyData(polyData):
+        '''
+        Creates a pyramid for the points and the numeric point data arrays
+        of the polydata.  The arrays are referenced, not copied.
+        '''
+        points = vnp.getNumpyFromVtk(polyData, 'Points')
+        arrays = OrderedDict()
+        pointData = polyData.GetPointData()
+        for i in xrange(pointData.GetNumberOfArrays()):
+            array = pointData.GetArray(i)
+            if array is None or not array.GetName():
+                continue
+            arrays[array.GetName()] = vnp.getNumpyFromVtk(polyData, array.GetName())
+        return VoxelPyramid(points, arrays)
+
+    def _getLevelKey(self, leafSize):
+        return round(leafSize, 9)
+
+    def _findParentLevel(self, leafSize):
+        '''
+        Returns the coarsest cached level whose leaf size divides the given
+        leaf size, and the integer factor between them.
+        '''
+        parent, parentFactor = None, None
+        for level in self.levels.itervalues():
+            factor = leafSize / level.leafSize
+            intFactor = int(round(factor))
+            if intFactor >= 2 and abs(factor - intFactor) < 1e-6*factor:
+                if parent is None or level.leafSize > parent.leafSize:
+                    parent, parentFactor = level, intFactor
+        return parent, parentFactor
+
+    def getLevel(self, leafSize):
+        key = self._getLevelKey(leafSize)
+        level = self.levels.get(key)
+        if level is None:
+            parent, factor = self._findParentLevel(leafSize)
+            if parent is not None:
+                level = parent.coarsen(factor)
+                level.leafSize = leafSize
+            else:
+                level = VoxelLevel.fromPoints(self.points, self.arrays, leafSize)
+            self.levels[key] = level
+        return level
+
+    def buildLevels(self, baseLeafSize, numberOfLevels, factor=2):
+        '''
+        Computes numberOfLevels levels starting at baseLeafSize, each level
+        factor times coarser than the previous and computed from it.
+        '''
+        return [self.getLevel(baseLeafSize*factor**i) for i in xrange(numberOfLevels)]
+
+    def getArrays(self, leafSize, aggregation=None):
+        '''
+        Returns a tuple (points, arrays) of the voxel centroids and the
+        aggregated point data arrays for the given leaf size.  aggregation
+        is an optional dict of arrayName -> mode.  By default floating point
+        arrays use 'mean' and all other arrays use 'first'.  Output arrays
+        have the dtype of the input arrays.
+        '''
+        level = self.getLevel(leafSize)
+        aggregation = aggregation or {}
+
+        points = level.getCentroids().astype(self.points.dtype)
+
+        arrays = OrderedDict()
+        for name, values in self.arrays.iteritems():
+            mode = aggregation.get(name, 'mean' if values.dtype.kind == 'f' else 'first')
+            if mode == 'mean':
+                aggregated = level.getMeans(name)
+                if values.dtype.kind in 'iu':
+                    aggregated = np.round(aggregated)
+            elif mode == 'max':
+                aggregated = level.maxima[name]
+            elif mode == 'first':
+                aggregated = values[level.firstIndices]
+            else:
+                raise ValueError('unknown aggregation mode %r for array %s' % (mode, name))
+            arrays[name] = aggregated.astype(values.dtype)
+
+        if 'normals' in arrays and aggregation.get('normals', 'mean') == 'mean':
+            normals = arrays['normals']
+            norms = np.sqrt((normals**2).sum(axis=1))
+            norms[norms == 0.0] = 1.0
+            arrays['normals'] = (normals / norms[:,None]).astype(normals.dtype)
+
+        return points, arrays
+
+    def getPolyData(self, leafSize, aggregation=None, countArrayName=None):
+        '''
+        Returns a new polydata with one vertex per occupied voxel.  If
+        countArrayName is given the number of input points per voxel is
+        added as an int32 array with that name.
+        '''
+        points, arrays = self.getArrays(leafSize, aggregation)
+
+        polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+        for name, values in arrays.iteritems():
+            vnp.addNumpyToVtk(polyData, values, name)
+
+        if countArrayName:
+            vnp.addNumpyToVtk(polyData, self.getLevel(leafSize).counts.astype(np.int32), countArrayName)
+
+        return polyData
+
+
+_pyramidCache = OrderedDict()
+_pyramidCacheSize = 4
+
+
+def getPolyDataCacheKey(polyData):
+    '''
+    Returns a key that identifies the polydata and the state of its points.
+    Changing point arrays in place with numpy does not change the key unless
+    Modified() is called.
+    '''
+    points = polyData.GetPoints()
+    pointsMTime = (points.GetMTime(), points.GetData().GetMTime()) if points else (0, 0)
+    return (polyData.GetAddressAsString('vtkPolyData'), polyData.GetMTime(), pointsMTime, polyData.GetNumberOfPoints())
+
+
+def getVoxelPyramid(polyData):
+    '''
+    Returns the cached VoxelPyramid of the polydata, creating it if the
+    polydata is not in the cache or has been modified.
+    '''
+    key = getPolyDataCacheKey(polyData)
+    pyramid = _pyramidCache.pop(key, None)
+    if pyramid is None:
+        pyramid = VoxelPyramid.fromPolyData(polyData)
+    _pyramidCache[key] = pyramid
+
+    while len(_pyramidCache) > _pyramidCacheSize:
+        _pyramidCache.popitem(last=False)
+
+    return pyramid
+
+
+def clearCache():
+    _pyramidCache.clear()
+
+
+def applyVoxelGrid(polyData, leafSize=0.01, aggregation=None, countArrayName=None):
+    '''
+    Returns a downsampled copy of the polydata with one point per occupied
+    voxel, see VoxelPyramid.getPolyData().
+    '''
+    if not polyData.GetNumberOfPoints():
+        output = vtk.vtkPolyData()
+        output.DeepCopy(polyData)
+        return output
+
+    return getVoxelPyramid(polyData).getPolyData(leafSize, aggregation, countArrayName)
@@ -7,24 +7,65 @@ try:
 except ImportError:
     from paraview import numpy_support
 
-def numpyToPolyData(pts, pointData=None, createVertexCells=False):
+
+# numpy buffers that are shared with vtk arrays, keyed by the vtk array address.
+# An entry is released when the owning vtk array fires its DeleteEvent.
+_sharedArrays = {}
+
+
+def _getArrayKey(vtkArray):
+    return vtkArray.GetAddressAsString('vtkObject')
+
+
+def _releaseSharedArray(caller, event):
+    _sharedArrays.pop(_getArrayKey(caller), None)
+
+
+def _shareNumpyArray(vtkArray, numpyArray):
+    _sharedArrays[_getArrayKey(vtkArray)] = numpyArray
+    vtkArray.AddObserver('DeleteEvent', _releaseSharedArray)
+
+
+def isSharedArray(vtkArray):
+    '''
+    Returns True if the vtk array references memory owned by a numpy array.
+    '''
+    return _getArrayKey(vtkArray) in _sharedArrays
+
+
+def getSharedArrayCount():
+    return len(_sharedArrays)
+
+
+def getSharedArrayBytes():
+    return sum(a.nbytes for a in _sharedArrays.itervalues())
+
+
+def numpyToPolyData(pts, pointData=None, createVertexCells=False, lines=None, triangles=None, copy=True):
+    '''
+    Returns a new vtkPolyData from an Nx3 array of points.  pointData is an
+    optional dict of arrays added as point data.  lines and triangles are
+    optional Mx2 and Mx3 arrays of point indices.  If createVertexCells is
+    True a single poly vertex cell is added containing every point.
+    If copy is False the point and point data arrays share memory with the
+    given numpy arrays.
+    '''
     pd = vtk.vtkPolyData()
     pd.SetPoints(vtk.vtkPoints())
-    # Makes a deep copy
-    pd.GetPoints().SetData(getVtkFromNumpy(pts.copy()))
+    pd.GetPoints().SetData(getVtkFromNumpy(pts, copy=copy))
 
     if pointData is not None:
         for key, value in pointData.iteritems():
-            addNumpyToVtk(pd, value.copy(), key)
+            addNumpyToVtk(pd, value, key, copy=copy)
 
     if createVertexCells:
-        cellIds = vtk.vtkIdList()
-        cellIds.SetNumberOfIds(pd.GetNumberOfPoints())
-        for i in range(pd.GetNumberOfPoints()):
-            cellIds.SetId(i, i)
-        cells = vtk.vtkCellArray()
-        cells.InsertNextCell(cellIds)
-        pd.SetVerts(cells)
+        pd.SetVerts(getVtkCellArrayFromNumpy(np.arange(pd.GetNumberOfPoints()).reshape(1, -1)))
+
+    if lines is not None:
+        pd.SetLines(getVtkCellArrayFromNumpy(lines))
+
+    if triangles is not None:
+        pd.SetPolys(getVtkCellArrayFromNumpy(triangles))
 
     return pd
 
@@ -51,10 +92,11 @@ def getVtkPolyDataFromNumpyPoints(points):
     '''
     Given an Nx3 array of xyz points
     Return a new vtkPolyData containing points and vertex cells.
-    If the input points is not float64 it will be converted first.
+    float32 and float64 points are used without copying, any other
+    dtype will be converted to float64 first.
     '''
 
-    if points.dtype != np.float64:
+    if points.dtype not in (np.float32, np.float64):
         points = points.astype(np.float64)
 
     polyData = vtk.vtkPolyData()
@@ -63,21 +105,62 @@ def getVtkPolyDataFromNumpyPoints(points):
     return polyData
 
 
-def getVtkFromNumpy(numpyArray):
+def getVtkFromNumpy(numpyArray, copy=False):
+    '''
+    Returns a vtk array for the given numpy array.  Unless copy is True the
+    vtk array references the numpy buffer directly, so writes through either
+    array are visible in the other.  The numpy buffer is kept alive until the
+    vtk array is deleted.  Non-contiguous input is copied to a contiguous
+    array first.
+    '''
 
-    def MakeCallback(numpyArray):
-        def Closure(caller, event):
-            closureArray = numpyArray
-        return Closure
+    numpyArray = np.ascontiguousarray(numpyArray)
+
+    if copy:
+        return numpy_support.numpy_to_vtk(numpyArray, deep=1)
 
     vtkArray = numpy_support.numpy_to_vtk(numpyArray)
-    vtkArray.AddObserver('DeleteEvent', MakeCallback(numpyArray))
+    _shareNumpyArray(vtkArray, numpyArray)
     return vtkArray
 
 
-def addNumpyToVtk(dataObj, numpyArray, arrayName):
+def getVtkCellArrayFromNumpy(connectivity):
+    '''
+    Given an MxK array of point indices return a vtkCellArray containing
+    M cells of K points each.  Use K=1 for vertices, K=2 for lines and
+    K=3 for triangles.  The cell array is built without a per cell loop.
+    '''
+
+    connectivity = np.asarray(connectivity)
+    if connectivity.ndim == 1:
+        connectivity = connectivity.reshape(-1, 1)
+
+    numberOfCells, pointsPerCell = connectivity.shape
+
+    ids = np.empty((numberOfCells, pointsPerCell + 1), dtype=numpy_support.ID_TYPE_CODE)
+    ids[:,0] = pointsPerCell
+    ids[:,1:] = connectivity
+
+    cells = vtk.vtkCellArray()
+    cells.SetCells(numberOfCells, getVtkIdTypeArrayFromNumpy(ids.reshape(-1)))
+    return cells
+
+
+def getVtkIdTypeArrayFromNumpy(ids):
+    '''
+    Returns a vtkIdTypeArray that references a 1D array of ids without
+    copying, for use with vtkCellArray.SetCells.  The numpy buffer is kept
+    alive until the vtk array is deleted.
+    '''
+    ids = np.ascontiguousarray(ids, dtype=numpy_support.ID_TYPE_CODE)
+    idArray = numpy_support.numpy_to_vtkIdTypeArray(ids)
+    _shareNumpyArray(idArray, ids)
+    return idArray
+
+
+def addNumpyToVtk(dataObj, numpyArray, arrayName, copy=False):
     assert dataObj.GetNumberOfPoints() == numpyArray.shape[0]
 
-    vtkArray = getVtkFromNumpy(numpyArray)
+    vtkArray = getVtkFromNumpy(numpyArray, copy=copy)
     vtkArray.SetName(arrayName)
     dataObj.GetPointData().AddArray(vtkArray)
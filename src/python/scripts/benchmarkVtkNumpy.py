@@ -0,0 +1,72 @@
+'''
+Compares the copying, per-point loop construction of point cloud polydata
+with the zero-copy, vectorized path in vtkNumpy.
+
+Usage: directorPython benchmarkVtkNumpy.py [--points N] [--repeats N]
+'''
+
+import time
+import argparse
+import numpy as np
+from ddapp import vtkAll as vtk
+from ddapp import vtkNumpy
+
+
+def legacyNumpyToPolyData(pts, pointData):
+
+    pd = vtk.vtkPolyData()
+    pd.SetPoints(vtk.vtkPoints())
+    pd.GetPoints().SetData(vtkNumpy.getVtkFromNumpy(pts.astype(np.float64), copy=True))
+
+    for key, value in pointData.iteritems():
+        vtkArray = vtkNumpy.getVtkFromNumpy(value, copy=True)
+        vtkArray.SetName(key)
+        pd.GetPointData().AddArray(vtkArray)
+
+    cellIds = vtk.vtkIdList()
+    cellIds.SetNumberOfIds(pd.GetNumberOfPoints())
+    for i in xrange(pd.GetNumberOfPoints()):
+        cellIds.SetId(i, i)
+    cells = vtk.vtkCellArray()
+    cells.InsertNextCell(cellIds)
+    pd.SetVerts(cells)
+    return pd
+
+
+def zeroCopyNumpyToPolyData(pts, pointData):
+    return vtkNumpy.numpyToPolyData(pts, pointData, createVertexCells=True, copy=False)
+
+
+def timeFunction(func, repeats, *args):
+
+    times = []
+    for i in xrange(repeats):
+        t = time.time()
+        result = func(*args)
+        times.append(time.time() - t)
+        del result
+    return min(times)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark numpy to vtk conversion.')
+    parser.add_argument('--points', type=int, default=1000000, help='number of points')
+    parser.add_argument('--repeats', type=int, default=3, help='number of timing repeats')
+    args, unknown = parser.parse_known_args()
+
+    pts = np.random.rand(args.points, 3).astype(np.float32)
+    pointData = {'intensity' : np.random.rand(args.points).astype(np.float32)}
+
+    legacy = timeFunction(legacyNumpyToPolyData, args.repeats, pts, pointData)
+    zeroCopy = timeFunction(zeroCopyNumpyToPolyData, args.repeats, pts, pointData)
+
+    print 'points:    %d' % args.points
+    print 'legacy:    %.4f s' % legacy
+    print 'zero copy: %.4f s' % zeroCopy
+    print 'speedup:   %.1fx' % (legacy / max(zeroCopy, 1e-9))
+    print 'shared arrays still alive: %d (%d bytes)' % (vtkNumpy.getSharedArrayCount(), vtkNumpy.getSharedArrayBytes())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+'''
+Precompiles every historical revision of an lcmtypes package into the
+fingerprint registry used by lcmUtils.HistoricalLCMLoader, so that
+decoding messages from old logs never has to build types on the fly.
+
+Usage: buildHistoricalLCMTypes.py [--package drc] [--lcmtypes-path path] [--repo path] [--processes N]
+'''
+
+import os
+import argparse
+from ddapp import lcmUtils
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build the historical LCM type registry.')
+    parser.add_argument('--package', type=str, default='drc', help='lcm package name')
+    parser.add_argument('--lcmtypes-path', type=str, default='software/drc_lcmtypes/lcmtypes', help='path of the .lcm files relative to the repo')
+    parser.add_argument('--repo', type=str, default=os.getenv('DRC_BASE'), help='git repository path')
+    parser.add_argument('--processes', type=int, default=4, help='number of build processes')
+    args, unknown = parser.parse_known_args()
+
+    loader = lcmUtils.HistoricalLCMLoader(args.package, args.lcmtypes_path, args.repo)
+
+    def onRevisionBuilt(sha, numberDone, numberTotal):
+        print '[%d/%d] built %s' % (numberDone, numberTotal, sha[:8])
+
+    loader.buildRegistry(processes=args.processes, callback=onRevisionBuilt)
+    print 'registered %d type fingerprints in: %s' % (len(loader.registry['types']), loader.registry_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,11 @@ import numpy as np
 
 from ddapp import lcmspy as spy
 
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
 
 VIDEO_LCM_URL = 'udpm://239.255.76.50:7650?ttl=1'
 
@@ -26,22 +31,124 @@ class FieldData(object):
         return 'FieldData(%s)' % ', '.join(['%s=%r' % (k,v) for k, v in self.__dict__.iteritems()])
 
 
-def getRecentUtimes(utimeMap, seconds):
-
-    utimes = np.array(utimeMap.keys())
-    if not len(utimes):
-        return None
-
-    utimes.sort()
-    endTime = utimes[-1]
-    startTime = max(0, endTime - seconds*1e6)
-    startIndex = utimes.searchsorted(startTime)
-    utimes = utimes[startIndex:]
+class UtimeIndex(object):
+    '''
+    A sorted utime -> (filename, filepos) map stored in numpy arrays used
+    as a ring.  Appending in utime order is amortized O(1), and lookups and
+    cropping to a time window are O(log n) searches.  Methods are thread
+    safe, so the catalog thread can append while other threads read.
+    '''
+
+    def __init__(self, capacity=4096):
+        self.lock = threading.RLock()
+        self.filenames = []
+        self.filenameIds = {}
+        self._utimes = np.zeros(capacity, dtype=np.int64)
+        self._fileIds = np.zeros(capacity, dtype=np.int32)
+        self._filepos = np.zeros(capacity, dtype=np.int64)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def utimes(self):
+        return self._utimes[self.start:self.end]
+
+    def keys(self):
+        with self.lock:
+            return self.utimes.copy()
+
+    def _getFilenameId(self, filename):
+        filenameId = self.filenameIds.get(filename)
+        if filenameId is None:
+            filenameId = self.filenameIds[filename] = len(self.filenames)
+            self.filenames.append(filename)
+        return filenameId
+
+    def _reserve(self):
+        '''
+        Makes room for one more entry at the end of the ring, either by
+        moving the live entries to the front or by doubling the capacity.
+        '''
+        if self.end < len(self._utimes):
+            return
 
-    if not len(utimes):
-        return None
+        n = len(self)
+        capacity = len(self._utimes) if n < len(self._utimes)/2 else 2*len(self._utimes)
+        for name in ('_utimes', '_fileIds', '_filepos'):
+            oldArray = getattr(self, name)
+            newArray = np.zeros(capacity, dtype=oldArray.dtype)
+            newArray[:n] = oldArray[self.start:self.end]
+            setattr(self, name, newArray)
+
+        self.start, self.end = 0, n
+
+    def append(self, utime, filename, filepos):
+        with self.lock:
+            self._reserve()
+            i = self.end
+            if len(self) and utime < self._utimes[i-1]:
+                # out of order timestamp, shift the tail to keep the index sorted
+                i = self.start + self.utimes.searchsorted(utime, side='right')
+                for array in (self._utimes, self._fileIds, self._filepos):
+                    array[i+1:self.end+1] = array[i:self.end].copy()
+
+            self._utimes[i] = utime
+            self._fileIds[i] = self._getFilenameId(filename)
+            self._filepos[i] = filepos
+            self.end += 1
+
+    def __getitem__(self, utime):
+        with self.lock:
+            i = self.start + self.utimes.searchsorted(utime)
+            if i == self.end or self._utimes[i] != utime:
+                raise KeyError(utime)
+            return self.filenames[self._fileIds[i]], self._filepos[i]
+
+    def crop(self, timeWindow):
+        '''
+        Drops entries older than timeWindow seconds before the latest utime.
+        '''
+        with self.lock:
+            if not len(self):
+                return
+            cropTime = max(0, self._utimes[self.end-1] - timeWindow*1e6)
+            self.start += self.utimes.searchsorted(cropTime)
 
-    return utimes
+    def removeFile(self, filename):
+        with self.lock:
+            filenameId = self.filenameIds.get(filename)
+            if filenameId is None:
+                return
+            keep = self._fileIds[self.start:self.end] != filenameId
+            n = keep.sum()
+            for array in (self._utimes, self._fileIds, self._filepos):
+                array[:n] = array[self.start:self.end][keep]
+            self.start, self.end = 0, n
+
+    def getRecentUtimes(self, seconds):
+        '''
+        Returns a sorted array of the utimes in the last given number of
+        seconds, or None if the index is empty.
+        '''
+        with self.lock:
+            if not len(self):
+                return None
+            startTime = max(0, self._utimes[self.end-1] - seconds*1e6)
+            return self.utimes[self.utimes.searchsorted(startTime):].copy()
+
+    def copy(self):
+        with self.lock:
+            other = UtimeIndex(capacity=max(len(self), 1))
+            other.filenames = list(self.filenames)
+            other.filenameIds = dict(self.filenameIds)
+            other._utimes[:len(self)] = self.utimes
+            other._fileIds[:len(self)] = self._fileIds[self.start:self.end]
+            other._filepos[:len(self)] = self._filepos[self.start:self.end]
+            other.end = len(self)
+            return other
 
 
 class LCMPoller(object):
@@ -65,7 +172,7 @@ class LogLookup(object):
     def setUtimeMap(self, utimeMap):
         self.utimeMap = utimeMap
 
-    def getImage(self, utime):
+    def readEvent(self, utime):
         filename, filepos = self.utimeMap[utime]
 
         log = self.logs.get(filename)
@@ -74,26 +181,200 @@ class LogLookup(object):
             self.logs[filename] = log
 
         log.seek(filepos)
-        event = log.read_next_event()
+        return log.read_next_event(), filename
+
+    def getImage(self, utime):
+        event, filename = self.readEvent(utime)
         msg = spy.decodeMessage(event.data)
 
         if hasattr(msg, 'images'):
             msg = msg.images[0]
         return msg, filename
 
+    def getImageBytes(self, utime):
+        '''
+        Returns the encoded image_t message bytes ready to publish.
+        '''
+        event, filename = self.readEvent(utime)
+        msg = spy.decodeMessage(event.data)
+
+        if hasattr(msg, 'images'):
+            return msg.images[0].encode(), filename
+        return event.data, filename
+
     def closeLogs(self):
         for log in self.logs.values():
             log.close()
         self.logs = {}
 
 
+class FrameCache(object):
+    '''
+    Keeps publish ready image bytes for a window of frames around the
+    playhead.  Worker threads, each with their own open log files, read
+    ahead of the playhead in the direction of play.  The number of cached
+    frames is limited by memoryBudget (bytes); frames outside the window,
+    then frames furthest from the playhead, are evicted first.
+    '''
+
+    def __init__(self, utimeMap, utimes, memoryBudget=512*1024*1024, numberOfWorkers=2, readAheadFraction=0.75):
+
+        self.utimeMap = utimeMap
+        self.utimes = utimes
+        self.memoryBudget = memoryBudget
+        self.readAheadFraction = readAheadFraction
+
+        self.frames = {}
+        self.pending = set()
+        self.cacheSize = 0
+        self.averageFrameSize = None
+        self.playheadIndex = 0
+        self.direction = 1
+        self.shouldStop = False
+        self.lock = threading.Condition()
+
+        self.syncLock = threading.Lock()
+        self.syncLookup = LogLookup()
+        self.syncLookup.setUtimeMap(utimeMap)
+
+        self.workers = []
+        for i in xrange(numberOfWorkers):
+            logLookup = LogLookup()
+            logLookup.setUtimeMap(utimeMap)
+            thread = threading.Thread(target=self._workerLoop, args=(logLookup,))
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+
+    def stop(self):
+        with self.lock:
+            self.shouldStop = True
+            self.lock.notify_all()
+
+        for thread in self.workers:
+            thread.join()
+
+        with self.syncLock:
+            self.syncLookup.closeLogs()
+
+    def getWindow(self):
+        '''
+        Returns the [start, end) frame index range to keep cached.
+        '''
+        if self.averageFrameSize:
+            windowSize = max(2, int(self.memoryBudget / self.averageFrameSize))
+        else:
+            windowSize = 2*len(self.workers)
+
+        ahead = int(windowSize*self.readAheadFraction)
+        behind = windowSize - ahead
+        if self.direction < 0:
+            ahead, behind = behind, ahead
+
+        return max(0, self.playheadIndex - behind), min(len(self.utimes), self.playheadIndex + ahead + 1)
+
+    def setPlayhead(self, index):
+        with self.lock:
+            if index != self.playheadIndex:
+                self.direction = 1 if index > self.playheadIndex else -1
+            self.playheadIndex = index
+            self.lock.notify_all()
+
+    def _nextIndexToLoad(self):
+
+        start, end = self.getWindow()
+        index = self.playheadIndex
+
+        if self.direction > 0:
+            order = (xrange(index, end), xrange(index-1, start-1, -1))
+        else:
+            order = (xrange(index, start-1, -1), xrange(index+1, end))
+
+        for indices in order:
+            for i in indices:
+                if i not in self.frames and i not in self.pending:
+                    return i
+
+    def _insertFrame(self, index, data):
+
+        if index in self.frames:
+            return
+
+        self.frames[index] = data
+        self.cacheSize += len(data)
+
+        if self.averageFrameSize is None:
+            self.averageFrameSize = float(len(data))
+        else:
+            self.averageFrameSize += 0.05*(len(data) - self.averageFrameSize)
+
+        start, end = self.getWindow()
+        evictOrder = lambda i: (not start <= i < end, abs(i - self.playheadIndex))
+
+        while self.cacheSize > self.memoryBudget and len(self.frames) > 1:
+            evictIndex = max(self.frames, key=evictOrder)
+            self.cacheSize -= len(self.frames.pop(evictIndex))
+
+    def _workerLoop(self, logLookup):
+
+        while True:
+
+            with self.lock:
+                index = None
+                while not self.shouldStop:
+                    index = self._nextIndexToLoad()
+                    if index is not None:
+                        break
+                    self.lock.wait(0.5)
+
+                if self.shouldStop:
+                    break
+
+                self.pending.add(index)
+
+            data, filename = logLookup.getImageBytes(self.utimes[index])
+
+            with self.lock:
+                self.pending.discard(index)
+                self._insertFrame(index, data)
+                self.lock.notify_all()
+
+        logLookup.closeLogs()
+
+    def getFrame(self, index):
+        '''
+        Returns the image bytes of the frame at index and moves the playhead
+        to index.  Blocks if the frame is being read by a worker, and reads
+        it synchronously if it is not cached.
+        '''
+        self.setPlayhead(index)
+
+        with self.lock:
+            while index in self.pending and not self.shouldStop:
+                self.lock.wait(0.5)
+            data = self.frames.get(index)
+
+        if data is None:
+            with self.syncLock:
+                data, filename = self.syncLookup.getImageBytes(self.utimes[index])
+            with self.lock:
+                self._insertFrame(index, data)
+
+        return data
+
+
 class PlayThread(object):
+    '''
+    Publishes frames on wall clock deadlines computed from the log utimes
+    and playback speed.  When publishing falls behind, late frames are
+    dropped rather than delaying the rest of the playback.
+    '''
 
-    def __init__(self, utimes, logLookup, speed):
+    def __init__(self, frameCache, startIndex, speed):
         self.fps = 60
         self.shouldStop = False
-        self.utimes = utimes
-        self.logLookup = logLookup
+        self.frameCache = frameCache
+        self.startIndex = startIndex
         self.speed = speed
         self.lc = lcm.LCM(VIDEO_LCM_URL)
 
@@ -107,26 +388,42 @@ class PlayThread(object):
         self.shouldStop = True
         self.thread.join()
 
-    def mainLoop(self):
-        startTime = time.time()
+    def getDeadline(self, startTime, utimeIndex):
+        utimes = self.frameCache.utimes
+        return startTime + (utimes[utimeIndex] - utimes[self.startIndex])*1e-6 / self.speed
 
+    def sleepUntil(self, deadline):
         while not self.shouldStop:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
 
-            elapsedUtime = int(1e6 * (time.time() - startTime)*self.speed)
+    def mainLoop(self):
+        utimes = self.frameCache.utimes
+        startTime = time.time()
+        utimeIndex = self.startIndex
+        droppedFrames = 0
 
-            utimeIndex = self.utimes.searchsorted(self.utimes[0] + elapsedUtime)
+        while not self.shouldStop and utimeIndex < len(utimes):
 
-            if utimeIndex == len(self.utimes):
-                break
+            elapsedUtime = int(1e6 * (time.time() - startTime)*self.speed)
 
-            utimeRequest = self.utimes[utimeIndex]
-            image, filename = self.logLookup.getImage(utimeRequest)
+            # skip to the most recent frame whose deadline has passed
+            lateIndex = utimes.searchsorted(utimes[self.startIndex] + elapsedUtime, side='right') - 1
+            if lateIndex > utimeIndex:
+                droppedFrames += lateIndex - utimeIndex
+                utimeIndex = lateIndex
 
-            print 'elapsed:  %.2f    index: %d    play jitter:  %.3f' % (elapsedUtime*1e-6, utimeIndex, (utimeRequest - (self.utimes[0] + elapsedUtime)  )*1e-6)
+            imageBytes = self.frameCache.getFrame(utimeIndex)
+            self.lc.publish('VIDEO_PLAYBACK_IMAGE', imageBytes)
+            publishTime = time.time()
 
-            self.lc.publish('VIDEO_PLAYBACK_IMAGE', image.encode())
+            print 'elapsed:  %.2f    index: %d    play jitter:  %.3f    dropped: %d' % (elapsedUtime*1e-6, utimeIndex, publishTime - self.getDeadline(startTime, utimeIndex), droppedFrames)
 
-            time.sleep(1.0 / self.fps)
+            utimeIndex += 1
+            if utimeIndex < len(utimes):
+                self.sleepUntil(max(self.getDeadline(startTime, utimeIndex), publishTime + 1.0/self.fps))
 
 
 class ServerThread(object):
@@ -135,9 +432,11 @@ class ServerThread(object):
 
         self.sharedUtimeMap = sharedUtimeMap
         self.utimes = None
+        self.frameCache = None
         self.playbackThread = None
         self.syncThread = None
         self.timeWindow = 60
+        self.frameCacheMemoryBudget = 512*1024*1024
         self.logLookup = LogLookup()
         self.lc = lcm.LCM(VIDEO_LCM_URL)
         self.lc.subscribe('VIDEO_PLAYBACK_CONTROL', self.onControlMessage)
@@ -155,7 +454,7 @@ class ServerThread(object):
     def getUtimeIndex(self, data):
 
         assert 0.0 <= data.value <= 1.0
-        return (len(self.utimes)-1)*data.value
+        return int((len(self.utimes)-1)*data.value)
 
 
     def onFrameRequest(self, data):
@@ -164,28 +463,32 @@ class ServerThread(object):
 
         if self.utimes is None:
 
-            self.logLookup.setUtimeMap(dict(self.sharedUtimeMap))
-            self.utimes = getRecentUtimes(self.logLookup.utimeMap, seconds=self.timeWindow)
+            self.logLookup.setUtimeMap(self.sharedUtimeMap.copy())
+            self.utimes = self.logLookup.utimeMap.getRecentUtimes(seconds=self.timeWindow)
 
             if self.utimes is None:
                 print 'no utimes cataloged'
                 return
 
             print 'starting review with utimes %d %d' % (self.utimes[0], self.utimes[1])
+            self.frameCache = FrameCache(self.logLookup.utimeMap, self.utimes, memoryBudget=self.frameCacheMemoryBudget)
 
 
         utimeIndex = self.getUtimeIndex(data)
         utimeRequest = self.utimes[utimeIndex]
-        image, filename = self.logLookup.getImage(utimeRequest)
+        imageBytes = self.frameCache.getFrame(utimeIndex)
 
-        print 'location: %.2f  index: %d  utime: %d   timeDelta:  %.3f    file: %s' % (data.value, utimeIndex, utimeRequest, (self.utimes[-1] - self.utimes[utimeIndex])*1e-6, os.path.basename(filename))
+        print 'location: %.2f  index: %d  utime: %d   timeDelta:  %.3f    file: %s' % (data.value, utimeIndex, utimeRequest, (self.utimes[-1] - self.utimes[utimeIndex])*1e-6, os.path.basename(self.logLookup.utimeMap[utimeRequest][0]))
 
-        self.lc.publish('VIDEO_PLAYBACK_IMAGE', image.encode())
+        self.lc.publish('VIDEO_PLAYBACK_IMAGE', imageBytes)
 
 
     def onResume(self, data):
         self.stopPlaybackThread()
         self.utimes = None
+        if self.frameCache:
+            self.frameCache.stop()
+        self.frameCache = None
         self.logLookup.closeLogs()
         return
 
@@ -199,8 +502,7 @@ class ServerThread(object):
             return
 
         startIndex = self.getUtimeIndex(data)
-        playbackUtimes = self.utimes[startIndex:]
-        self.playbackThread = PlayThread(playbackUtimes, self.logLookup, speed=data.speed)
+        self.playbackThread = PlayThread(self.frameCache, startIndex, speed=data.speed)
         self.playbackThread.start()
 
 
@@ -284,11 +586,10 @@ class LogSyncThread(object):
 
         if self.logLookup.utimeMap is None:
 
-            self.logLookup.setUtimeMap(dict(self.sharedUtimeMap))
+            self.logLookup.setUtimeMap(self.sharedUtimeMap.copy())
             assert len(self.logLookup.utimeMap)
 
-            self.utimes = np.array(self.logLookup.utimeMap.keys())
-            self.utimes.sort()
+            self.utimes = self.logLookup.utimeMap.keys()
 
 
         requestIndex = self.utimes.searchsorted(utimeRequest)
@@ -321,18 +622,28 @@ class LogSyncThread(object):
 
 
 class CatalogThread(object):
+    '''
+    Maintains a UtimeIndex of the video channel events in the log
+    directory.  The directory is watched with inotify when pyinotify is
+    available, otherwise it is polled.  Only the most recent log file, the
+    one being appended to, is kept open and read incrementally; older logs
+    are read once when they are discovered.
+    '''
 
-
-    def __init__(self, logDir, videoChannel):
+    def __init__(self, logDir, videoChannel, usePolling=False):
 
         self.videoChannel = videoChannel
         self.logDir = logDir
+        self.usePolling = usePolling or pyinotify is None
 
         self.pruneEnabled = True
         self.maxNumberOfFiles = 30
         self.cropTimeWindow = 60*30
-        self.utimeMap = {}
+        self.pollInterval = 0.3
+        self.utimeMap = UtimeIndex()
         self.catalog = {}
+        self.currentFile = None
+        self.modifiedFiles = set()
 
 
     def start(self):
@@ -346,21 +657,89 @@ class CatalogThread(object):
         self.thread.join()
 
     def mainLoop(self):
+
+        self.updateCatalog()
+
+        if self.usePolling:
+            self.pollLoop()
+        else:
+            self.watchLoop()
+
+        for fieldData in self.catalog.values():
+            self.closeLog(fieldData)
+
+    def pollLoop(self):
         while not self.shouldStop:
+            self.pollLogDir()
+            time.sleep(self.pollInterval)
+
+    def watchLoop(self):
+
+        watchManager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(watchManager, default_proc_fun=self.onLogDirEvent)
+        mask = pyinotify.IN_CREATE | pyinotify.IN_MODIFY | pyinotify.IN_MOVED_TO | pyinotify.IN_CLOSE_WRITE
+        watchManager.add_watch(self.logDir, mask)
+
+        while not self.shouldStop:
+            if notifier.check_events(timeout=int(self.pollInterval*1000)):
+                notifier.read_events()
+                notifier.process_events()
+            self.processModifiedFiles()
+
+        notifier.stop()
+
+    def onLogDirEvent(self, event):
+        if os.path.basename(event.pathname).startswith('lcmlog-'):
+            self.modifiedFiles.add(event.pathname)
+
+    def processModifiedFiles(self):
+
+        modifiedFiles, self.modifiedFiles = self.modifiedFiles, set()
+
+        if [filename for filename in modifiedFiles if filename not in self.catalog]:
             self.updateCatalog()
-            time.sleep(0.3)
 
+        for filename in modifiedFiles:
+            if filename in self.catalog:
+                self.updateLogInfo(filename)
 
-    def updateCatalog(self):
+    def pollLogDir(self):
 
         logFiles = self.getExistingLogFiles(self.logDir)
 
+        if [filename for filename in logFiles if filename not in self.catalog]:
+            self.updateCatalog(logFiles)
+        elif self.currentFile:
+            self.updateLogInfo(self.currentFile)
+
+    def updateCatalog(self, logFiles=None):
+
+        if logFiles is None:
+            logFiles = self.getExistingLogFiles(self.logDir)
+
         if self.pruneEnabled:
             logFiles = self.pruneLogFiles(logFiles, self.maxNumberOfFiles)
 
+        for filename in self.catalog.keys():
+            if filename not in logFiles:
+                self.closeLog(self.catalog.pop(filename))
+                self.utimeMap.removeFile(filename)
+
+        previousFile = self.currentFile
+        self.currentFile = logFiles[-1] if logFiles else None
+
+        # finish reading the log that was being appended before closing it
+        if previousFile in self.catalog and previousFile != self.currentFile:
+            self.updateLogInfo(previousFile)
+
         for logFile in logFiles:
-            self.updateLogInfo(logFile)
+            if logFile not in self.catalog or logFile == self.currentFile:
+                self.updateLogInfo(logFile)
 
+    def closeLog(self, fieldData):
+        if fieldData.log is not None:
+            fieldData.log.close()
+            fieldData.log = None
 
     def updateLogInfo(self, filename):
 
@@ -368,49 +747,41 @@ class CatalogThread(object):
 
         if not fieldData:
             print 'discovered new file:', filename
-            fieldData = FieldData(filename=filename, fileSize=0, lastFilePos=0, channelTypes={})
+            fieldData = FieldData(filename=filename, fileSize=0, nextFilePos=0, log=None, channelTypes={})
             self.catalog[filename] = fieldData
-            self.cropUtimeMap(self.utimeMap, self.cropTimeWindow)
+            self.utimeMap.crop(self.cropTimeWindow)
 
-
-        log = lcm.EventLog(filename, 'r')
-        fileSize = log.size()
-
-        # if the log file is the same size as the last time it was inspected
-        # then there is no more work to do, return.
-        if fileSize == fieldData.fileSize:
+        try:
+            fileSize = os.path.getsize(filename)
+        except OSError:
             return
 
-        fieldData.fileSize = fileSize
-
-        # seek to the last processed event, if one exists, then read past it
-        if fieldData.lastFilePos > 0:
-            log.seek(fieldData.lastFilePos)
-            event = log.read_next_event()
-
+        # if the log file is the same size as the last time it was inspected
+        # then there is no new data to read.
+        if fileSize != fieldData.fileSize:
 
-        while True:
+            fieldData.fileSize = fileSize
 
-            filepos = log.tell()
-            event = log.read_next_event()
-            if not event:
-                break
+            if fieldData.log is None:
+                fieldData.log = lcm.EventLog(filename, 'r')
 
-            fieldData.lastFilePos = filepos
-            timestamp = event.timestamp
-            channel = event.channel
+            log = fieldData.log
+            log.seek(fieldData.nextFilePos)
 
-            if channel == self.videoChannel:
-                self.utimeMap[timestamp] = (filename, filepos)
+            while True:
 
+                filepos = log.tell()
+                event = log.read_next_event()
+                if not event:
+                    break
 
-            # maintain a catalog of channelName->messageType
-            #if channel not in fieldData.channelTypes:
-            #    messageClass = spy.getMessageClass(event.data)
-            #    fieldData.channelTypes[channel] = messageClass
+                fieldData.nextFilePos = log.tell()
 
+                if event.channel == self.videoChannel:
+                    self.utimeMap.append(event.timestamp, filename, filepos)
 
-        log.close()
+        if filename != self.currentFile:
+            self.closeLog(fieldData)
 
 
     @staticmethod
@@ -444,20 +815,6 @@ class CatalogThread(object):
         return logFiles
 
 
-    @staticmethod
-    def cropUtimeMap(utimeMap, timeWindow):
-
-        if not len(utimeMap):
-            return
-
-        utimes = getRecentUtimes(utimeMap, timeWindow)
-        cropTime = utimes[0]
-
-        for utime in utimeMap.keys():
-            if utime < cropTime:
-                del utimeMap[utime]
-
-
 def main():
 
     try:
@@ -0,0 +1,135 @@
+from ddapp import colorize
+from ddapp import vtkNumpy as vnp
+import numpy as np
+import time
+
+'''
+Checks the point color cache of PointCloudColorizer and the bookkeeping of
+worker results, without cameras.
+'''
+
+
+def makeColorizer(**kwargs):
+    return colorize.PointCloudColorizer(None, cameras=[], **kwargs)
+
+
+def waitForResult(colorizer):
+    while colorizer.resultQueue.empty():
+        time.sleep(0.01)
+
+
+def testCache():
+
+    colorizer = makeColorizer()
+    points = np.random.rand(1000, 3)
+    keys = colorizer._computePointIds(points)
+
+    update = colorizer._computeUpdate(points, [])
+    assert not update[2].any()
+    assert len(update[3]) == len(points)
+
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+    colorizer._applyUpdate(polyData, [], update)
+    assert (vnp.getNumpyFromVtk(polyData, 'rgb') == 255).all()
+
+    uniqueKeys = np.unique(keys)
+    assert np.array_equal(colorizer.cacheKeys, uniqueKeys)
+    assert (colorizer.cacheUtimes == 0).all()
+
+    # points colored by a camera are updated in place and are not pending
+    colors = np.random.randint(0, 255, size=(len(points), 3)).astype(np.uint8)
+    utimes = np.arange(1, len(points) + 1, dtype=np.int64)
+    cacheInds, found = colorizer._lookupCache(keys)
+    assert found.all()
+    colorizer._updateCache(keys, colors, utimes, found, cacheInds)
+    assert np.array_equal(colorizer.cacheKeys, uniqueKeys)
+
+    cacheInds, found = colorizer._lookupCache(keys)
+    assert found.all()
+    assert (colorizer.cacheUtimes[cacheInds] != 0).all()
+    assert not len(colorizer._computeUpdate(points, [])[3])
+
+    # new points are merged in sorted order
+    newPoints = np.random.rand(500, 3) + 2.0
+    newPolyData = vnp.getVtkPolyDataFromNumpyPoints(newPoints)
+    colorizer._applyUpdate(newPolyData, [], colorizer._computeUpdate(newPoints, []))
+    assert np.array_equal(colorizer.cacheKeys, np.union1d(uniqueKeys, colorizer._computePointIds(newPoints)))
+
+    # exceeding the cache size keeps only the current cloud
+    colorizer.maxCacheSize = len(colorizer.cacheKeys)
+    newPolyData = vnp.getVtkPolyDataFromNumpyPoints(newPoints + 2.0)
+    colorizer._applyUpdate(newPolyData, [], colorizer._computeUpdate(newPoints + 2.0, []))
+    assert np.array_equal(colorizer.cacheKeys, np.unique(colorizer._computePointIds(newPoints + 2.0)))
+
+
+def testWorkerError():
+
+    colorizer = makeColorizer(useWorkerThread=True)
+    computeUpdate = colorizer._computeUpdate
+    calls = []
+    callbacks = []
+
+    def failOnce(points, cameraStates):
+        calls.append(len(points))
+        if len(calls) == 1:
+            raise ValueError('worker failure')
+        return computeUpdate(points, cameraStates)
+
+    colorizer._computeUpdate = failOnce
+
+    points = np.random.rand(100, 3)
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+    request = (polyData, [], points, lambda: callbacks.append(True))
+
+    colorizer._startWorker(request)
+    colorizer.pendingRequest = request
+    waitForResult(colorizer)
+
+    # the failed result starts the pending request and keeps polling
+    assert colorizer._checkWorkerResult() is None
+    assert colorizer.workerBusy
+    assert colorizer.pendingRequest is None
+
+    waitForResult(colorizer)
+    assert colorizer._checkWorkerResult() is False
+    assert not colorizer.workerBusy
+    assert callbacks == [True]
+    assert vnp.getNumpyFromVtk(polyData, 'rgb').shape == (len(points), 3)
+
+    colorizer.timer.stop()
+
+
+def testPendingRequest():
+
+    colorizer = makeColorizer(useWorkerThread=True)
+    points = np.random.rand(100, 3)
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+    request = (polyData, [], points, None)
+
+    startWorker = colorizer._startWorker
+    cacheSizes = []
+
+    def recordingStartWorker(request):
+        cacheSizes.append(len(colorizer.cacheKeys))
+        startWorker(request)
+
+    colorizer._startWorker = recordingStartWorker
+    colorizer._startWorker(request)
+    colorizer.pendingRequest = request
+    waitForResult(colorizer)
+    assert colorizer._checkWorkerResult() is None
+    assert colorizer.workerBusy
+
+    # the pending request starts after the first result updated the cache
+    assert cacheSizes[0] == 0 and cacheSizes[1] > 0
+    waitForResult(colorizer)
+    _, update = colorizer.resultQueue.queue[0]
+    assert update[2].all()
+    assert colorizer._checkWorkerResult() is False
+
+    colorizer.timer.stop()
+
+
+testCache()
+testWorkerError()
+testPendingRequest()
@@ -0,0 +1,86 @@
+from ddapp import forwardkinematics
+from ddapp import transformArrays as ta
+from ddapp.thirdparty import transformations
+import numpy as np
+
+'''
+Compares ddapp.forwardkinematics with link frames composed by hand with
+ddapp.thirdparty.transformations for a small floating base robot.
+'''
+
+
+urdfString = '''
+<robot name="arm">
+  <link name="pelvis"/>
+  <link name="upper"/>
+  <link name="lower"/>
+  <link name="hand"/>
+  <link name="slider"/>
+  <joint name="shoulder" type="revolute">
+    <parent link="pelvis"/>
+    <child link="upper"/>
+    <origin xyz="0 0.2 0.5" rpy="0.1 0 0"/>
+    <axis xyz="0 1 0"/>
+  </joint>
+  <joint name="elbow" type="continuous">
+    <parent link="upper"/>
+    <child link="lower"/>
+    <origin xyz="0 0 -0.3"/>
+    <axis xyz="1 1 0"/>
+  </joint>
+  <joint name="wrist_fixed" type="fixed">
+    <parent link="lower"/>
+    <child link="hand"/>
+    <origin xyz="0.05 0 -0.25" rpy="0 0 1.57"/>
+  </joint>
+  <joint name="lift" type="prismatic">
+    <parent link="pelvis"/>
+    <child link="slider"/>
+    <axis xyz="0 0 1"/>
+  </joint>
+</robot>
+'''
+
+jointNames = forwardkinematics.floatingBaseJointNames + ['shoulder', 'elbow', 'lift']
+
+
+def frame(xyz, rpy):
+    mat = transformations.euler_matrix(*rpy)
+    mat[:3,3] = xyz
+    return mat
+
+
+def rotation(angle, axis):
+    return transformations.rotation_matrix(angle, np.asarray(axis) / np.linalg.norm(axis))
+
+
+def expectedFrames(pose):
+
+    pelvis = frame(pose[:3], pose[3:6])
+    upper = np.dot(pelvis, np.dot(frame([0, 0.2, 0.5], [0.1, 0, 0]), rotation(pose[6], [0, 1, 0])))
+    lower = np.dot(upper, np.dot(frame([0, 0, -0.3], [0, 0, 0]), rotation(pose[7], [1, 1, 0])))
+    hand = np.dot(lower, frame([0.05, 0, -0.25], [0, 0, 1.57]))
+    slider = np.dot(pelvis, transformations.translation_matrix([0, 0, pose[8]]))
+    return dict(pelvis=pelvis, upper=upper, lower=lower, hand=hand, slider=slider)
+
+
+def testForwardKinematics():
+
+    fk = forwardkinematics.ForwardKinematics(urdfString, jointNames)
+    poses = np.random.uniform(-1.0, 1.0, size=(20, len(jointNames)))
+
+    for pose in poses:
+        frames = fk.getLinkFrames(pose)
+        for linkName, expected in expectedFrames(pose).iteritems():
+            assert np.allclose(frames[linkName], expected)
+
+    handFrames = fk.getLinkFrameForPoses('hand', poses)
+    assert handFrames.shape == (len(poses), 4, 4)
+    for pose, handFrame in zip(poses, handFrames):
+        assert np.allclose(handFrame, expectedFrames(pose)['hand'])
+
+    transform = fk.getLinkFrame('hand', poses[0])
+    assert np.allclose(ta.matrixFromTransform(transform), expectedFrames(poses[0])['hand'])
+
+
+testForwardKinematics()
@@ -0,0 +1,133 @@
+from ddapp import geometryencoder
+from ddapp import vtkNumpy as vnp
+from ddapp import vtkAll as vtk
+import numpy as np
+import random
+
+'''
+Round trips points, point data and cells through the compressed geometry
+codec for every position encoding and compression method, and checks that
+the active normals and tcoords are restored and cell data is dropped.
+'''
+
+
+positionEncodings = ('int16', 'float16', 'float32')
+
+
+def getCellIds(cellArray):
+    return vnp.numpy_support.vtk_to_numpy(cellArray.GetData()).astype(np.int64)
+
+
+def makePolyData():
+
+    points = (np.random.rand(500, 3) * [4.0, 2.0, 1.0] + [10.0, -5.0, 0.5]).astype(np.float32)
+    triangles = np.random.randint(0, len(points), size=(200, 3))
+
+    polyData = vnp.numpyToPolyData(points, triangles=triangles, createVertexCells=True)
+    vnp.addNumpyToVtk(polyData, np.random.rand(len(points)), 'intensity')
+    vnp.addNumpyToVtk(polyData, np.arange(len(points), dtype=np.int32), 'index')
+
+    normals = np.random.randn(len(points), 3)
+    normals /= np.sqrt((normals**2).sum(axis=1))[:,np.newaxis]
+    vnp.addNumpyToVtk(polyData, normals.astype(np.float32), 'normals')
+    polyData.GetPointData().SetNormals(polyData.GetPointData().GetArray('normals'))
+
+    # an unnamed active array is stored under its attribute name
+    polyData.GetPointData().SetTCoords(vnp.getVtkFromNumpy(np.random.rand(len(points), 2).astype(np.float32)))
+
+    # lines of two and three points use the variable cell size path
+    lineIds = np.array([2, 0, 1, 3, 1, 2, 3, 2, 498, 499])
+    lines = vtk.vtkCellArray()
+    lines.SetCells(3, vnp.getVtkIdTypeArrayFromNumpy(lineIds))
+    polyData.SetLines(lines)
+
+    cellValues = vnp.getVtkFromNumpy(np.arange(polyData.GetNumberOfCells(), dtype=np.float32))
+    cellValues.SetName('cell_values')
+    polyData.GetCellData().AddArray(cellValues)
+
+    return polyData
+
+
+def getPositionTolerance(points, positionEncoding):
+    low, high = points.min(axis=0), points.max(axis=0)
+    if positionEncoding == 'int16':
+        return (high - low).max() / 65535.0
+    elif positionEncoding == 'float16':
+        return ((high - low) / 2.0).max() * 2.0**-10
+    return 1e-6 * np.abs(points).max()
+
+
+def checkDecoded(polyData, decoded, positionEncoding):
+
+    points = vnp.getNumpyFromVtk(polyData, 'Points')
+    decodedPoints = vnp.getNumpyFromVtk(decoded, 'Points')
+    assert decodedPoints.dtype == np.float32
+    assert decodedPoints.shape == points.shape
+    assert np.abs(decodedPoints - points).max() <= getPositionTolerance(points, positionEncoding)
+
+    intensity = vnp.getNumpyFromVtk(decoded, 'intensity')
+    assert intensity.dtype == np.float32
+    assert np.allclose(intensity, vnp.getNumpyFromVtk(polyData, 'intensity'), atol=1e-6)
+    assert np.array_equal(vnp.getNumpyFromVtk(decoded, 'index'), vnp.getNumpyFromVtk(polyData, 'index'))
+
+    normals = decoded.GetPointData().GetNormals()
+    assert normals is not None and normals.GetName() == 'normals'
+    assert np.array_equal(vnp.getNumpyFromVtk(decoded, 'normals'), vnp.getNumpyFromVtk(polyData, 'normals'))
+
+    tcoords = decoded.GetPointData().GetTCoords()
+    assert tcoords is not None and tcoords.GetName() == 'TCoords'
+    assert np.array_equal(vnp.numpy_support.vtk_to_numpy(tcoords),
+                          vnp.numpy_support.vtk_to_numpy(polyData.GetPointData().GetTCoords()))
+    assert decoded.GetPointData().GetScalars() is None
+
+    for cellType in ('Verts', 'Lines', 'Polys'):
+        cells = getattr(polyData, 'Get' + cellType)()
+        decodedCells = getattr(decoded, 'Get' + cellType)()
+        assert decodedCells.GetNumberOfCells() == cells.GetNumberOfCells()
+        assert np.array_equal(getCellIds(decodedCells), getCellIds(cells))
+
+    assert decoded.GetStrips().GetNumberOfCells() == 0
+
+    # cell data is not part of the encoding
+    assert polyData.GetCellData().GetNumberOfArrays() == 1
+    assert decoded.GetCellData().GetNumberOfArrays() == 0
+
+
+def testRoundTrip():
+
+    polyData = makePolyData()
+
+    for compression in geometryencoder.getCompressionMethods():
+        for positionEncoding in positionEncodings:
+            data = geometryencoder.encodePolyDataCompressed(polyData, positionEncoding=positionEncoding, compression=compression)
+            assert data.dtype == np.int8
+            assert geometryencoder.isCompressedEncoding(data)
+            checkDecoded(polyData, geometryencoder.decodePolyData(data), positionEncoding)
+
+
+def testChunks():
+
+    polyData = makePolyData()
+    chunks = list(geometryencoder.encodePolyDataChunks(polyData, chunkSize=1024, positionEncoding='float32'))
+    assert len(chunks) > 1
+
+    random.shuffle(chunks)
+    decoder = geometryencoder.PolyDataStreamDecoder()
+    results = [decoder.addChunk(chunk) for chunk in chunks]
+
+    assert all(result is None for result in results[:-1])
+    assert not decoder.getPendingStreams()
+    checkDecoded(polyData, results[-1], 'float32')
+
+
+def testEmpty():
+
+    polyData = vtk.vtkPolyData()
+    for positionEncoding in positionEncodings:
+        data = geometryencoder.encodePolyDataCompressed(polyData, positionEncoding=positionEncoding)
+        assert geometryencoder.decodePolyData(data).GetNumberOfPoints() == 0
+
+
+testRoundTrip()
+testChunks()
+testEmpty()
@@ -0,0 +1,127 @@
+from ddapp import ioUtils
+from ddapp import vtkNumpy as vnp
+from ddapp import vtkAll as vtk
+import numpy as np
+import os
+import time
+import shutil
+import tempfile
+
+'''
+Round trips points, point data, cell data and cells through the .npd format
+with and without memory mapping, and writes and reads it in the background
+with ddapp.ioUtils.AsyncIOQueue.
+'''
+
+
+def getCellIds(cellArray):
+    return vnp.numpy_support.vtk_to_numpy(cellArray.GetData()).astype(np.int64)
+
+
+def makePolyData():
+
+    points = np.random.rand(300, 3)
+    triangles = np.random.randint(0, len(points), size=(100, 3))
+
+    polyData = vnp.numpyToPolyData(points, triangles=triangles, createVertexCells=True)
+    vnp.addNumpyToVtk(polyData, np.random.rand(len(points)).astype(np.float32), 'intensity')
+    vnp.addNumpyToVtk(polyData, np.arange(len(points), dtype=np.int32), 'index')
+
+    lines = vtk.vtkCellArray()
+    lines.SetCells(2, vnp.getVtkIdTypeArrayFromNumpy(np.array([2, 0, 1, 3, 1, 2, 3])))
+    polyData.SetLines(lines)
+
+    cellValues = vnp.getVtkFromNumpy(np.arange(polyData.GetNumberOfCells(), dtype=np.float64))
+    cellValues.SetName('cell_values')
+    polyData.GetCellData().AddArray(cellValues)
+
+    return polyData
+
+
+def checkPolyData(polyData, result):
+
+    assert result.GetNumberOfPoints() == polyData.GetNumberOfPoints()
+    assert np.array_equal(vnp.getNumpyFromVtk(result, 'Points'), vnp.getNumpyFromVtk(polyData, 'Points'))
+
+    for name in ('intensity', 'index'):
+        array = vnp.getNumpyFromVtk(result, name)
+        assert array.dtype == vnp.getNumpyFromVtk(polyData, name).dtype
+        assert np.array_equal(array, vnp.getNumpyFromVtk(polyData, name))
+
+    cellValues = result.GetCellData().GetArray('cell_values')
+    assert cellValues is not None
+    assert np.array_equal(vnp.numpy_support.vtk_to_numpy(cellValues),
+                          vnp.numpy_support.vtk_to_numpy(polyData.GetCellData().GetArray('cell_values')))
+
+    for cellType in ('Verts', 'Lines', 'Polys', 'Strips'):
+        cells = getattr(polyData, 'Get' + cellType)()
+        resultCells = getattr(result, 'Get' + cellType)()
+        assert resultCells.GetNumberOfCells() == cells.GetNumberOfCells()
+        if cells.GetNumberOfCells():
+            assert np.array_equal(getCellIds(resultCells), getCellIds(cells))
+
+    assert result.GetNumberOfCells() == polyData.GetNumberOfCells()
+
+
+def testRoundTrip(outputDir):
+
+    polyData = makePolyData()
+    filename = os.path.join(outputDir, 'cloud.npd')
+    ioUtils.writePolyData(polyData, filename)
+
+    for mmap in (True, False):
+        result = ioUtils.readNumpyPolyData(filename, mmap=mmap)
+        checkPolyData(polyData, result)
+
+        # mapped arrays are copy-on-write
+        vnp.getNumpyFromVtk(result, 'Points')[:] = 0.0
+        checkPolyData(polyData, ioUtils.readPolyData(filename))
+
+    emptyFilename = os.path.join(outputDir, 'empty.npd')
+    ioUtils.writePolyData(vtk.vtkPolyData(), emptyFilename)
+    assert ioUtils.readPolyData(emptyFilename).GetNumberOfPoints() == 0
+
+
+def processResults(timeout=10.0):
+    queue = ioUtils._getAsyncIOQueue()
+    startTime = time.time()
+    while queue.numberOfPendingRequests:
+        assert time.time() - startTime < timeout
+        queue._processResults()
+        time.sleep(0.01)
+
+
+def testAsync(outputDir):
+
+    polyData = makePolyData()
+    filename = os.path.join(outputDir, 'async.npd')
+    written = []
+    results = []
+    errors = []
+
+    points = vnp.getNumpyFromVtk(polyData, 'Points')
+    originalPoints = points.copy()
+    ioUtils.writePolyDataAsync(polyData, filename, callback=written.append)
+
+    # the polydata is copied before the call returns
+    points[:] = 0.0
+    processResults()
+
+    assert written == [filename]
+    assert not os.path.exists(os.path.join(outputDir, 'async.tmp.npd'))
+
+    ioUtils.readPolyDataAsync(filename, results.append)
+    ioUtils.readPolyDataAsync(os.path.join(outputDir, 'missing.npd'), results.append, errorCallback=errors.append)
+    processResults()
+
+    assert len(results) == 1 and len(errors) == 1
+    points[:] = originalPoints
+    checkPolyData(polyData, results[0])
+
+
+outputDir = tempfile.mkdtemp()
+try:
+    testRoundTrip(outputDir)
+    testAsync(outputDir)
+finally:
+    shutil.rmtree(outputDir)
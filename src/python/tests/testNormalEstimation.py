@@ -0,0 +1,96 @@
+from ddapp import normalestimation
+from ddapp import vtkNumpy as vnp
+import numpy as np
+
+'''
+Checks normals and curvature of a plane, orientation towards the view point,
+the threaded chunked computation and the result cache of
+ddapp.normalestimation.
+'''
+
+
+def makePlanePoints(numberOfPoints):
+    points = np.zeros((numberOfPoints, 3))
+    points[:,:2] = np.random.rand(numberOfPoints, 2)
+    return points
+
+
+def testPlane():
+
+    points = makePlanePoints(2000)
+
+    normals, curvature, eigenvalues = normalestimation.computeNormals(points, searchRadius=0.1, viewPoint=(0.0, 0.0, 5.0))
+    assert np.allclose(normals, [0.0, 0.0, 1.0])
+    assert np.allclose(curvature, 0.0)
+    assert np.allclose(eigenvalues[:,0], 0.0)
+    assert (eigenvalues[:,1] > 0).all()
+
+    normals, _, _ = normalestimation.computeNormals(points, searchRadius=0.1, viewPoint=(0.0, 0.0, -5.0))
+    assert np.allclose(normals, [0.0, 0.0, -1.0])
+
+    # chunks processed by the thread pool give the same result
+    chunked = normalestimation.computeNormals(points, searchRadius=0.1, viewPoint=(0.0, 0.0, -5.0), chunkSize=100)
+    assert np.allclose(chunked[0], normals)
+
+    # points without enough neighbors get nan
+    isolated = np.vstack([points, [[5.0, 5.0, 5.0]]])
+    normals, curvature, _ = normalestimation.computeNormals(isolated, searchRadius=0.1)
+    assert np.isnan(normals[-1]).all() and np.isnan(curvature[-1])
+    assert not np.isnan(normals[:-1]).any()
+
+
+def testCurvature():
+
+    # points on a sphere of radius 0.1 are curved at a 0.05 search radius
+    directions = np.random.randn(1000, 3)
+    points = 0.1 * directions / np.sqrt((directions**2).sum(axis=1))[:,np.newaxis]
+    _, curvature, _ = normalestimation.computeNormals(points, searchRadius=0.05)
+    assert (curvature > 1e-3).all()
+
+
+def testEstimateNormals():
+
+    normalestimation.clearCache()
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(makePlanePoints(1000))
+
+    calls = []
+    computeNormals = normalestimation.computeNormals
+
+    def countingComputeNormals(*args, **kwargs):
+        calls.append(True)
+        return computeNormals(*args, **kwargs)
+
+    normalestimation.computeNormals = countingComputeNormals
+    try:
+        first = normalestimation.estimateNormals(polyData, searchRadius=0.1)
+        second = normalestimation.estimateNormals(polyData, searchRadius=0.1)
+        assert len(calls) == 1
+
+        normalestimation.estimateNormals(polyData, searchRadius=0.2)
+        assert len(calls) == 2
+
+        polyData.Modified()
+        normalestimation.estimateNormals(polyData, searchRadius=0.1)
+        assert len(calls) == 3
+    finally:
+        normalestimation.computeNormals = computeNormals
+
+    assert first is not second
+    assert np.array_equal(vnp.getNumpyFromVtk(first, 'normals'), vnp.getNumpyFromVtk(second, 'normals'))
+    assert np.allclose(np.abs(vnp.getNumpyFromVtk(first, 'normals')[:,2]), 1.0)
+    assert np.allclose(vnp.getNumpyFromVtk(first, 'curvature'), 0.0, atol=1e-6)
+    assert first.GetPointData().GetNormals() is not None
+
+
+def testEmpty():
+
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(np.zeros((0, 3)))
+    assert normalestimation.estimateNormals(polyData).GetNumberOfPoints() == 0
+
+
+if normalestimation.cKDTree is not None:
+    testPlane()
+    testCurvature()
+    testEstimateNormals()
+
+testEmpty()
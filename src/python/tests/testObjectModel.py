@@ -30,6 +30,19 @@ def main():
     assert p.children()[0] == c
     assert c.children() == []
 
+    c.rename('renamed child item')
+    assert om.findObjectByName('renamed child item') == c
+    assert om.findObjectByName('test child item') is None
+    assert c.parent() == p
+
+    bulkItems = [om.ObjectModelItem('bulk item %d' % i) for i in xrange(10)]
+    om.addObjectsToObjectModel(bulkItems, p)
+    assert p.children() == [c] + bulkItems
+    assert om.findObjectByName('bulk item 5', parent=p) == bulkItems[5]
+    om.removeObjectsFromObjectModel(bulkItems)
+    assert p.children() == [c]
+    assert not om.containsObject(bulkItems[0])
+
     objectTree.show()
     propertiesPanel.show()
 
@@ -0,0 +1,56 @@
+import pickle
+from ddapp.propertyset import PropertySet, PropertyAttributes
+
+
+def main():
+
+    changed = []
+    properties = PropertySet()
+    properties.connectPropertyChanged(lambda propertySet, propertyName: changed.append(propertyName))
+    properties.connectPropertiesChanged(lambda propertySet, propertyNames: changed.append(tuple(propertyNames)))
+
+    properties.addProperty('Point Size', 2)
+    properties.addProperty('Color', [1.0, 0.0, 0.0])
+    properties.addProperty('Mode', 0, attributes=PropertyAttributes(enumNames=['a', 'b']))
+
+    # attribute access by alternate name
+    assert properties.point_size == 2
+    assert properties.color == [1.0, 0.0, 0.0]
+
+    # setting an unchanged value does not notify
+    properties.setProperty('Point Size', 2)
+    assert changed == []
+
+    properties.setProperty('Mode', 'b')
+    assert properties.mode == 1
+    assert changed == ['Mode']
+
+    # a list modified in place is always treated as a change
+    color = properties.getProperty('Color')
+    color[0] = 0.5
+    properties.setProperty('Color', color)
+    assert changed[-1] == 'Color'
+
+    del changed[:]
+    properties.setProperties({'Color' : [0.0, 0.0, 1.0]}, point_size=4, mode=1)
+    assert changed == ['Color', 'Point Size', ('Color', 'Point Size')]
+    assert properties.point_size == 4
+
+    # property sets with the same property names share a schema class
+    other = PropertySet()
+    other.addProperty('Point Size', 1)
+    other.addProperty('Color', [0.0, 0.0, 0.0])
+    other.addProperty('Mode', 0, attributes=PropertyAttributes(enumNames=['a', 'b']))
+    assert type(other) is type(properties)
+
+    restored = pickle.loads(pickle.dumps(properties, pickle.HIGHEST_PROTOCOL))
+    assert restored.propertyNames() == properties.propertyNames()
+    assert restored.color == [0.0, 0.0, 1.0]
+
+    properties.removeProperty('Point Size')
+    assert not hasattr(properties, 'point_size')
+    assert hasattr(other, 'point_size')
+
+
+if __name__ == '__main__':
+    main()
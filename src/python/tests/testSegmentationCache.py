@@ -0,0 +1,155 @@
+from ddapp import segmentationcache
+from ddapp import vtkNumpy as vnp
+from ddapp.shallowCopy import shallowCopy
+import numpy as np
+
+'''
+Checks the fingerprints, the lineage of stage outputs, the resampling of
+randomized stages and the memory budget of ddapp.segmentationcache.
+'''
+
+
+def makePolyData(numberOfPoints):
+    return vnp.getVtkPolyDataFromNumpyPoints(np.random.rand(numberOfPoints, 3))
+
+
+class Stages(object):
+
+    def __init__(self, cache):
+        self.calls = []
+
+        def crop(polyData, maxDistance=0.5):
+            self.calls.append('crop')
+            points = vnp.getNumpyFromVtk(polyData, 'Points')
+            return vnp.getVtkPolyDataFromNumpyPoints(points[np.sqrt((points**2).sum(axis=1)) < maxDistance].copy())
+
+        def fit(polyData):
+            self.calls.append('fit')
+            points = vnp.getNumpyFromVtk(polyData, 'Points')
+            polyData = shallowCopy(polyData)
+            vnp.addNumpyToVtk(polyData, points[:,2].copy(), 'dist_to_plane')
+            return polyData, points.mean(axis=0) + np.random.rand(3)
+
+        self.crop = segmentationcache.cachedStage(crop, cache=cache)
+        self.fit = segmentationcache.cachedStage(fit, randomized=True, cache=cache)
+
+    def run(self, polyData):
+        return self.fit(self.crop(polyData))
+
+
+def testFingerprints():
+
+    cache = segmentationcache.SegmentationCache()
+    fingerprint = cache.getFingerprint
+
+    assert fingerprint([1, 2.0, 'a', None]) == fingerprint([1, 2.0, 'a', None])
+    assert fingerprint([1, 2]) != fingerprint((1, 2))
+    assert fingerprint(np.arange(3.0)) == fingerprint(np.arange(3.0))
+    assert fingerprint(np.arange(3.0)) != fingerprint(np.arange(3))
+    assert fingerprint({'a' : np.ones(2)}) == fingerprint({'a' : np.ones(2)})
+    assert fingerprint(np.float64(2.0)) == 2.0
+
+    polyData = makePolyData(10)
+    key = fingerprint(polyData)
+    assert fingerprint(polyData) == key
+    polyData.Modified()
+    assert fingerprint(polyData) != key
+
+    cache.fingerprintMode = 'content'
+    assert fingerprint(polyData) == fingerprint(shallowCopy(polyData))
+
+    try:
+        fingerprint(object())
+    except segmentationcache.UncacheableArgument:
+        pass
+    else:
+        assert False
+
+
+def testLineage():
+
+    cache = segmentationcache.SegmentationCache()
+    stages = Stages(cache)
+    polyData = makePolyData(1000)
+
+    _, origin = stages.run(polyData)
+    assert stages.calls == ['crop', 'fit']
+
+    # a retry hits both stages, the fit input is a new copy with the same lineage
+    for i in xrange(3):
+        _, retryOrigin = stages.run(polyData)
+        assert np.array_equal(retryOrigin, origin)
+    assert stages.calls == ['crop', 'fit']
+
+    # arguments are normalized, defaults and keywords give the same key
+    stages.crop(polyData, 0.5)
+    stages.crop(polyData=polyData, maxDistance=0.5)
+    assert stages.calls == ['crop', 'fit']
+
+    # returned arrays are copies
+    origin[:] = 0.0
+    assert not np.array_equal(stages.run(polyData)[1], origin)
+
+    fitPolyData, _ = stages.run(polyData)
+    points = vnp.getNumpyFromVtk(fitPolyData, 'Points').copy()
+    distances = vnp.getNumpyFromVtk(fitPolyData, 'dist_to_plane').copy()
+    vnp.getNumpyFromVtk(fitPolyData, 'Points')[:] = 0.0
+    vnp.getNumpyFromVtk(fitPolyData, 'dist_to_plane')[:] = 0.0
+    fitPolyData, _ = stages.run(polyData)
+    assert np.array_equal(vnp.getNumpyFromVtk(fitPolyData, 'Points'), points)
+    assert np.array_equal(vnp.getNumpyFromVtk(fitPolyData, 'dist_to_plane'), distances)
+
+    # resampling recomputes randomized stages only
+    cache.resample()
+    _, resampledOrigin = stages.run(polyData)
+    assert stages.calls == ['crop', 'fit', 'fit']
+    assert not np.array_equal(resampledOrigin, retryOrigin)
+
+    # a modified input misses every stage
+    polyData.Modified()
+    stages.run(polyData)
+    assert stages.calls == ['crop', 'fit', 'fit', 'crop', 'fit']
+
+    stats = cache.statistics
+    assert stats['crop'].hits == 9 and stats['crop'].misses == 2
+    assert stats['fit'].hits == 6 and stats['fit'].misses == 3
+
+    # a disabled cache runs the stage directly
+    cache.enabled = False
+    stages.crop(polyData)
+    assert stats['crop'].uncached == 1
+
+
+def testMemoryBudget():
+
+    cache = segmentationcache.SegmentationCache()
+    stages = Stages(cache)
+
+    inputs = [makePolyData(1000) for i in xrange(4)]
+    for polyData in inputs:
+        stages.crop(polyData, maxDistance=10.0)
+
+    entrySize = cache.memorySize / len(cache.entries)
+    assert len(cache.entries) == 4
+
+    # least recently used entries are evicted first
+    stages.crop(inputs[0], maxDistance=10.0)
+    cache.memoryBudget = entrySize*2 + entrySize/2
+    stages.crop(makePolyData(1000), maxDistance=10.0)
+    assert len(cache.entries) <= 2
+    assert cache.memorySize <= cache.memoryBudget
+
+    stages.calls = []
+    stages.crop(inputs[0], maxDistance=10.0)
+    assert stages.calls == []
+
+    # outputs larger than the budget are not stored
+    cache.clear()
+    cache.memoryBudget = 1
+    stages.crop(inputs[0], maxDistance=10.0)
+    assert not cache.entries and cache.memorySize == 0
+
+
+testFingerprints()
+testLineage()
+testMemoryBudget()
@@ -0,0 +1,92 @@
+from ddapp import segmentationroutines
+from ddapp.filterUtils import thresholdPoints
+from ddapp import vtkNumpy as vnp
+import numpy as np
+
+'''
+Compares the single pass cluster split of ddapp.segmentationroutines with
+thresholding each label, and checks that IncrementalClusterer keeps the
+labels of clusters that new points do not touch.
+'''
+
+
+def makeBlob(center, numberOfPoints=300, size=0.1):
+    return np.asarray(center) + (np.random.rand(numberOfPoints, 3) - 0.5) * size
+
+
+def testSplitClusters():
+
+    numberOfPoints = 2000
+    points = np.random.rand(numberOfPoints, 3).astype(np.float32) * 10.0
+    labels = np.random.randint(0, 6, size=numberOfPoints).astype(np.int32)
+    labels[labels == 4] = 0
+
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+    vnp.addNumpyToVtk(polyData, labels, 'cluster_labels')
+    vnp.addNumpyToVtk(polyData, np.random.rand(numberOfPoints).astype(np.float32), 'intensity')
+
+    clusters = segmentationroutines.splitClusters(polyData)
+    expectedLabels = [1, 2, 3, 5]
+    assert len(clusters) == len(expectedLabels)
+
+    for label, cluster in zip(expectedLabels, clusters):
+        expected = thresholdPoints(polyData, 'cluster_labels', [label, label])
+        assert cluster.GetNumberOfPoints() == expected.GetNumberOfPoints()
+        assert cluster.GetNumberOfCells() == expected.GetNumberOfCells()
+        for arrayName in ('Points', 'cluster_labels', 'intensity'):
+            assert np.array_equal(vnp.getNumpyFromVtk(cluster, arrayName), vnp.getNumpyFromVtk(expected, arrayName))
+
+    # selected labels only, label 0 included on request
+    split = segmentationroutines.splitPolyDataByLabel(polyData, 'cluster_labels', labels=[0, 3])
+    assert split.keys() == [0, 3]
+    assert split[0].GetNumberOfPoints() == (labels == 0).sum()
+
+
+def getLabels(clusterer, points):
+    labelMap = dict(zip(map(tuple, clusterer.points), clusterer.labels))
+    return np.array([labelMap[tuple(p)] for p in points])
+
+
+def testIncrementalClusterer():
+
+    clusterer = segmentationroutines.IncrementalClusterer(clusterTolerance=0.05, minClusterSize=100)
+
+    blobA = makeBlob([0.0, 0.0, 0.0])
+    blobB = makeBlob([2.0, 0.0, 0.0])
+    changed = clusterer.addPoints(np.vstack([blobA, blobB]))
+    assert len(changed) == 2
+
+    labelsA = getLabels(clusterer, blobA)
+    labelsB = getLabels(clusterer, blobB)
+    assert len(np.unique(labelsA)) == 1 and labelsA[0] != 0
+    assert len(np.unique(labelsB)) == 1 and labelsB[0] not in (0, labelsA[0])
+
+    # a distant sweep creates a new cluster and leaves both labels alone
+    blobC = makeBlob([4.0, 0.0, 0.0])
+    changed = clusterer.addPoints(blobC)
+    labelC = getLabels(clusterer, blobC)[0]
+    assert list(changed) == [labelC]
+    assert labelC not in (0, labelsA[0], labelsB[0])
+    assert np.array_equal(getLabels(clusterer, blobA), labelsA)
+    assert np.array_equal(getLabels(clusterer, blobB), labelsB)
+
+    # points that grow B relabel B only
+    growB = makeBlob([2.08, 0.0, 0.0], numberOfPoints=100)
+    changed = clusterer.addPoints(growB)
+    newLabelsB = getLabels(clusterer, np.vstack([blobB, growB]))
+    assert len(np.unique(newLabelsB)) == 1
+    assert labelsB[0] in changed and newLabelsB[0] in changed
+    assert np.array_equal(getLabels(clusterer, blobA), labelsA)
+    assert np.array_equal(getLabels(clusterer, blobC), [labelC] * len(blobC))
+
+    clusters = clusterer.getClusters()
+    assert len(clusters) == 3
+    assert clusters[newLabelsB[0]].GetNumberOfPoints() == len(blobB) + len(growB)
+
+    # the same clusters as clustering everything at once
+    labels = segmentationroutines.computeClusterLabels(clusterer.points, 0.05, 100)
+    assert len(np.unique(labels[labels != 0])) == len(clusters)
+
+
+testSplitClusters()
+testIncrementalClusterer()
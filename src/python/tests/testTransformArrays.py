@@ -0,0 +1,91 @@
+from ddapp import transformArrays as ta
+from ddapp import transformUtils
+from ddapp.thirdparty import transformations
+import numpy as np
+
+'''
+Compares the batched routines in ddapp.transformArrays with the single
+transform routines in ddapp.thirdparty.transformations and transformUtils.
+'''
+
+
+def randomTransforms(n):
+    mats = np.array([transformations.random_rotation_matrix() for i in xrange(n)])
+    mats[:,:3,3] = np.random.rand(n, 3)
+    return mats
+
+
+def isQuatEqual(quatA, quatB):
+    return np.allclose(quatA, quatB) or np.allclose(quatA, -np.asarray(quatB))
+
+
+def testConversions():
+
+    n = 100
+    mats = randomTransforms(n)
+    quats = ta.matrixToQuaternion(mats)
+
+    for mat, quat in zip(mats, quats):
+        assert isQuatEqual(quat, transformations.quaternion_from_matrix(mat))
+        assert np.allclose(ta.quaternionToMatrix(quat), mat[:3,:3])
+
+    rpy = ta.matrixToRollPitchYaw(mats)
+    for mat, angles in zip(mats, rpy):
+        assert np.allclose(angles, transformations.euler_from_matrix(mat))
+        assert np.allclose(ta.rollPitchYawToMatrix(angles), mat[:3,:3])
+
+    assert np.allclose(ta.poseToTransform(ta.transformToPose(mats)), mats)
+
+    # rotations by 180 degrees
+    flips = np.array([np.diag([1.0, -1.0, -1.0]), np.diag([-1.0, 1.0, -1.0]), np.diag([-1.0, -1.0, 1.0])])
+    assert np.allclose(ta.quaternionToMatrix(ta.matrixToQuaternion(flips)), flips)
+
+
+def testCompose():
+
+    a = randomTransforms(50)
+    b = randomTransforms(50)
+    points = np.random.rand(50, 3)
+
+    ab = ta.compose(a, b)
+    for i in xrange(len(a)):
+        assert np.allclose(ab[i], np.dot(a[i], b[i]))
+
+    assert np.allclose(ta.compose(ta.invert(a), a), ta.identity(len(a)))
+    assert np.allclose(ta.compose(a[0], b)[3], np.dot(a[0], b[3]))
+    assert np.allclose(ta.composeAll(a[:3]), np.dot(np.dot(a[0], a[1]), a[2]))
+
+    transformed = ta.transformPoints(a, points)
+    for i in xrange(len(a)):
+        assert np.allclose(transformed[i], np.dot(a[i], np.append(points[i], 1.0))[:3])
+
+    assert np.allclose(ta.transformPoints(a[0], points)[7], np.dot(a[0], np.append(points[7], 1.0))[:3])
+
+
+def testSlerp():
+
+    q1 = transformations.random_quaternion()
+    q2 = transformations.random_quaternion()
+    weights = np.linspace(0, 1, 10)
+
+    result = ta.slerp(np.tile(q1, (10, 1)), np.tile(q2, (10, 1)), weights)
+    for weight, quat in zip(weights, result):
+        assert isQuatEqual(quat, transformations.quaternion_slerp(q1, q2, weight, shortestpath=True))
+
+
+def testVtkAdapters():
+
+    mat = randomTransforms(1)[0]
+    transform = ta.transformFromMatrix(mat)
+    assert np.allclose(ta.matrixFromTransform(transform), mat)
+    assert np.allclose(transformUtils.getNumpyFromTransform(transform), mat)
+
+    pos, quat = transformUtils.poseFromTransform(transform)
+    assert np.allclose(ta.transformToPose(mat)[:3], pos)
+    assert isQuatEqual(ta.transformToPose(mat)[3:], quat)
+
+
+testConversions()
+testCompose()
+testSlerp()
+testVtkAdapters()
@@ -0,0 +1,95 @@
+from ddapp import voxelgrid
+from ddapp import vtkNumpy as vnp
+import numpy as np
+
+'''
+Compares ddapp.voxelgrid with a per point reference implementation, and
+checks that levels computed from a finer level match levels computed from
+the raw points.
+'''
+
+
+def referenceVoxelGrid(points, values, leafSize):
+    voxels = {}
+    for i, (point, value) in enumerate(zip(points, values)):
+        key = tuple(np.floor(point / leafSize).astype(int))
+        voxels.setdefault(key, []).append(i)
+
+    result = {}
+    for key, indices in voxels.iteritems():
+        result[key] = (points[indices].mean(axis=0), values[indices].max(), values[indices[0]], len(indices))
+    return result
+
+
+def testLevel():
+
+    points = np.random.randn(2000, 3)
+    values = np.random.rand(len(points))
+    leafSize = 0.25
+
+    level = voxelgrid.VoxelLevel.fromPoints(points, {'value' : values}, leafSize)
+    reference = referenceVoxelGrid(points, values, leafSize)
+
+    assert level.getNumberOfVoxels() == len(reference)
+
+    centroids = level.getCentroids()
+    firstValues = values[level.firstIndices]
+    for i, key in enumerate(level.keys):
+        centroid, maxValue, firstValue, count = reference[tuple(key)]
+        assert np.allclose(centroids[i], centroid)
+        assert np.isclose(level.maxima['value'][i], maxValue)
+        assert firstValues[i] == firstValue
+        assert level.counts[i] == count
+
+
+def testPyramid():
+
+    points = np.random.randn(5000, 3)
+    values = np.random.rand(len(points))
+    pyramid = voxelgrid.VoxelPyramid(points, {'value' : values})
+
+    baseLeafSize = 0.05
+    levels = pyramid.buildLevels(baseLeafSize, 4)
+
+    for level in levels[1:]:
+        direct = voxelgrid.VoxelLevel.fromPoints(points, {'value' : values}, level.leafSize)
+        order = np.lexsort(level.keys.T)
+        directOrder = np.lexsort(direct.keys.T)
+
+        assert np.array_equal(level.keys[order], direct.keys[directOrder])
+        assert np.array_equal(level.counts[order], direct.counts[directOrder])
+        assert np.array_equal(level.firstIndices[order], direct.firstIndices[directOrder])
+        assert np.allclose(level.getCentroids()[order], direct.getCentroids()[directOrder])
+        assert np.allclose(level.maxima['value'][order], direct.maxima['value'][directOrder])
+
+    assert pyramid.getLevel(baseLeafSize*8) is levels[3]
+
+
+def testPolyData():
+
+    points = np.random.randn(1000, 3).astype(np.float32)
+    polyData = vnp.getVtkPolyDataFromNumpyPoints(points)
+    vnp.addNumpyToVtk(polyData, np.arange(len(points), dtype=np.int32), 'index')
+    vnp.addNumpyToVtk(polyData, np.random.rand(len(points)).astype(np.float32), 'intensity')
+
+    output = voxelgrid.applyVoxelGrid(polyData, leafSize=0.5, countArrayName='count')
+    assert voxelgrid.getVoxelPyramid(polyData) is voxelgrid.getVoxelPyramid(polyData)
+
+    outputPoints = vnp.getNumpyFromVtk(output, 'Points')
+    index = vnp.getNumpyFromVtk(output, 'index')
+    counts = vnp.getNumpyFromVtk(output, 'count')
+
+    assert outputPoints.dtype == np.float32
+    assert output.GetNumberOfVerts() == output.GetNumberOfPoints()
+    assert counts.sum() == len(points)
+    assert vnp.getNumpyFromVtk(output, 'intensity').dtype == np.float32
+
+    # first aggregation keeps the index of the first point in each voxel
+    keys = voxelgrid.getVoxelKeys(points, 0.5)
+    outputKeys = voxelgrid.getVoxelKeys(outputPoints, 0.5)
+    assert np.array_equal(keys[index], outputKeys)
+
+
+testLevel()
+testPyramid()
+testPolyData()